@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""A micro Stock Market Simulator.
+
+This module implements the admission control of the order entry.
+
+The orders are admitted by token buckets: each trader has a bucket that
+refills at the trader rate (orders per second) up to the trader burst, and
+all the orders also take a token from a global bucket. An order that finds
+an empty bucket is rejected before any database work, along with the time
+after which a token will be available.
+
+.. _uStockMarket Project:
+    https://github.com/luizsol/uStockMarket
+
+"""
+__author__ = 'Luiz Sol'
+__license__ = 'MIT'
+__version__ = '0.0.1'
+__date__ = '2017-10-05'
+__maintainer__ = 'Luiz Sol'
+__email__ = 'luizedusol@gmail.com'
+__status__ = 'Development'
+
+import threading
+import time
+
+
+class TokenBucket(object):
+    """A token bucket (not thread safe, see RateLimiter).
+
+    Attributes:
+        rate (float): The number of tokens added per second.
+        burst (float): The maximum number of tokens.
+        tokens (float): The number of tokens on the last update.
+
+    """
+
+    def __init__(self, rate, burst=None, now=None):
+        """The class constructor.
+
+        Args:
+            rate (float): The number of tokens added per second.
+
+        Keyword Args:
+            burst (float, default=None): The maximum number of tokens. If None
+                the rate (or 1, if the rate is smaller) is used.
+            now (float, default=None): The current monotonic time.
+
+        """
+        self.rate = rate
+        self.burst = max(rate, 1) if burst is None else burst
+        self.tokens = self.burst
+        self._updated = time.monotonic() if now is None else now
+
+    def refill(self, now):
+        """(float) Adds the tokens accrued since the last update."""
+        self.tokens = min(self.burst,
+                          self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        return self.tokens
+
+    def take(self, now):
+        """Takes a token.
+
+        Args:
+            now (float): The current monotonic time.
+
+        Returns:
+            float: 0 if the token was taken, the time (in seconds) until a
+                token is available otherwise.
+
+        """
+        if self.refill(now) >= 1:
+            self.tokens -= 1
+            return 0.0
+
+        return (1 - self.tokens) / self.rate
+
+    def give(self):
+        """Returns a taken token."""
+        self.tokens = min(self.burst, self.tokens + 1)
+
+
+class RateLimiter(object):
+    """Admits the orders by per trader and global token buckets.
+
+    Attributes:
+        trader_rate (float): The orders per second of each trader (None for
+            no limit).
+        trader_burst (float): The burst of orders of each trader (None for
+            no limit).
+        global_rate (float): The orders per second of all the traders (None
+            for no limit).
+        global_burst (float): The burst of orders of all the traders (None
+            for no limit).
+        rejected (dict): The number of rejected orders, by scope ('trader' or
+            'global').
+
+    """
+
+    def __init__(self, trader_rate=None, trader_burst=None, global_rate=None,
+                 global_burst=None, max_traders=100000):
+        """The class constructor.
+
+        Keyword Args:
+            trader_rate (float, default=None): The orders per second of each
+                trader. If None the traders aren't limited.
+            trader_burst (float, default=None): The burst of orders of each
+                trader (see TokenBucket).
+            global_rate (float, default=None): The orders per second of all
+                the traders. If None the exchange isn't limited.
+            global_burst (float, default=None): The burst of orders of all the
+                traders (see TokenBucket).
+            max_traders (int, default=100000): The number of trader buckets
+                above which the idle (full) ones are discarded.
+
+        """
+        self.max_traders = max_traders
+        self._lock = threading.Lock()
+        self.configure(trader_rate, trader_burst, global_rate, global_burst)
+
+    def configure(self, trader_rate=None, trader_burst=None, global_rate=None,
+                  global_burst=None):
+        """Replaces the limits, refilling all the buckets (see __init__()).
+
+        Raises:
+            ValueError: If a rate isn't positive or a burst is smaller than 1.
+
+        """
+        if any(rate is not None and rate <= 0 for rate in
+               (trader_rate, global_rate)) or \
+                any(burst is not None and burst < 1 for burst in
+                    (trader_burst, global_burst)):
+            raise ValueError('The rates must be positive and the bursts must '
+                             'be at least 1.')
+
+        if trader_rate is not None and trader_burst is None:
+            trader_burst = max(trader_rate, 1)
+        if global_rate is not None and global_burst is None:
+            global_burst = max(global_rate, 1)
+
+        with self._lock:
+            self.trader_rate = trader_rate
+            self.trader_burst = trader_burst
+            self.global_rate = global_rate
+            self.global_burst = global_burst
+            self.rejected = {'trader': 0, 'global': 0}
+            self._traders = {}
+            self._global = None if global_rate is None else \
+                TokenBucket(global_rate, global_burst)
+
+    def admit(self, trader):
+        """Admits an order of a trader.
+
+        Args:
+            trader (str): The name of the trader.
+
+        Returns:
+            None if the order was admitted, a tuple with the scope of the limit
+            ('trader' or 'global') and the time (in seconds) until the order
+            would be admitted otherwise.
+
+        """
+        with self._lock:
+            now = time.monotonic()
+
+            bucket = None
+            if self.trader_rate is not None:
+                bucket = self._traders.get(trader)
+                if bucket is None:
+                    if len(self._traders) >= self.max_traders:
+                        self._discard_idle(now)
+                    bucket = self._traders[trader] = TokenBucket(
+                        self.trader_rate, self.trader_burst, now)
+
+                wait = bucket.take(now)
+                if wait:
+                    self.rejected['trader'] += 1
+                    return 'trader', wait
+
+            if self._global is not None:
+                wait = self._global.take(now)
+                if wait:
+                    if bucket is not None:
+                        bucket.give()
+                    self.rejected['global'] += 1
+                    return 'global', wait
+
+        return None
+
+    def status(self, trader=None):
+        """Retrieves the limits and the available tokens.
+
+        Keyword Args:
+            trader (str, default=None): If set, the available tokens of the
+                trader are also retrieved.
+
+        Returns:
+            dict: The limits, the available tokens and the rejected orders.
+
+        """
+        with self._lock:
+            now = time.monotonic()
+            result = {
+                'trader_rate': str(self.trader_rate),
+                'trader_burst': str(self.trader_burst),
+                'global_rate': str(self.global_rate),
+                'global_burst': str(self.global_burst),
+                'global_tokens': str(None if self._global is None else
+                                     round(self._global.refill(now), 3)),
+                'rejected': {scope: str(count) for scope, count in
+                             self.rejected.items()}}
+
+            if trader is not None:
+                bucket = self._traders.get(trader)
+                tokens = self.trader_burst
+                if bucket is not None:
+                    tokens = round(bucket.refill(now), 3)
+                result['trader'] = trader
+                result['trader_tokens'] = str(tokens)
+
+        return result
+
+    def _discard_idle(self, now):
+        """Discards the buckets of the traders that are idle (full)."""
+        self._traders = {trader: bucket for trader, bucket in
+                         self._traders.items() if
+                         bucket.refill(now) < bucket.burst}
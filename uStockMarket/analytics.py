@@ -0,0 +1,306 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""A micro Stock Market Simulator.
+
+This module implements the server side market analytics of the Stock
+Exchange.
+
+The ticks of every security are kept on columnar NumPy arrays (one array per
+attribute) so all the statistics can be computed with vectorized operations
+instead of Python loops over `ValueDatum` objects.
+
+Todo:
+    * Add intraday (OHLC) bars
+
+.. _uStockMarket Project:
+    https://github.com/luizsol/uStockMarket
+
+"""
+__author__ = 'Luiz Sol'
+__license__ = 'MIT'
+__version__ = '0.0.1'
+__date__ = '2017-10-05'
+__maintainer__ = 'Luiz Sol'
+__email__ = 'luizedusol@gmail.com'
+__status__ = 'Development'
+
+from collections import OrderedDict
+import threading
+
+import numpy as np
+
+
+def _fmt(value):
+    """(str) Formats a float statistic, returning None for undefined ones."""
+    if value is None or not np.isfinite(value):
+        return None
+    return str(round(float(value), 6))
+
+
+class TickSeries(object):
+    """Columnar, append only, time series of a security's ticks.
+
+    Attributes:
+        time (numpy.ndarray): The POSIX timestamp of each tick.
+        price (numpy.ndarray): The price of each tick.
+        size (numpy.ndarray): The traded amount of each tick.
+        bid (numpy.ndarray): The Bid price quoted when the tick was generated
+            (NaN if unknown or if it was an `at market price` order).
+        ask (numpy.ndarray): The Ask price quoted when the tick was generated
+            (NaN if unknown or if it was an `at market price` order).
+
+    """
+    COLUMNS = (('time', np.float64), ('price', np.float64),
+               ('size', np.int64), ('bid', np.float64), ('ask', np.float64))
+
+    def __init__(self, capacity=1024):
+        """The class constructor.
+
+        Keyword Args:
+            capacity (int, default=1024): The initial capacity of the arrays.
+
+        """
+        self._length = 0
+        self._columns = {name: np.empty(max(capacity, 1), dtype=dtype)
+                         for name, dtype in self.COLUMNS}
+
+    def __len__(self):
+        return self._length
+
+    def __getattr__(self, name):
+        columns = self.__dict__.get('_columns')
+        if columns is not None and name in columns:
+            return columns[name][:self._length]
+        raise AttributeError(name)
+
+    def extend(self, time, price, size, bid=None, ask=None):
+        """Appends multiple ticks at once.
+
+        Args:
+            time (array_like): The POSIX timestamps of the ticks.
+            price (array_like): The prices of the ticks.
+            size (array_like): The traded amounts of the ticks.
+
+        Keyword Args:
+            bid (array_like, default=None): The quoted Bid prices.
+            ask (array_like, default=None): The quoted Ask prices.
+
+        """
+        time = np.asarray(time, dtype=np.float64)
+        count = len(time)
+        new_length = self._length + count
+
+        capacity = len(self._columns['time'])
+        if new_length > capacity:
+            capacity = max(new_length, 2 * capacity)
+            for name, column in self._columns.items():
+                grown = np.empty(capacity, dtype=column.dtype)
+                grown[:self._length] = column[:self._length]
+                self._columns[name] = grown
+
+        values = {'time': time, 'price': price, 'size': size,
+                  'bid': np.nan if bid is None else bid,
+                  'ask': np.nan if ask is None else ask}
+
+        for name, column in self._columns.items():
+            column[self._length:new_length] = values[name]
+
+        self._length = new_length
+
+    def append(self, time, price, size, bid=None, ask=None):
+        """Appends a single tick (see extend())."""
+        self.extend([time], [price], [size],
+                    bid=np.nan if bid is None else bid,
+                    ask=np.nan if ask is None else ask)
+
+    def window(self, seconds=None):
+        """Retrieves the slice of the series inside a time window.
+
+        The window is anchored on the most recent tick, so the result only
+        changes when new ticks arrive.
+
+        Keyword Args:
+            seconds (float, default=None): The length of the window. If None
+                the whole series is used.
+
+        Returns:
+            slice: The slice of the columns inside the window.
+
+        """
+        if seconds is None or self._length == 0:
+            return slice(0, self._length)
+
+        times = self.time
+        start = np.searchsorted(times, times[-1] - seconds, side='left')
+        return slice(int(start), self._length)
+
+
+def compute_analytics(series, window=None):
+    """Computes the market statistics of a tick series.
+
+    Args:
+        series (TickSeries): The ticks of the security.
+
+    Keyword Args:
+        window (float, default=None): The length (in seconds) of the time
+            window, anchored on the most recent tick. If None the whole series
+            is used.
+
+    Returns:
+        dict: The statistics of the window (VWAP, returns, realized
+            volatility, traded volume and spread statistics).
+
+    """
+    interval = series.window(window)
+    price = series.price[interval]
+    size = series.size[interval]
+    trades = len(price)
+
+    result = {'window': None if window is None else str(window),
+              'trades': str(trades),
+              'volume': str(int(size.sum()))}
+
+    if trades == 0:
+        return result
+
+    volume = size.sum()
+    result['vwap'] = _fmt(np.dot(price, size) / volume if volume else None)
+    result['first'] = _fmt(price[0])
+    result['last'] = _fmt(price[-1])
+    result['high'] = _fmt(price.max())
+    result['low'] = _fmt(price.min())
+
+    # Log returns are only defined between strictly positive prices
+    positive = price[price > 0]
+    if len(positive) > 1:
+        returns = np.diff(np.log(positive))
+        result['return'] = _fmt(positive[-1] / positive[0] - 1)
+        result['mean_log_return'] = _fmt(returns.mean())
+        result['realized_volatility'] = _fmt(np.sqrt(np.dot(returns,
+                                                            returns)))
+    else:
+        result['return'] = None
+        result['mean_log_return'] = None
+        result['realized_volatility'] = None
+
+    spread = series.ask[interval] - series.bid[interval]
+    spread = spread[np.isfinite(spread)]
+    if len(spread) > 0:
+        result['spread'] = {'mean': _fmt(spread.mean()),
+                            'min': _fmt(spread.min()),
+                            'max': _fmt(spread.max()),
+                            'last': _fmt(spread[-1])}
+    else:
+        result['spread'] = None
+
+    return result
+
+
+class MarketAnalytics(object):
+    """Keeps the tick series of all securities and caches their statistics.
+
+    The statistics are cached per (ticker, window) and the cache of a
+    security is invalidated every time a new fill of that security is
+    recorded.
+
+    The series are loaded from the database without holding the lock taken by
+    the fills, and the recorded ticks are merged by their sequence number
+    (their position on the security's price history), so a tick that was
+    already loaded isn't appended twice.
+
+    Attributes:
+        max_windows (int): The maximum number of cached windows of each
+            security. The least recently used ones are evicted first.
+
+    """
+
+    def __init__(self, loader, max_windows=16):
+        """The class constructor.
+
+        Args:
+            loader (callable): A function that recieves a ticker and returns
+                its TickSeries loaded from the database (or None if the
+                security doesn't exist).
+
+        Keyword Args:
+            max_windows (int, default=16): The maximum number of cached
+                windows of each security.
+
+        """
+        self.max_windows = max_windows
+        self._loader = loader
+        self._series = {}
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def record(self, ticker, sequence, time, price, size, bid=None,
+               ask=None):
+        """Records a new tick and invalidates the security's cached results.
+
+        If the security's series wasn't loaded yet the tick is ignored, since
+        it will be read from the database on the first query. A tick that was
+        already loaded is ignored as well, while a gap in the sequence (a tick
+        missed during a load) drops the series, to be reloaded.
+
+        Args:
+            ticker (str): The security code.
+            sequence (int): The position of the tick on the security's price
+                history.
+            (see TickSeries.append() for the other arguments)
+
+        """
+        with self._lock:
+            series = self._series.get(ticker)
+            if series is not None:
+                if sequence == len(series):
+                    series.append(time, price, size, bid=bid, ask=ask)
+                elif sequence > len(series):
+                    del self._series[ticker]
+            self._cache.pop(ticker, None)
+
+    def get(self, ticker, window=None):
+        """Retrieves the (possibly cached) statistics of a security.
+
+        Args:
+            ticker (str): The security code.
+
+        Keyword Args:
+            window (float, default=None): See compute_analytics().
+
+        Returns:
+            None if the security doesn't exist, the statistics dict otherwise.
+
+        """
+        with self._lock:
+            cached = self._cache.get(ticker)
+            if cached is not None and window in cached:
+                cached.move_to_end(window)
+                return cached[window]
+
+            series = self._series.get(ticker)
+
+        if series is None:
+            # Loaded without the lock, so the fills aren't blocked meanwhile
+            series = self._loader(ticker)
+            if series is None:
+                return None
+
+            with self._lock:
+                loaded = self._series.setdefault(ticker, series)
+                if len(loaded) < len(series):
+                    self._series[ticker] = series
+                series = self._series[ticker]
+
+        with self._lock:
+            result = compute_analytics(series, window)
+            cached = self._cache.setdefault(ticker, OrderedDict())
+            cached[window] = result
+            while len(cached) > self.max_windows:
+                cached.popitem(last=False)
+            return result
+
+    def clear(self):
+        """Drops all the loaded series and cached results."""
+        with self._lock:
+            self._series.clear()
+            self._cache.clear()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""A micro Stock Market Simulator.
+
+This module implements the clearing of call auctions.
+
+In a call auction the orders of a book are collected during an interval and
+then executed all at once, at a single (uniform) price: the price that
+maximizes the executed volume, i.e. the minimum of the aggregated demand
+(the size of the Bid orders willing to buy at that price or higher) and the
+aggregated supply (the size of the Ask orders willing to sell at that price
+or lower). The curves are computed with cumulative sums over the sorted limit
+prices and evaluated at every candidate price at once, so the clearing is
+vectorized over the whole book.
+
+Ties on the executed volume are broken by the smallest imbalance between the
+demand and the supply, then by the distance to a reference price (e.g. the
+last market price) and finally by the lowest price.
+
+.. _uStockMarket Project:
+    https://github.com/luizsol/uStockMarket
+
+"""
+__author__ = 'Luiz Sol'
+__license__ = 'MIT'
+__version__ = '0.0.1'
+__date__ = '2017-10-05'
+__maintainer__ = 'Luiz Sol'
+__email__ = 'luizedusol@gmail.com'
+__status__ = 'Development'
+
+import numpy as np
+
+
+def _curve(prices, sizes, candidates, side):
+    """The aggregated size of the limit orders of a side at each candidate.
+
+    Args:
+        prices (numpy.ndarray): The limit prices of the orders.
+        sizes (numpy.ndarray): The sizes of the orders.
+        candidates (numpy.ndarray): The sorted candidate prices.
+        side (str): 'bid' (demand) or 'ask' (supply).
+
+    Returns:
+        numpy.ndarray: The demand or the supply at each candidate price.
+
+    """
+    order = np.argsort(prices, kind='stable')
+    total = np.concatenate(([0], np.cumsum(sizes[order])))
+    if side == 'bid':
+        # The bids priced at the candidate or higher
+        return total[-1] - total[np.searchsorted(prices[order], candidates,
+                                                 'left')]
+
+    # The asks priced at the candidate or lower
+    return total[np.searchsorted(prices[order], candidates, 'right')]
+
+
+def _allocate(prices, sizes, market, volume, eligible, direction):
+    """Allocates the executed volume of one side by price-time priority.
+
+    The `at market price` orders come first, then the best prices and, on the
+    same price, the earliest orders (the order of the arrays).
+
+    Returns:
+        numpy.ndarray: The executed size of each order.
+
+    """
+    priority = np.lexsort((np.arange(len(sizes)), direction * prices, ~market))
+    executable = np.where(eligible, sizes, 0)[priority]
+    before = np.cumsum(executable) - executable
+
+    allocation = np.zeros(len(sizes), dtype=np.int64)
+    allocation[priority] = np.clip(volume - before, 0, executable)
+    return allocation
+
+
+def clear_auction(bid_prices, bid_sizes, ask_prices, ask_sizes,
+                  bid_market=None, ask_market=None, reference_price=None):
+    """Clears a call auction.
+
+    Args:
+        bid_prices (array_like): The prices of the Bid orders (ignored for the
+            `at market price` ones).
+        bid_sizes (array_like): The sizes of the Bid orders.
+        ask_prices (array_like): The prices of the Ask orders (ignored for the
+            `at market price` ones).
+        ask_sizes (array_like): The sizes of the Ask orders.
+
+    Keyword Args:
+        bid_market (array_like, default=None): Whether each Bid order is a
+            `at market price` order. If None none of them is.
+        ask_market (array_like, default=None): Whether each Ask order is a
+            `at market price` order. If None none of them is.
+        reference_price (int, default=None): The price used to break ties
+            and, when only `at market price` orders cross, the clearing price.
+
+    Returns:
+        tuple: The clearing price (None if no order is executed), the executed
+            volume, and the executed size of each Bid and of each Ask order
+            (numpy.ndarray), allocated by price-time priority.
+
+    """
+    bid_prices = np.asarray(bid_prices, dtype=np.int64)
+    bid_sizes = np.asarray(bid_sizes, dtype=np.int64)
+    ask_prices = np.asarray(ask_prices, dtype=np.int64)
+    ask_sizes = np.asarray(ask_sizes, dtype=np.int64)
+    bid_market = np.zeros(len(bid_sizes), dtype=bool) if bid_market is None \
+        else np.asarray(bid_market, dtype=bool)
+    ask_market = np.zeros(len(ask_sizes), dtype=bool) if ask_market is None \
+        else np.asarray(ask_market, dtype=bool)
+
+    candidates = np.unique(np.concatenate((bid_prices[~bid_market],
+                                           ask_prices[~ask_market])))
+    if len(candidates) == 0 and reference_price is not None:
+        candidates = np.array([reference_price], dtype=np.int64)
+
+    price = None
+    volume = 0
+    if len(candidates):
+        demand = bid_sizes[bid_market].sum() + _curve(
+            bid_prices[~bid_market], bid_sizes[~bid_market], candidates, 'bid')
+        supply = ask_sizes[ask_market].sum() + _curve(
+            ask_prices[~ask_market], ask_sizes[~ask_market], candidates, 'ask')
+        executed = np.minimum(demand, supply)
+
+        distance = np.zeros(len(candidates), dtype=np.int64) \
+            if reference_price is None else \
+            np.abs(candidates - reference_price)
+        best = np.lexsort((candidates, distance, np.abs(demand - supply),
+                           -executed))[0]
+
+        if executed[best] > 0:
+            price = int(candidates[best])
+            volume = int(executed[best])
+
+    if price is None:
+        return (None, 0, np.zeros(len(bid_sizes), dtype=np.int64),
+                np.zeros(len(ask_sizes), dtype=np.int64))
+
+    return (price, volume,
+            _allocate(bid_prices, bid_sizes, bid_market, volume,
+                      bid_market | (bid_prices >= price), -1),
+            _allocate(ask_prices, ask_sizes, ask_market, volume,
+                      ask_market | (ask_prices <= price), 1))
+
+
+def pair_fills(bid_fills, ask_fills):
+    """Pairs the executed sizes of the Bid and of the Ask orders.
+
+    The executed sizes of both sides are laid on the same cumulative volume
+    axis (in the given order), so each segment between two consecutive
+    breakpoints is a fill between one Bid and one Ask order.
+
+    Args:
+        bid_fills (array_like): The executed size of each Bid order.
+        ask_fills (array_like): The executed size of each Ask order (which
+            must add up to the same volume).
+
+    Returns:
+        tuple: The index of the Bid order, the index of the Ask order and the
+            size (numpy.ndarray) of each fill.
+
+    """
+    bid_total = np.cumsum(bid_fills)
+    ask_total = np.cumsum(ask_fills)
+    ends = np.union1d(bid_total, ask_total)
+    ends = ends[ends > 0]
+    starts = np.concatenate(([0], ends))[:-1]
+
+    return (np.searchsorted(bid_total, starts, 'right'),
+            np.searchsorted(ask_total, starts, 'right'), ends - starts)
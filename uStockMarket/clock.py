@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""A micro Stock Market Simulator.
+
+This module implements the clocks of the Stock Exchange.
+
+All the simulation timestamps (the time of the orders, of the fills and of
+the wallet history) and the simulation intervals (such as the call auctions)
+are read from a single clock, which is either the wall clock or a simulated
+clock that runs a fixed number of times faster (or slower) than the wall
+clock, so a whole trading day may be simulated in minutes. The traders read
+the speed of the clock from the exchange and scale their own pauses by it.
+
+The simulated time never goes backwards: changing the speed rebases the
+clock on its current time.
+
+The simulated clocks of several processes (such as the shards of a cluster)
+agree with each other when they are built with the same speed and epoch (the
+wall time at which they started) and rebased at the same wall time, as far as
+the wall clocks of their machines agree.
+
+.. _uStockMarket Project:
+    https://github.com/luizsol/uStockMarket
+
+"""
+__author__ = 'Luiz Sol'
+__license__ = 'MIT'
+__version__ = '0.0.1'
+__date__ = '2017-10-05'
+__maintainer__ = 'Luiz Sol'
+__email__ = 'luizedusol@gmail.com'
+__status__ = 'Development'
+
+from datetime import datetime, timedelta
+import threading
+import time
+
+
+class WallClock(object):
+    """The wall clock.
+
+    Attributes:
+        speed (float): The number of simulated seconds per real second
+            (always 1).
+
+    """
+    mode = 'wall'
+    speed = 1.0
+
+    def now(self):
+        """(datetime) The current time."""
+        return datetime.now()
+
+    def monotonic(self):
+        """(float) A monotonic time, in seconds (to measure intervals)."""
+        return time.monotonic()
+
+    def real_seconds(self, seconds):
+        """(float) The real length of an interval of the clock."""
+        return seconds
+
+    def sleep(self, seconds):
+        """Sleeps for an interval of the clock."""
+        time.sleep(self.real_seconds(seconds))
+
+    def to_dict(self):
+        """Converts the object to a dict."""
+        return {'mode': self.mode,
+                'speed': str(self.speed),
+                'time': str(self.now())}
+
+
+class SimulatedClock(WallClock):
+    """A clock that runs at a multiple of the wall clock speed.
+
+    Attributes:
+        speed (float): The number of simulated seconds per real second.
+
+    """
+    mode = 'simulated'
+
+    def __init__(self, speed=1.0, start=None, epoch=None):
+        """The class constructor.
+
+        Keyword Args:
+            speed (float, default=1.0): The number of simulated seconds per
+                real second.
+            start (datetime, default=None): The initial time of the clock. If
+                None the wall clock time of the epoch is used.
+            epoch (float, default=None): The wall time (in seconds since the
+                epoch) at which the clock read `start`. If None the clock
+                starts now.
+
+        Raises:
+            ValueError: If the speed isn't a positive finite number.
+
+        """
+        if not 0 < speed < float('inf'):
+            raise ValueError('The clock speed must be positive.')
+
+        self._lock = threading.Lock()
+        self.speed = float(speed)
+        if epoch is None:
+            epoch = time.time()
+        self._start = datetime.fromtimestamp(epoch) if start is None \
+            else start
+        self._real_start = time.monotonic()
+        self._elapsed = max(0.0, time.time() - epoch) * self.speed
+        # The monotonic time goes on from the wall clock's one, so the
+        # intervals measured before the clock was replaced stay valid
+        self._base = self._real_start - self._elapsed
+
+    def _seconds(self):
+        """(float) The simulated seconds since the start of the clock."""
+        return self._elapsed + \
+            (time.monotonic() - self._real_start) * self.speed
+
+    def now(self):
+        """(datetime) The current simulated time."""
+        with self._lock:
+            return self._start + timedelta(seconds=self._seconds())
+
+    def monotonic(self):
+        """(float) A monotonic time, in simulated seconds."""
+        with self._lock:
+            return self._base + self._seconds()
+
+    def real_seconds(self, seconds):
+        """(float) The real length of a simulated interval."""
+        return seconds / self.speed
+
+    def set_speed(self, speed, at=None):
+        """Changes the speed of the clock from its current time on.
+
+        Keyword Args:
+            at (float, default=None): The wall time (in seconds since the
+                epoch, not in the future) from which the new speed applies, so
+                that clocks rebased by different processes stay in agreement.
+                If None the new speed applies from now on.
+
+        Raises:
+            ValueError: If the speed isn't a positive finite number.
+
+        """
+        if not 0 < speed < float('inf'):
+            raise ValueError('The clock speed must be positive.')
+
+        with self._lock:
+            real_now = time.monotonic()
+            # The rebase can't go back past the previous one
+            since = 0.0 if at is None else \
+                min(max(0.0, time.time() - at), real_now - self._real_start)
+            self._elapsed = self._seconds() - since * self.speed
+            self._real_start = real_now - since
+            self.speed = float(speed)
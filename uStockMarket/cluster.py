@@ -0,0 +1,659 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""A micro Stock Market Simulator.
+
+This module implements a Stock Exchange cluster partitioned by ticker.
+
+The cluster is made of shards, each one a process running a StockExchange that
+only matches the order books of the tickers it owns (by consistent hashing,
+see HashRing), and of a Gateway, which has the same interface as the
+StockExchange and routes each call to the shard that owns its ticker. The
+server.py API is therefore unchanged for the clients.
+
+The shards serve the gateway's calls over `multiprocessing.connection`
+sockets, either Unix sockets (a path, so local processes stand in for separate
+nodes) or TCP sockets (a `host:port` address, or a bare port to listen on the
+loopback interface only). They can be spawned locally by the gateway (see
+spawn_shards()) or started on other machines with:
+    $ USTOCKMARKET_AUTHKEY=<secret> python cluster.py -a <host:port> \
+        -i <index> -n <shards>
+
+The connections carry pickled messages, so they are authenticated by a secret
+key that the operator must supply (through the USTOCKMARKET_AUTHKEY
+environment variable): the shards refuse to start without one, listen on a
+Unix socket unless an address is given, and only serve the calls listed on
+SHARD_METHODS.
+
+To see all the shard options, run:
+    $ python cluster.py -h
+
+Cross-shard settlement protocol: the trader accounts are shared by all the
+shards (they live on the common database) and a fill is settled by its book's
+shard only with atomic conditional updates (see Order.match()):
+    1. The buyer's wallet is debited with a compare-and-swap that fails if it
+        would become negative (the buyer's order is canceled).
+    2. The seller's position is decremented by a guarded increment that fails
+        if it would become negative, in which case the buyer is refunded (the
+        seller's order is canceled).
+    3. The buyer's position is incremented and the seller's wallet credited.
+Shards settling fills of the same trader concurrently therefore never lose
+each other's updates and no account ever becomes negative, without any lock
+or coordination between shards.
+
+Attributes:
+    AUTHKEY_VARIABLE (str): the environment variable that holds the secret
+        authentication key of the shard connections
+    SHARD_METHODS (tuple): the StockExchange methods served by the shards
+
+.. _uStockMarket Project:
+    https://github.com/luizsol/uStockMarket
+
+"""
+__author__ = 'Luiz Sol'
+__license__ = 'MIT'
+__version__ = '0.0.1'
+__date__ = '2017-10-05'
+__maintainer__ = 'Luiz Sol'
+__email__ = 'luizedusol@gmail.com'
+__status__ = 'Development'
+
+import argparse
+import atexit
+from bisect import bisect
+import hashlib
+import json
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+import os
+import queue
+import secrets
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+AUTHKEY_VARIABLE = 'USTOCKMARKET_AUTHKEY'
+
+# The StockExchange methods served by the gateway's own exchange
+LOCAL_METHODS = ('admit_order', 'get_rate_limits', 'get_trader_limits',
+                 'set_rate_limits')
+
+# The StockExchange methods routed to the shard that owns their ticker (the
+# orders are routed by Gateway.send_order())
+TICKER_METHODS = ('register_security', 'get_book', 'get_book_json',
+                  'get_price_history', 'get_analytics', 'set_matching_mode')
+
+# The StockExchange methods the shards serve to the gateway (any other call is
+# refused)
+SHARD_METHODS = TICKER_METHODS + (
+    'send_order', 'get_order', 'get_order_trace', 'get_slowest_traces',
+    'register_trader', 'register_traders', 'list_traders', 'list_tickers',
+    'get_trader_status', 'get_trader_limits', 'edit_positions', 'audit',
+    'get_leaderboard', 'get_clock', 'set_clock_speed', 'clean_history')
+
+
+def get_authkey():
+    """(bytes) The secret authentication key of the shard connections, read
+    from the AUTHKEY_VARIABLE environment variable (None if not set)."""
+    authkey = os.environ.get(AUTHKEY_VARIABLE)
+    return authkey.encode('utf8') if authkey else None
+
+
+def new_authkey():
+    """(bytes) Generates a random authentication key."""
+    return secrets.token_hex(32).encode('utf8')
+
+
+def parse_bool(value):
+    """Parses a boolean command line value.
+
+    Args:
+        value (str): `true`, `yes`, `on` or `1` (or their false counterparts),
+            in any case.
+
+    Returns:
+        bool: The value.
+
+    Raises:
+        argparse.ArgumentTypeError: If the value isn't a boolean.
+
+    """
+    value = value.strip().lower()
+    if value in ('true', 'yes', 'on', '1'):
+        return True
+    if value in ('false', 'no', 'off', '0', ''):
+        return False
+    raise argparse.ArgumentTypeError('%r isn\'t a boolean.' % (value))
+
+
+def parse_address(address):
+    """Parses a shard address.
+
+    Args:
+        address (str): A Unix socket path, a `host:port` TCP address or a
+            bare TCP port (on the loopback interface).
+
+    Returns:
+        The address on the `multiprocessing.connection` format.
+
+    """
+    if address.isdigit():
+        return ('127.0.0.1', int(address))
+
+    host, separator, port = address.rpartition(':')
+    if separator and port.isdigit():
+        return (host or '127.0.0.1', int(port))
+    return address
+
+
+class HashRing(object):
+    """A consistent hashing ring of shards.
+
+    Each shard is placed on several points of the ring and a key is owned by
+    the shard of the first point after the key's hash, so adding or removing
+    one shard only moves the keys of its neighbouring points.
+
+    Attributes:
+        shards (int): The number of shards.
+
+    """
+
+    def __init__(self, shards, replicas=64):
+        """The class constructor.
+
+        Args:
+            shards (int): The number of shards.
+
+        Keyword Args:
+            replicas (int, default=64): The number of points of each shard.
+
+        """
+        self.shards = shards
+        points = sorted((self._hash('shard-%d#%d' % (shard, replica)), shard)
+                        for shard in range(shards)
+                        for replica in range(replicas))
+        self._hashes = [point for point, _ in points]
+        self._owners = [shard for _, shard in points]
+
+    @staticmethod
+    def _hash(key):
+        """(int) The position of a key on the ring."""
+        return int.from_bytes(hashlib.md5(key.encode('utf8')).digest()[:8],
+                              'big')
+
+    def owner(self, key):
+        """(int) The index of the shard that owns a key."""
+        index = bisect(self._hashes, self._hash(key)) % len(self._hashes)
+        return self._owners[index]
+
+
+class ShardError(Exception):
+    """An error raised by a shard while executing a call."""
+    pass
+
+
+def serve_shard(address, index, shards, authkey, **options):
+    """Runs a shard, serving the calls of the gateways forever.
+
+    Args:
+        address (str): The address on which the shard listens (see
+            parse_address()).
+        index (int): The index of the shard.
+        shards (int): The number of shards of the cluster.
+        authkey (bytes): The secret authentication key of the connections.
+
+    Keyword Args:
+        **options: The StockExchange constructor arguments (clean_start is
+            always False, since the database is shared by the cluster).
+        trace_file (str): A file into which a sample of the order traces will
+            be dumped (optional, see OrderTracer.configure_dump()).
+        trace_sample (float): The fraction of the dumped traces.
+
+    Raises:
+        ValueError: If the authentication key is empty.
+
+    """
+    if not authkey:
+        raise ValueError('The shards require a secret authentication key '
+                         '(set the %s environment variable).' %
+                         (AUTHKEY_VARIABLE))
+
+    # Imported here so importing this module doesn't connect to the database
+    from u_stock_market import StockExchange, log, order_tracer
+
+    trace_file = options.pop('trace_file', None)
+    trace_sample = options.pop('trace_sample', 0.01)
+    if trace_file is not None:
+        order_tracer.configure_dump(trace_file, trace_sample)
+
+    ring = HashRing(shards)
+    options['clean_start'] = False
+    sx = StockExchange(owns=lambda ticker: ring.owner(ticker) == index,
+                       **options)
+    sx.start()
+
+    def handle(connection):
+        with connection:
+            while True:
+                try:
+                    method, args, kwargs = connection.recv()
+                except EOFError:
+                    return
+
+                if method not in SHARD_METHODS:
+                    log.warning('Shard %d refused the call %r', index, method)
+                    connection.send((False, 'The %r call isn\'t served by '
+                                            'the shards.' % (method)))
+                    continue
+
+                try:
+                    result = (True, getattr(sx, method)(*args, **kwargs))
+                except Exception as e:
+                    log.exception('Shard %d failed on %s', index, method)
+                    result = (False, '%s: %s' % (type(e).__name__, e))
+
+                connection.send(result)
+
+    address = parse_address(address)
+    if isinstance(address, str) and os.path.exists(address):
+        os.remove(address)
+
+    with Listener(address, authkey=authkey) as listener:
+        log.info('Shard %d of %d listening on %s', index, shards, address)
+        while True:
+            try:
+                connection = listener.accept()
+            except (AuthenticationError, EOFError, OSError) as e:
+                log.warning('Shard %d refused a connection (%s)', index, e)
+                continue
+
+            threading.Thread(target=handle, args=(connection,),
+                             daemon=True).start()
+
+
+def spawn_shards(shards, authkey, workers=4, debug_mode=False,
+                 log_levels=None, trace_file=None, trace_sample=0.01,
+                 snapshot_dir=None, tick_ring=None, order_queue=None,
+                 clock_speed=None, clock_epoch=None):
+    """Starts local shard processes listening on Unix sockets.
+
+    The shards are started exactly as shards on other machines would be (see
+    the module's command line), and are terminated when the gateway exits.
+
+    Args:
+        shards (int): The number of shards.
+        authkey (bytes): The secret authentication key of the connections
+            (passed to the shards through their environment).
+
+    Keyword Args:
+        workers (int, default=4): The number of matcher workers of each shard.
+        debug_mode (bool, default=False): Whether the shards run on debug
+            mode.
+        log_levels (str, default=None): The log level of each subsystem (such
+            as `orders=INFO,matching=WARNING`).
+        trace_file (str, default=None): A file into which a sample of the
+            order traces will be dumped (suffixed by the shard index).
+        trace_sample (float, default=0.01): The fraction of the dumped traces.
+        snapshot_dir (str, default=None): The directory into which the shards
+            publish the market data snapshots of their books.
+        tick_ring (str, default=None): The path of the tick rings of the
+            shards (suffixed by the shard index, since each ring has a single
+            writer).
+        order_queue (int, default=None): The size of the asynchronous order
+            ingestion queue of each shard.
+        clock_speed (float, default=None): The speed of the simulated clock
+            of each shard.
+        clock_epoch (float, default=None): The wall time (in seconds since
+            the epoch) at which the simulated clocks of the shards started.
+            If None they start now, all at once.
+
+    Returns:
+        list(str): The addresses of the shards.
+
+    """
+    directory = tempfile.mkdtemp(prefix='ustockmarket-')
+    script = os.path.abspath(__file__)
+    if clock_epoch is None:
+        clock_epoch = time.time()
+
+    addresses = []
+    for index in range(shards):
+        address = os.path.join(directory, 'shard-%d.sock' % (index))
+        command = [sys.executable, script, '-a', address, '-i', str(index),
+                   '-n', str(shards), '-w', str(workers), '-s',
+                   str(trace_sample)]
+        if debug_mode:
+            command += ['-d']
+        if log_levels is not None:
+            command += ['-l', log_levels]
+        if trace_file is not None:
+            command += ['-t', '%s.%d' % (trace_file, index)]
+        if snapshot_dir is not None:
+            command += ['-m', snapshot_dir]
+        if order_queue is not None:
+            command += ['-o', str(order_queue)]
+        if clock_speed is not None:
+            command += ['-x', str(clock_speed), '-e', repr(clock_epoch)]
+        if tick_ring is not None:
+            command += ['-r', '%s.%d' % (tick_ring, index)]
+
+        process = subprocess.Popen(command, cwd=os.path.dirname(script),
+                                   env=dict(os.environ, **{
+                                       AUTHKEY_VARIABLE: authkey.decode(
+                                           'utf8')}))
+        atexit.register(process.terminate)
+        addresses += [address]
+
+    return addresses
+
+
+class ShardClient(object):
+    """A pool of connections to a shard.
+
+    Attributes:
+        address (str): The address of the shard.
+
+    """
+
+    def __init__(self, address, authkey, timeout=30.0):
+        """The class constructor.
+
+        Args:
+            address (str): The address of the shard (see parse_address()).
+            authkey (bytes): The secret authentication key of the
+                connections.
+
+        Keyword Args:
+            timeout (float, default=30.0): How long (in seconds) to wait for
+                the shard to start listening.
+
+        """
+        self.address = address
+        self._authkey = authkey
+        self._timeout = timeout
+        self._connections = queue.LifoQueue()
+
+    def _connect(self):
+        """Opens a new connection, waiting for the shard to be listening."""
+        deadline = time.monotonic() + self._timeout
+        while True:
+            try:
+                return Client(parse_address(self.address),
+                              authkey=self._authkey)
+            except (OSError, EOFError):
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.1)
+
+    def call(self, method, *args, **kwargs):
+        """Calls a StockExchange method on the shard.
+
+        Raises:
+            ShardError: If the method raised an exception on the shard.
+
+        """
+        try:
+            connection = self._connections.get_nowait()
+        except queue.Empty:
+            connection = self._connect()
+
+        try:
+            connection.send((method, args, kwargs))
+            success, result = connection.recv()
+        except Exception:
+            connection.close()
+            raise
+
+        self._connections.put(connection)
+        if not success:
+            raise ShardError(result)
+        return result
+
+
+class Gateway(object):
+    """Routes the StockExchange calls to the shards of a cluster.
+
+    The calls on a ticker (see TICKER_METHODS) are sent to the shard that
+    owns it, the order traces are looked up on all the shards and any other
+    call (such as the trader ones, whose data is shared by the cluster) is
+    sent to the first shard. The orders are admitted by the rate limits of
+    the gateway's own exchange (see LOCAL_METHODS) before being routed, so
+    the limits apply to the whole cluster.
+
+    Attributes:
+        shards (list(ShardClient)): The shards of the cluster.
+        ring (HashRing): The ring that assigns the tickers to the shards.
+        exchange (StockExchange): The exchange of the gateway process, which
+            serves the local calls (or None).
+
+    """
+
+    def __init__(self, addresses, authkey, exchange=None):
+        """The class constructor.
+
+        Args:
+            addresses (list(str)): The addresses of the shards, ordered by
+                shard index.
+            authkey (bytes): The secret authentication key of the
+                connections.
+
+        Keyword Args:
+            exchange (StockExchange, default=None): The exchange of the
+                gateway process. If None the local calls are sent to the first
+                shard and the orders are only admitted by the shards.
+
+        """
+        self.shards = [ShardClient(address, authkey=authkey) for address in
+                       addresses]
+        self.ring = HashRing(len(addresses))
+        self.exchange = exchange
+
+    def start(self):
+        """Does nothing, since the shards match the orders."""
+        pass
+
+    def owner(self, ticker):
+        """(ShardClient) The shard that owns a ticker."""
+        return self.shards[self.ring.owner(str(ticker))]
+
+    def __getattr__(self, method):
+        if method.startswith('_'):
+            raise AttributeError(method)
+
+        if method in LOCAL_METHODS and self.exchange is not None:
+            return getattr(self.exchange, method)
+        elif method in TICKER_METHODS:
+            def call(*args, **kwargs):
+                ticker = kwargs['ticker'] if 'ticker' in kwargs else args[0]
+                return self.owner(ticker).call(method, *args, **kwargs)
+        elif method in SHARD_METHODS:
+            def call(*args, **kwargs):
+                return self.shards[0].call(method, *args, **kwargs)
+        else:
+            raise AttributeError(method)
+
+        return call
+
+    def send_order(self, trader, ticker, *args, **kwargs):
+        """Admits an order and routes it to the shard that owns its ticker.
+        """
+        if self.exchange is not None:
+            rejection = self.exchange.admit_order(trader)
+            if rejection is not None:
+                return rejection
+
+        return self.owner(ticker).call('send_order', trader, ticker, *args,
+                                       **kwargs)
+
+    def clean_history(self):
+        """Erases the database and the caches of all the shards."""
+        results = [shard.call('clean_history') for shard in self.shards]
+        return results[0]
+
+    def get_trader_status(self, name, **kwargs):
+        """Retrieves a trader's status from the first shard, with its
+        remaining rate limits, which are enforced by the gateway."""
+        result, status = self.shards[0].call('get_trader_status', name,
+                                             **kwargs)
+        if result['success']:
+            result['data']['rate_limits'] = self.get_trader_limits(name)
+        return result, status
+
+    def get_trader_status_json(self, name):
+        """Retrieves the JSON encoded status of a trader.
+
+        The traders' responses aren't cached on the cluster since their fills
+        are settled by any of the shards. As on a single exchange, the body
+        leaves the remaining rate limits out (see get_trader_status()).
+
+        Returns:
+            None if the trader doesn't exist, a tuple with the response ETag
+            and its JSON encoded body otherwise.
+
+        """
+        result, _ = self.shards[0].call('get_trader_status', name)
+        if not result['success']:
+            return None
+
+        body = json.dumps(result).encode('utf8')
+        return hashlib.sha1(body).hexdigest(), body
+
+    def set_clock_speed(self, speed):
+        """Changes the speed of the simulated clock of all the shards (and
+        of the gateway's exchange), from the same wall time on, so their
+        clocks stay in agreement."""
+        at = time.time()
+        if self.exchange is not None:
+            self.exchange.set_clock_speed(speed, at=at)
+        results = [shard.call('set_clock_speed', speed, at=at) for shard in
+                   self.shards]
+        return results[0]
+
+    def get_leaderboard(self, limit=10, by='equity', refresh=False):
+        """Ranks the traders on the first shard, whose accounts are
+        periodically reloaded from the database (see CLUSTER_LEADERBOARD_AGE
+        in u_stock_market), since their fills are settled by any shard."""
+        return self.shards[0].call('get_leaderboard', limit=limit, by=by,
+                                   refresh=refresh)
+
+    def get_order(self, order_id):
+        """Looks an order up on all the shards.
+
+        The orders are on the shared database, but the queued and the
+        rejected ones are only known by the shard that ingested them.
+        """
+        for shard in self.shards:
+            result = shard.call('get_order', order_id)
+            if result[0]['success']:
+                return result
+        return result
+
+    def get_order_trace(self, order_id):
+        """Looks an order trace up on all the shards."""
+        for shard in self.shards:
+            result = shard.call('get_order_trace', order_id)
+            if result[0]['success']:
+                return result
+        return result
+
+    def get_slowest_traces(self, count=10, stage=None):
+        """Merges the slowest order traces of all the shards."""
+        traces = []
+        for shard in self.shards:
+            result = shard.call('get_slowest_traces', count=count,
+                                stage=stage)
+            if not result[0]['success']:
+                return result
+            traces += result[0]['data']
+
+        if stage is None:
+            def key(trace):
+                return trace['total_us']
+        else:
+            def key(trace):
+                return trace['latency_us'][stage]
+
+        return {'success': True,
+                'data': sorted(traces, key=key, reverse=True)[:count]}, 200
+
+
+parser = argparse.ArgumentParser(description='Runs an uStockMarket cluster '
+                                             'shard.')
+parser.add_argument('-a', metavar='--address', default=None,
+                    help='The address (Unix socket path, host:port or a port '
+                         'on the loopback interface) on which the shard '
+                         'listens (default=a Unix socket on the temporary '
+                         'directory).')
+
+parser.add_argument('-i', metavar='--index', type=int, required=True,
+                    help='The index of the shard.')
+
+parser.add_argument('-n', metavar='--shards', type=int, required=True,
+                    help='The number of shards of the cluster.')
+
+parser.add_argument('-w', metavar='--workers', type=int, default=4,
+                    help='The number of matcher workers (default=4).')
+
+parser.add_argument('-d', metavar='--debug', nargs='?', default=False,
+                    const=True, type=parse_bool,
+                    help='true (or no value) if the shard should run on debug '
+                         'mode (default=false).')
+
+parser.add_argument('-l', metavar='--log_levels', nargs='?', default=None,
+                    help='The log level of each subsystem (exchange, orders '
+                         'and matching). Example: orders=INFO,matching=WARNING'
+                         ' (optional).')
+
+parser.add_argument('-t', metavar='--trace_file', nargs='?', default=None,
+                    help='A file into which a sample of the order latency '
+                         'traces will be dumped as JSON lines (optional).')
+
+parser.add_argument('-s', metavar='--trace_sample', nargs='?', default=0.01,
+                    type=float, help='The fraction of the settled orders '
+                                     'whose trace will be dumped '
+                                     '(default=0.01).')
+
+parser.add_argument('-m', metavar='--snapshot_dir', nargs='?', default=None,
+                    help='A directory into which the market data snapshots '
+                         'of the books are published (optional).')
+
+parser.add_argument('-r', metavar='--tick_ring', nargs='?', default=None,
+                    help='The path of a memory-mapped ring buffer into which '
+                         'the shard\'s fills are published (optional).')
+
+parser.add_argument('-o', metavar='--order_queue', nargs='?', default=None,
+                    type=int, help='The size of the asynchronous order '
+                                   'ingestion queue (optional).')
+
+parser.add_argument('-x', metavar='--clock_speed', nargs='?', default=None,
+                    type=float, help='The speed of the simulated clock, in '
+                                     'simulated seconds per real second '
+                                     '(optional).')
+
+parser.add_argument('-e', metavar='--clock_epoch', nargs='?', default=None,
+                    type=float, help='The wall time (in seconds since the '
+                                     'epoch) at which the simulated clock '
+                                     'started, which must be the same on '
+                                     'all the shards (default=now).')
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    log_levels = None
+    if args.l is not None:
+        log_levels = dict(item.split('=', 1) for item in args.l.split(','))
+
+    authkey = get_authkey()
+    if authkey is None:
+        parser.error('the %s environment variable must hold the secret '
+                     'authentication key of the cluster' % (AUTHKEY_VARIABLE))
+
+    address = args.a
+    if address is None:
+        address = os.path.join(tempfile.gettempdir(),
+                               'ustockmarket-shard-%d.sock' % (args.i))
+
+    serve_shard(address, args.i, args.n, authkey, workers=args.w,
+                debug_mode=args.d, log_levels=log_levels, trace_file=args.t,
+                trace_sample=args.s, snapshot_dir=args.m, tick_ring=args.r,
+                order_queue=args.o, clock_speed=args.x, clock_epoch=args.e)
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""A micro Stock Market Simulator.
+
+This module implements the asynchronous order ingestion of the Stock
+Exchange.
+
+On the asynchronous mode the order entry only validates the order (without
+any database write), assigns its id and submits it to a bounded queue, so the
+order is acknowledged right away. A single thread persists the queued orders
+in their arrival order and hands them to the matcher. When the queue is full
+the order is refused, pushing the load back to the traders.
+
+The state of a submitted order is then known by its id: it is queued, it was
+persisted (and is on the database) or it was rejected by the persistence (see
+OrderQueue.status()).
+
+.. _uStockMarket Project:
+    https://github.com/luizsol/uStockMarket
+
+"""
+__author__ = 'Luiz Sol'
+__license__ = 'MIT'
+__version__ = '0.0.1'
+__date__ = '2017-10-05'
+__maintainer__ = 'Luiz Sol'
+__email__ = 'luizedusol@gmail.com'
+__status__ = 'Development'
+
+from collections import OrderedDict
+import queue
+import threading
+
+
+class OrderQueue(threading.Thread):
+    """A bounded queue of orders, persisted by its own thread.
+
+    Attributes:
+        maxsize (int): The maximum number of queued orders.
+
+    """
+
+    def __init__(self, persist, maxsize=10000, history=100000,
+                 on_change=None):
+        """The class constructor.
+
+        Args:
+            persist (callable): A function that persists an order, given its
+                id and its arguments, returning None on success or the reason
+                of the rejection.
+
+        Keyword Args:
+            maxsize (int, default=10000): The maximum number of queued orders.
+            history (int, default=100000): The number of rejected orders whose
+                reason is kept.
+            on_change (callable, default=None): A function called with the
+                number of queued orders whenever it changes.
+
+        """
+        threading.Thread.__init__(self, name='OrderQueue')
+        self.daemon = True
+        self.maxsize = maxsize
+        self._persist = persist
+        self._history = history
+        self._on_change = on_change
+        self._queue = queue.Queue(maxsize)
+        self._pending = {}
+        self._rejected = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        """(int) The number of queued orders."""
+        return self._queue.qsize()
+
+    def submit(self, order_id, order):
+        """Queues an order.
+
+        Args:
+            order_id (ObjectId): The id assigned to the order.
+            order (dict): The arguments of the order.
+
+        Returns:
+            bool: Whether the order was queued (False if the queue is full).
+
+        """
+        self._pending[order_id] = True
+        try:
+            self._queue.put_nowait((order_id, order))
+        except queue.Full:
+            del self._pending[order_id]
+            return False
+
+        self._changed()
+        return True
+
+    def status(self, order_id):
+        """Retrieves the state of an order on the queue.
+
+        Args:
+            order_id (ObjectId): The id of the order.
+
+        Returns:
+            tuple: 'queued' or 'rejected' (with the reason of the rejection),
+                or None if the order isn't queued nor was rejected (it was
+                persisted, or it is unknown).
+
+        """
+        if order_id in self._pending:
+            return 'queued', None
+
+        with self._lock:
+            reason = self._rejected.get(order_id)
+
+        return None if reason is None else ('rejected', reason)
+
+    def clear(self):
+        """Forgets the rejected orders."""
+        with self._lock:
+            self._rejected.clear()
+
+    def run(self):
+        """Persists the queued orders."""
+        while True:
+            order_id, order = self._queue.get()
+            self._changed()
+
+            try:
+                reason = self._persist(order_id, order)
+            except Exception as e:
+                reason = '%s: %s' % (type(e).__name__, e)
+
+            # Recorded before the order leaves the pending ones, so it is
+            # always found in one of them (or on the database)
+            if reason is not None:
+                with self._lock:
+                    self._rejected[order_id] = reason
+                    if len(self._rejected) > self._history:
+                        self._rejected.popitem(last=False)
+
+            del self._pending[order_id]
+
+    def _changed(self):
+        """Reports the number of queued orders."""
+        if self._on_change is not None:
+            self._on_change(self._queue.qsize())
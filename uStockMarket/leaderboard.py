@@ -0,0 +1,286 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""A micro Stock Market Simulator.
+
+This module implements the server side leaderboard of the Stock Exchange.
+
+All the traders are marked to market at once: their positions are kept on a
+shares matrix (traders x tickers) that is multiplied by the vector of the last
+prices, so the equity of every trader is a single vectorized product instead
+of a walk over the positions of each trader.
+
+The equity (money plus the market value of the positions) and the PnL (the
+profit or loss of the trades, i.e. the money they moved plus the market value
+of the shares they moved) are then kept up to date by each fill: a fill at
+price P doesn't change the equity nor the PnL of its traders (they exchange
+money and shares worth the same at P), so only the new price has to be
+propagated, which is one column update per fill. The return is the PnL over
+the equity the trader would have without its trades.
+
+The accounts are reloaded from the database without holding the lock taken
+by the fills, and swapped in once built. The fills recorded during a reload
+are replayed on the new accounts: their prices always, and their trades when
+they are newer than the last fill read by the reload (the positions and the
+wallets read by the reload may still miss or include the few fills settled
+while it ran, until the next reload).
+
+.. _uStockMarket Project:
+    https://github.com/luizsol/uStockMarket
+
+"""
+__author__ = 'Luiz Sol'
+__license__ = 'MIT'
+__version__ = '0.0.1'
+__date__ = '2017-10-05'
+__maintainer__ = 'Luiz Sol'
+__email__ = 'luizedusol@gmail.com'
+__status__ = 'Development'
+
+import threading
+import time
+
+import numpy as np
+
+METRICS = ('equity', 'pnl', 'return')
+
+
+def _index(keys, index):
+    """(numpy.ndarray) Maps keys to their positions (-1 for unknown keys)."""
+    return np.fromiter((index.get(key, -1) for key in keys), dtype=np.int64,
+                       count=len(keys))
+
+
+class _Accounts(object):
+    """The accounts of all the traders, marked to market (see Leaderboard).
+    """
+
+    def __init__(self, accounts):
+        """Builds the matrices of the accounts loaded from the database."""
+        self.names = list(accounts['names'])
+        self.traders = {name: index for index, name in enumerate(self.names)}
+        self.tickers = {ticker: index for index, ticker in
+                        enumerate(accounts['tickers'])}
+        self.prices = np.asarray(accounts['prices'], dtype=np.int64)
+        self.watermark = accounts.get('watermark')
+
+        shape = (len(self.traders), len(self.tickers))
+        # Column major, so the column of a security is contiguous
+        self.shares = np.zeros(shape, dtype=np.int64, order='F')
+        self.traded = np.zeros(shape, dtype=np.int64, order='F')
+        trade_money = np.zeros(shape[0], dtype=np.int64)
+
+        for matrix, records in ((self.shares, accounts['positions']),
+                                (self.traded, accounts['trades'])):
+            if not records:
+                continue
+
+            columns = list(zip(*records))
+            rows = _index(columns[0], self.traders)
+            cols = _index(columns[1], self.tickers)
+            known = (rows >= 0) & (cols >= 0)
+            np.add.at(matrix, (rows[known], cols[known]),
+                      np.asarray(columns[2], dtype=np.int64)[known])
+            if matrix is self.traded:
+                np.add.at(trade_money, rows[known],
+                          np.asarray(columns[3], dtype=np.int64)[known])
+
+        self.equity = np.asarray(accounts['wallets'], dtype=np.int64) + \
+            self.shares @ self.prices
+        self.pnl = trade_money + self.traded @ self.prices
+
+    def record(self, ticker, buyer, seller, size, price, shares=True,
+               traded=True):
+        """Applies a fill (see Leaderboard.record()).
+
+        Keyword Args:
+            shares (bool, default=True): Whether the positions are updated.
+            traded (bool, default=True): Whether the traded shares are
+                updated.
+
+        Returns:
+            bool: False if the trader or the security is unknown.
+
+        """
+        column = self.tickers.get(ticker)
+        rows = [self.traders.get(buyer), self.traders.get(seller)]
+        if column is None or None in rows:
+            return False
+
+        delta = price - self.prices[column]
+        if delta:
+            self.equity += self.shares[:, column] * delta
+            self.pnl += self.traded[:, column] * delta
+            self.prices[column] = price
+
+        for row, amount in zip(rows, (size, -size)):
+            if shares:
+                self.shares[row, column] += amount
+            if traded:
+                self.traded[row, column] += amount
+
+        return True
+
+
+class Leaderboard(object):
+    """Marks all the traders to market and ranks them.
+
+    The accounts are loaded from the database on the first query (or after
+    being invalidated or getting older than max_age) and then updated by
+    every recorded fill.
+
+    Attributes:
+        max_age (float): The age (in seconds) after which the accounts are
+            reloaded, e.g. when other processes settle fills too (None for no
+            limit).
+
+    """
+
+    def __init__(self, loader, max_age=None):
+        """The class constructor.
+
+        Args:
+            loader (callable): A function that returns the accounts loaded
+                from the database as a dict with:
+                    `names` (list(str)) and `wallets` (array_like): the
+                        traders and their money;
+                    `tickers` (list(str)) and `prices` (array_like): the
+                        securities and their last prices;
+                    `positions` (list(tuple)): the (trader, ticker, shares) of
+                        every position;
+                    `trades` (list(tuple)): the (trader, ticker, shares, money)
+                        moved by the trades of each trader on each security
+                        (positive shares and negative money for the buys), up
+                        to the `watermark`;
+                    `watermark`: the id of the last fill read before the
+                        positions (None if there are no fills).
+
+        Keyword Args:
+            max_age (float, default=None): See the class attributes.
+
+        """
+        self.max_age = max_age
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._accounts = None
+        self._loaded_at = None
+        self._generation = 0
+        self._journal = None
+
+    def _reload(self):
+        """Reloads the accounts without blocking the fills.
+
+        Returns:
+            _Accounts: The reloaded accounts.
+
+        """
+        with self._reload_lock:
+            with self._lock:
+                self._journal = []
+                generation = self._generation
+
+            try:
+                accounts = _Accounts(self._loader())
+            finally:
+                with self._lock:
+                    journal, self._journal = self._journal, None
+
+            with self._lock:
+                for ticker, buyer, seller, size, price, fill_id in journal:
+                    accounts.record(
+                        ticker, buyer, seller, size, price, shares=False,
+                        traded=accounts.watermark is None or fill_id is None
+                        or fill_id > accounts.watermark)
+
+                # A reload that raced an invalidation is only used once
+                if generation == self._generation:
+                    self._accounts = accounts
+                    self._loaded_at = time.monotonic()
+
+            return accounts
+
+    def record(self, ticker, buyer, seller, size, price, fill_id=None):
+        """Records a fill.
+
+        If the accounts weren't loaded yet the fill is ignored, since it will
+        be read from the database on the first query. A fill of an unknown
+        trader or security invalidates the accounts.
+
+        Args:
+            ticker (str): The security code.
+            buyer (str): The name of the buyer.
+            seller (str): The name of the seller.
+            size (int): The size of the fill.
+            price (int): The price of the fill.
+
+        Keyword Args:
+            fill_id (default=None): The id of the fill (see the `watermark`
+                of the loader).
+
+        """
+        with self._lock:
+            if self._journal is not None:
+                self._journal.append((ticker, buyer, seller, size, price,
+                                      fill_id))
+
+            if self._accounts is not None and \
+                    not self._accounts.record(ticker, buyer, seller, size,
+                                              price):
+                self._accounts = None
+
+    def top(self, count=10, by='equity', refresh=False):
+        """Ranks the traders.
+
+        Keyword Args:
+            count (int, default=10): The number of traders retrieved.
+            by (str, default='equity'): The ranking metric ('equity', 'pnl' or
+                'return').
+            refresh (bool, default=False): Whether the accounts are reloaded
+                from the database first.
+
+        Returns:
+            tuple: The number of ranked traders and the (name, equity, PnL,
+                return) of the best ones, from the best to the worst (the
+                return is None when undefined).
+
+        Raises:
+            ValueError: If the metric is unknown.
+
+        """
+        if by not in METRICS:
+            raise ValueError('Unknown metric %r.' % (by))
+
+        with self._lock:
+            accounts = self._accounts
+            if accounts is not None and self.max_age is not None and \
+                    time.monotonic() - self._loaded_at > self.max_age:
+                accounts = None
+
+        if refresh or accounts is None:
+            accounts = self._reload()
+
+        with self._lock:
+            basis = accounts.equity - accounts.pnl
+            with np.errstate(divide='ignore', invalid='ignore'):
+                returns = np.where(basis > 0, accounts.pnl / basis, np.nan)
+
+            values = {'equity': accounts.equity, 'pnl': accounts.pnl,
+                      'return': np.nan_to_num(returns, nan=-np.inf)}[by]
+
+            count = max(0, min(count, len(values)))
+            best = np.argpartition(-values, count - 1)[:count] if count \
+                else np.empty(0, dtype=np.int64)
+            best = best[np.argsort(-values[best], kind='stable')]
+
+            return len(values), [
+                (accounts.names[row], int(accounts.equity[row]),
+                 int(accounts.pnl[row]),
+                 None if np.isnan(returns[row]) else float(returns[row]))
+                for row in best]
+
+    def invalidate(self):
+        """Reloads the accounts on the next query (e.g. after the traders or
+        their accounts are changed outside of the fills)."""
+        with self._lock:
+            self._accounts = None
+            self._generation += 1
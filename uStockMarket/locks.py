@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""A micro Stock Market Simulator.
+
+This module implements the locks of the Stock Exchange's concurrency model.
+
+Resources (order books, trader accounts) are guarded by a fixed number of lock
+stripes, each key being hashed to one stripe. Memory is therefore bounded no
+matter how many traders are registered, at the cost of unrelated keys
+occasionally sharing a stripe. Several keys are always locked in the order of
+their stripes, so two threads locking overlapping sets of keys can't deadlock.
+
+.. _uStockMarket Project:
+    https://github.com/luizsol/uStockMarket
+
+"""
+__author__ = 'Luiz Sol'
+__license__ = 'MIT'
+__version__ = '0.0.1'
+__date__ = '2017-10-05'
+__maintainer__ = 'Luiz Sol'
+__email__ = 'luizedusol@gmail.com'
+__status__ = 'Development'
+
+from contextlib import contextmanager
+import threading
+from zlib import crc32
+
+
+class StripedLocks(object):
+    """A fixed set of reentrant locks shared by hashed keys.
+
+    Attributes:
+        stripes (int): The number of locks.
+
+    """
+
+    def __init__(self, stripes=256):
+        """The class constructor.
+
+        Keyword Args:
+            stripes (int, default=256): The number of locks.
+
+        """
+        self.stripes = stripes
+        self._locks = [threading.RLock() for _ in range(stripes)]
+
+    def stripe(self, key):
+        """(int) The index of the lock that guards a key."""
+        return crc32(str(key).encode('utf8')) % self.stripes
+
+    @contextmanager
+    def hold(self, *keys):
+        """Locks keys for the duration of a `with` block.
+
+        Args:
+            *keys (object): The keys to be locked (such as tickers or trader
+                names).
+
+        """
+        stripes = sorted({self.stripe(key) for key in keys})
+        for stripe in stripes:
+            self._locks[stripe].acquire()
+        try:
+            yield
+        finally:
+            for stripe in reversed(stripes):
+                self._locks[stripe].release()
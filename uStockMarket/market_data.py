@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""A micro Stock Market Simulator.
+
+This module implements the publication of market data snapshots, which
+separates the market data read path from the order entry and matching.
+
+After each matching pass the exchange hands the books that changed to a
+SnapshotPublisher, which writes an immutable snapshot of each one (top of
+book, depth and recent trades) to a directory. The snapshots are written to a
+temporary file and atomically renamed, so the readers (see SnapshotStore and
+market_data_server.py) never see a partially written snapshot and never touch
+the database.
+
+.. _uStockMarket Project:
+    https://github.com/luizsol/uStockMarket
+
+"""
+__author__ = 'Luiz Sol'
+__license__ = 'MIT'
+__version__ = '0.0.1'
+__date__ = '2017-10-05'
+__maintainer__ = 'Luiz Sol'
+__email__ = 'luizedusol@gmail.com'
+__status__ = 'Development'
+
+import hashlib
+import json
+import os
+import threading
+import time
+from urllib.parse import quote, unquote
+
+SUFFIX = '.json'
+
+
+def snapshot_path(directory, ticker):
+    """(str) The path of the snapshot of a ticker."""
+    return os.path.join(directory, quote(ticker, safe='') + SUFFIX)
+
+
+class SnapshotPublisher(threading.Thread):
+    """A thread that publishes the snapshots of the changed books.
+
+    Attributes:
+        directory (str): The directory of the snapshots.
+        interval (float): The minimum time (in seconds) between two
+            publications, during which the changed books are coalesced.
+
+    """
+
+    def __init__(self, directory, build, interval=0.05):
+        """The class constructor.
+
+        Args:
+            directory (str): The directory of the snapshots.
+            build (callable): A function that returns the snapshot (a dict) of
+                a ticker, or None if the ticker doesn't exist.
+
+        Keyword Args:
+            interval (float, default=0.05): The minimum time (in seconds)
+                between two publications.
+
+        """
+        threading.Thread.__init__(self, name='SnapshotPublisher')
+        self.daemon = True
+        self.directory = directory
+        self.interval = interval
+        self._build = build
+        self._changed = {}
+        self._published = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+        # Held while a snapshot is built and written, so clear() never races
+        # the publication of a book built before it
+        self._write_lock = threading.Lock()
+        self._wakeup = threading.Event()
+
+        os.makedirs(directory, exist_ok=True)
+
+    def mark(self, ticker, version):
+        """Schedules the publication of a book if it changed.
+
+        Args:
+            ticker (str): The security code.
+            version (int): The version of the book (see ResponseCache).
+
+        """
+        with self._lock:
+            if self._published.get(ticker) != version:
+                self._changed[ticker] = version
+                self._wakeup.set()
+
+    def run(self):
+        """Publishes the changed books."""
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            with self._lock:
+                changed, self._changed = self._changed, {}
+                generation = self._generation
+
+            for ticker, version in changed.items():
+                with self._write_lock:
+                    if generation != self._generation:
+                        break
+
+                    snapshot = self._build(ticker)
+                    if snapshot is not None:
+                        self.write(ticker, snapshot)
+
+                    with self._lock:
+                        self._published[ticker] = version
+
+            time.sleep(self.interval)
+
+    def clear(self):
+        """Deletes all the published snapshots (e.g. after the database is
+        erased), so the readers stop serving them."""
+        with self._write_lock:
+            with self._lock:
+                self._generation += 1
+                self._changed = {}
+                self._published = {}
+
+            for name in os.listdir(self.directory):
+                if name.endswith(SUFFIX):
+                    try:
+                        os.remove(os.path.join(self.directory, name))
+                    except FileNotFoundError:
+                        pass
+
+    def write(self, ticker, snapshot):
+        """Atomically writes the snapshot of a ticker."""
+        path = snapshot_path(self.directory, ticker)
+        temporary = '%s.%d.tmp' % (path, os.getpid())
+        with open(temporary, 'wb') as f:
+            f.write(json.dumps({'success': True, 'data': snapshot})
+                    .encode('utf8'))
+        os.replace(temporary, path)
+
+
+class SnapshotStore(object):
+    """Reads the published snapshots, caching them until they are replaced.
+
+    Attributes:
+        directory (str): The directory of the snapshots.
+
+    """
+
+    def __init__(self, directory):
+        """The class constructor.
+
+        Args:
+            directory (str): The directory of the snapshots.
+
+        """
+        self.directory = directory
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def tickers(self):
+        """(list(str)) The tickers of all the published snapshots."""
+        return sorted(unquote(name[:-len(SUFFIX)]) for name in
+                      os.listdir(self.directory) if name.endswith(SUFFIX))
+
+    def get(self, ticker, view=None):
+        """Retrieves the current snapshot of a ticker.
+
+        Args:
+            ticker (str): The security code.
+
+        Keyword Args:
+            view (callable, default=None): A function that extracts the
+                response data from the snapshot. If None the whole snapshot
+                is the response data. The views are cached along with the
+                snapshot, so they must be named functions.
+
+        Returns:
+            None if there is no snapshot of the ticker, a tuple with the
+            response ETag and its JSON encoded body otherwise.
+
+        """
+        path = snapshot_path(self.directory, ticker)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+
+        key = (ticker, view)
+        version = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            entry = self._cache.get(key)
+        if entry is not None and entry[0] == version:
+            return entry[1]
+
+        try:
+            with open(path, 'rb') as f:
+                body = f.read()
+        except FileNotFoundError:
+            return None
+
+        if view is not None:
+            body = json.dumps({'success': True, 'data': view(
+                json.loads(body.decode('utf8'))['data'])}).encode('utf8')
+
+        response = (hashlib.sha1(body).hexdigest(), body)
+        with self._lock:
+            self._cache[key] = (version, response)
+        return response
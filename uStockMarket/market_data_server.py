@@ -0,0 +1,100 @@
+#!flask/bin/python
+# -*- coding: utf-8 -*-
+"""A micro Stock Market Simulator.
+
+This module implements a read-only RESTful API of the Stock Exchange market
+data, served from the snapshots published by the exchange (see the
+market_data module).
+
+The server never touches the database nor the matcher, so as many of them as
+needed can run (on any machine that can read the snapshot directory) without
+slowing down the order entry and the matching. It serves the same market data
+endpoints as server.py, except that the price history is limited to the most
+recent trades of the snapshot.
+
+To see all the execution options, run:
+    $ python market_data_server.py -h
+
+.. _uStockMarket Project:
+    https://github.com/luizsol/uStockMarket
+
+"""
+__author__ = 'Luiz Sol'
+__license__ = 'MIT'
+__version__ = '0.0.1'
+__date__ = '2017-10-05'
+__maintainer__ = 'Luiz Sol'
+__email__ = 'luizedusol@gmail.com'
+__status__ = 'Development'
+
+import argparse
+
+from flask import Flask, request
+from flask_restful import Api, Resource
+
+from market_data import SnapshotStore
+
+# Adding the terminal options
+
+parser = argparse.ArgumentParser(description='Runs an uStockMarket market '
+                                             'data server.')
+parser.add_argument('-m', metavar='--snapshot_dir', required=True,
+                    help='The directory of the market data snapshots '
+                         'published by the exchange.')
+
+parser.add_argument('-p', metavar='--port', nargs='?', default=5001, type=int,
+                    help='The port of the server (default=5001).')
+
+args = parser.parse_args()
+
+store = SnapshotStore(args.m)
+
+app = Flask(__name__)
+api = Api(app)
+
+
+def snapshot_response(cached):
+    """Builds the response of a snapshot (see server.cached_response())."""
+    if cached is None:
+        return {'success': False,
+                'message': 'The ticker doesn\'t exists.'}, 400
+
+    etag, body = cached
+    response = app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    return response.make_conditional(request)
+
+
+def price_history(snapshot):
+    """The price history view of a snapshot."""
+    return snapshot['price_history']
+
+
+# -List all securities
+class ListTickers(Resource):
+    def get(self):
+        return {'success': True, 'data': {'tickers': store.tickers()}}, 200
+
+
+api.add_resource(ListTickers, '/list_tickers')
+
+
+# -Get security price history
+class PriceHistory(Resource):
+    def get(self, ticker):
+        return snapshot_response(store.get(ticker, view=price_history))
+
+
+api.add_resource(PriceHistory, '/price_history/<ticker>')
+
+
+# -Get security order book
+class Book(Resource):
+    def get(self, ticker):
+        return snapshot_response(store.get(ticker))
+
+
+api.add_resource(Book, '/book/<ticker>')
+
+if __name__ == '__main__':
+    app.run(port=args.p, threaded=True)
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""A micro Stock Market Simulator.
+
+This module implements the pool of matcher workers of the Stock Exchange.
+
+Every ticker is owned by exactly one worker (chosen by hashing the ticker), so
+a burst of orders on one security only delays the matching of the securities
+owned by the same worker. New orders are routed to the owning worker, which
+matches the notified books right away, and every worker also sweeps all of its
+books on a fixed period, however busy it is, to pick up any book left crossed
+(e.g. by orders matched by another exchange process).
+
+The workers are threads: the matching time is dominated by database round
+trips, during which the GIL is released, so the workers match in parallel.
+A book that fails to match is logged and retried on the next sweep, so one
+failure never stops the worker (and all the other books it owns).
+
+Attributes:
+    log (logging.Logger): the matching subsystem logger (see
+        u_stock_market.LOG_SUBSYSTEMS)
+
+.. _uStockMarket Project:
+    https://github.com/luizsol/uStockMarket
+
+"""
+__author__ = 'Luiz Sol'
+__license__ = 'MIT'
+__version__ = '0.0.1'
+__date__ = '2017-10-05'
+__maintainer__ = 'Luiz Sol'
+__email__ = 'luizedusol@gmail.com'
+__status__ = 'Development'
+
+import logging
+import threading
+import time
+from zlib import crc32
+
+log = logging.getLogger('u_stock_market.matching')
+
+
+class MatcherWorker(threading.Thread):
+    """A thread that matches the books of the tickers it owns.
+
+    Attributes:
+        index (int): The index of the worker on its pool.
+
+    """
+
+    def __init__(self, pool, index):
+        """The class constructor.
+
+        Args:
+            pool (MatcherPool): The pool of the worker.
+            index (int): The index of the worker on its pool.
+
+        """
+        threading.Thread.__init__(self, name='Matcher-%d' % (index))
+        self.daemon = True
+        self.index = index
+        self._pool = pool
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+
+    def notify(self, ticker):
+        """Schedules the matching of a book owned by the worker."""
+        with self._lock:
+            self._pending.add(ticker)
+        self._wakeup.set()
+
+    def run(self):
+        """Matches the notified books (and all the owned books on every sweep
+        interval)."""
+        next_sweep = time.monotonic() + self._pool.sweep_interval
+        while True:
+            self._wakeup.wait(max(0, next_sweep - time.monotonic()))
+            self._wakeup.clear()
+            with self._lock:
+                tickers, self._pending = self._pending, set()
+
+            if time.monotonic() >= next_sweep:
+                try:
+                    tickers |= {ticker for ticker in self._pool.tickers() if
+                                self._pool.owner(ticker) is self}
+                except Exception:
+                    log.exception('%s failed to list the tickers', self.name)
+                next_sweep = time.monotonic() + self._pool.sweep_interval
+
+            for ticker in tickers:
+                try:
+                    self._pool.match(ticker)
+                except Exception:
+                    log.exception('%s failed to match %s', self.name, ticker)
+
+            if self._pool.on_pass is not None:
+                self._pool.on_pass()
+
+
+class MatcherPool(object):
+    """A pool of matcher workers, each one owning a partition of the tickers.
+
+    Attributes:
+        workers (list(MatcherWorker)): The workers.
+        match (callable): A function that matches the book of a ticker.
+        tickers (callable): A function that returns all the tickers.
+        sweep_interval (float): The time (in seconds) between the sweeps of
+            all the books of a worker.
+        on_pass (callable): A function called after every matching pass of a
+            worker (or None).
+
+    """
+
+    def __init__(self, match, tickers, workers=4, sweep_interval=1.0,
+                 on_pass=None):
+        """The class constructor.
+
+        Args:
+            match (callable): A function that matches the book of a ticker.
+            tickers (callable): A function that returns all the tickers.
+
+        Keyword Args:
+            workers (int, default=4): The number of workers.
+            sweep_interval (float, default=1.0): The time (in seconds) between
+                the sweeps of all the books of a worker.
+            on_pass (callable, default=None): A function called after every
+                matching pass of a worker.
+
+        """
+        self.match = match
+        self.tickers = tickers
+        self.sweep_interval = sweep_interval
+        self.on_pass = on_pass
+        self.workers = [MatcherWorker(self, index) for index in
+                        range(max(1, workers))]
+
+    def owner(self, ticker):
+        """(MatcherWorker) The worker that owns a ticker."""
+        return self.workers[crc32(ticker.encode('utf8')) % len(self.workers)]
+
+    def notify(self, ticker):
+        """Routes a book with new orders to its owning worker."""
+        self.owner(ticker).notify(ticker)
+
+    def start(self):
+        """Starts all the workers."""
+        for worker in self.workers:
+            worker.start()
+
+    def join(self):
+        """Waits for all the workers."""
+        for worker in self.workers:
+            worker.join()
@@ -0,0 +1,300 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""A micro Stock Market Simulator.
+
+This module implements the internal metrics of the Stock Exchange and their
+exposition in the Prometheus text format.
+
+Recording a metric only takes an uncontended lock and an addition (plus a
+bisection for histograms), so it can be done on the matching hot path. Metrics
+that are expensive to compute (such as the number of resting orders) are
+gauges collected by a callback only when the metrics are scraped.
+
+Attributes:
+    REGISTRY (Registry): the default registry of metrics
+
+.. _Prometheus exposition format:
+    https://prometheus.io/docs/instrumenting/exposition_formats/
+
+.. _uStockMarket Project:
+    https://github.com/luizsol/uStockMarket
+
+"""
+__author__ = 'Luiz Sol'
+__license__ = 'MIT'
+__version__ = '0.0.1'
+__date__ = '2017-10-05'
+__maintainer__ = 'Luiz Sol'
+__email__ = 'luizedusol@gmail.com'
+__status__ = 'Development'
+
+from bisect import bisect_left
+import threading
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Default histogram buckets (in seconds)
+DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    """(str) Escapes a label value."""
+    return str(value).replace('\\', r'\\').replace('\n', r'\n') \
+        .replace('"', r'\"')
+
+
+def _format_labels(labels):
+    """(str) Formats a label set on the exposition format."""
+    if not labels:
+        return ''
+    return '{' + ','.join('%s="%s"' % (name, _escape(value))
+                          for name, value in labels) + '}'
+
+
+def _format_value(value):
+    """(str) Formats a sample value on the exposition format."""
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Registry(object):
+    """A collection of metrics that are rendered together."""
+
+    def __init__(self):
+        """The class constructor."""
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        """Adds a metric to the registry."""
+        with self._lock:
+            self._metrics += [metric]
+
+    def render(self):
+        """(str) Renders all the metrics on the Prometheus text format."""
+        lines = []
+        for metric in list(self._metrics):
+            lines += ['# HELP %s %s' % (metric.name, metric.documentation),
+                      '# TYPE %s %s' % (metric.name, metric.TYPE)]
+            for suffix, labels, value in metric.samples():
+                lines += ['%s%s%s %s' % (metric.name, suffix,
+                                         _format_labels(labels),
+                                         _format_value(value))]
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+class _Metric(object):
+    """The base class of all metrics.
+
+    A metric with label names is a family of child metrics (one for each
+    label values combination), retrieved through the labels() method.
+
+    """
+    TYPE = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        """The class constructor.
+
+        Args:
+            name (str): The name of the metric.
+            documentation (str): The description of the metric.
+
+        Keyword Args:
+            labelnames (tuple(str), default=()): The names of the labels.
+            registry (Registry, default=REGISTRY): The registry into which the
+                metric will be rendered. If None the metric won't be
+                registered.
+
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        self._init()
+
+        if registry is not None:
+            registry.register(self)
+
+    def _init(self):
+        """Initializes the metric's values."""
+        pass
+
+    def _child(self):
+        """(_Metric) Creates an unregistered child metric."""
+        return self.__class__(self.name, self.documentation, registry=None)
+
+    def labels(self, *values):
+        """Retrieves the child metric of a label values combination.
+
+        Callers on hot paths should keep the returned child instead of calling
+        this method on every operation.
+
+        Args:
+            *values (str): The label values.
+
+        Returns:
+            _Metric: The child metric.
+
+        """
+        if len(values) != len(self.labelnames):
+            raise ValueError('Expected %d label values' %
+                             (len(self.labelnames)))
+
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._child())
+        return child
+
+    def samples(self):
+        """Yields the (suffix, labels, value) samples of the metric."""
+        if not self.labelnames:
+            for suffix, labels, value in self._samples():
+                yield suffix, labels, value
+            return
+
+        for values, child in sorted(self._children.items()):
+            for suffix, labels, value in child._samples():
+                yield suffix, tuple(zip(self.labelnames, values)) + labels, \
+                    value
+
+    def _samples(self):
+        """Yields the samples of an unlabeled metric."""
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """A monotonically increasing counter."""
+    TYPE = 'counter'
+
+    def _init(self):
+        self._value = 0
+
+    def inc(self, amount=1):
+        """Increments the counter."""
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self):
+        """(int) The current value of the counter."""
+        return self._value
+
+    def _samples(self):
+        yield '', (), self._value
+
+
+class Gauge(_Metric):
+    """A value that can go up and down.
+
+    The values of a gauge may be set directly or computed on each scrape by a
+    collect callback.
+
+    """
+    TYPE = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY,
+                 collect=None):
+        """The class constructor.
+
+        Keyword Args:
+            collect (callable, default=None): A function that returns the
+                current values of the gauge keyed by label values tuple (or a
+                single value if the gauge has no labels). If set the gauge
+                values are computed only when the metrics are rendered.
+
+        See _Metric.__init__() for the other arguments.
+
+        """
+        self._collect = collect
+        super(Gauge, self).__init__(name, documentation, labelnames, registry)
+
+    def _init(self):
+        self._value = 0
+
+    def set(self, value):
+        """Sets the gauge value."""
+        self._value = value
+
+    def inc(self, amount=1):
+        """Increments the gauge."""
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount=1):
+        """Decrements the gauge."""
+        self.inc(-amount)
+
+    def samples(self):
+        if self._collect is None:
+            for sample in super(Gauge, self).samples():
+                yield sample
+            return
+
+        values = self._collect()
+        if not self.labelnames:
+            yield '', (), values
+            return
+
+        for label_values, value in sorted(values.items()):
+            yield '', tuple(zip(self.labelnames, label_values)), value
+
+    def _samples(self):
+        yield '', (), self._value
+
+
+class Histogram(_Metric):
+    """Counts observations (such as durations) in configurable buckets."""
+    TYPE = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY,
+                 buckets=DEFAULT_BUCKETS):
+        """The class constructor.
+
+        Keyword Args:
+            buckets (tuple(float), default=DEFAULT_BUCKETS): The upper bounds
+                of the buckets.
+
+        See _Metric.__init__() for the other arguments.
+
+        """
+        self._bounds = tuple(sorted(buckets))
+        super(Histogram, self).__init__(name, documentation, labelnames,
+                                        registry)
+
+    def _init(self):
+        self._counts = [0] * (len(self._bounds) + 1)
+        self._sum = 0.0
+
+    def _child(self):
+        return self.__class__(self.name, self.documentation, registry=None,
+                              buckets=self._bounds)
+
+    def observe(self, value):
+        """Records an observation."""
+        index = bisect_left(self._bounds, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    def _samples(self):
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+
+        cumulative = 0
+        for bound, count in zip(self._bounds + (float('inf'),), counts):
+            cumulative += count
+            yield '_bucket', (('le', _format_value(float(bound))),), \
+                cumulative
+
+        yield '_sum', (), total
+        yield '_count', (), cumulative
@@ -0,0 +1,537 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""A micro Stock Market Simulator.
+
+This module implements a compact in-memory store of resting orders.
+
+A resting order is stored as a single fixed-size record (see ORDER_DTYPE) of a
+NumPy structured array instead of a mongoengine Document with reference
+fields and a fills list, so a resident book costs about 70 bytes per order
+(the record and its entry on the book index) and millions of orders fit on
+one box (see order_store_benchmark.py). The traders and the tickers are
+interned (see Interner) and the records only keep their integer ids, the
+prices are integer ticks (see u_stock_market.PRICE_SCALE) and the slot of an
+order is the index of its record, which is reused after the order is
+removed. Each record may also keep a reference to the order outside of the
+store, such as the id of its database document.
+
+The active orders of each side of each book are kept on an index sorted by
+priority (the `at market price` orders first, then the best prices and, on
+the same price, the earliest orders), so the top order of a book is found
+without scanning the records.
+
+Example:
+    >>> store = OrderStore()
+    >>> slot = store.add('John Doe', 'BBVA03', 'buy', 100, price=307)
+    >>> store.top('BBVA03', 'buy') == slot
+    True
+    >>> store.fill(slot, 100)
+    0
+
+Attributes:
+    ORDER_DTYPE (numpy.dtype): the layout of each order record
+    BID (int): the side of a Bid (buy) order
+    ASK (int): the side of an Ask (sell) order
+    MARKET (int): the flag of an `at market price` order
+    CANCELED (int): the flag of a canceled order
+    FILLED (int): the flag of a filled order
+    FREE (int): the flag of an unused record
+
+.. _uStockMarket Project:
+    https://github.com/luizsol/uStockMarket
+
+"""
+__author__ = 'Luiz Sol'
+__license__ = 'MIT'
+__version__ = '0.0.1'
+__date__ = '2017-10-05'
+__maintainer__ = 'Luiz Sol'
+__email__ = 'luizedusol@gmail.com'
+__status__ = 'Development'
+
+from array import array
+from bisect import bisect_left, bisect_right
+import threading
+import time
+
+import numpy as np
+
+ORDER_DTYPE = np.dtype([('seq', '<u8'),
+                        ('time_ns', '<i8'),
+                        ('price', '<i8'),
+                        ('original_size', '<u4'),
+                        ('current_size', '<u4'),
+                        ('trader_id', '<u4'),
+                        ('ticker_id', '<u4'),
+                        ('side', 'u1'),
+                        ('flags', 'u1'),
+                        ('ref', 'S12')])
+
+BID = 0
+ASK = 1
+
+MARKET = 1
+CANCELED = 2
+FILLED = 4
+FREE = 8
+
+SIDES = {'buy': BID, 'sell': ASK}
+
+# The priority key of the `at market price` orders (ahead of any price)
+_MARKET_KEY = np.iinfo(np.int64).min
+
+
+def _ref(ref):
+    """(bytes) A reference padded to its 12 bytes (NumPy strips the trailing
+    null bytes of the stored ones)."""
+    return bytes(ref).ljust(ORDER_DTYPE['ref'].itemsize, b'\0')
+
+
+def _keys(prices, market, side):
+    """(numpy.ndarray) The priority keys of orders of one side (the lower,
+    the higher the priority)."""
+    keys = np.asarray(prices, dtype=np.int64) * (-1 if side == BID else 1)
+    return np.where(market, _MARKET_KEY, keys)
+
+
+class Interner(object):
+    """Maps strings (trader names, tickers) to dense integer ids and back."""
+
+    def __init__(self):
+        """The class constructor."""
+        self._ids = {}
+        self._names = []
+
+    def __len__(self):
+        return len(self._names)
+
+    def intern(self, name):
+        """(int) The id of a name, which is assigned on its first use."""
+        name_id = self._ids.get(name)
+        if name_id is None:
+            name_id = len(self._names)
+            self._ids[name] = name_id
+            self._names += [name]
+
+        return name_id
+
+    def get(self, name):
+        """(int) The id of a name (None if it was never interned)."""
+        return self._ids.get(name)
+
+    def name(self, name_id):
+        """(str) The name of an id."""
+        return self._names[name_id]
+
+
+class _BookSide(object):
+    """The slots of the active orders of one side of a book, sorted by their
+    priority keys (and by arrival on the same key)."""
+
+    def __init__(self):
+        """The class constructor."""
+        self.keys = array('q')
+        self.slots = array('q')
+
+    def __len__(self):
+        return len(self.slots)
+
+    def insert(self, key, slot):
+        """Inserts the newest order, behind the orders with the same key."""
+        position = bisect_right(self.keys, key)
+        self.keys.insert(position, key)
+        self.slots.insert(position, slot)
+
+    def extend(self, keys, slots):
+        """Inserts multiple new orders, given by arrival."""
+        keys = np.concatenate((np.array(self.keys, dtype=np.int64), keys))
+        slots = np.concatenate((np.array(self.slots, dtype=np.int64), slots))
+        # Stable, so the orders with the same key stay sorted by arrival
+        order = np.argsort(keys, kind='stable')
+        self.keys = array('q', keys[order].tobytes())
+        self.slots = array('q', slots[order].tobytes())
+
+    def remove(self, key, slot):
+        """Removes an order (usually the top one)."""
+        end = bisect_right(self.keys, key)
+        for position in range(bisect_left(self.keys, key), end):
+            if self.slots[position] == slot:
+                del self.keys[position]
+                del self.slots[position]
+                return
+
+    def first(self, limit_only=False):
+        """(int) The slot of the top order (None if there is none).
+
+        Keyword Args:
+            limit_only (bool, default=False): Whether the `at market price`
+                orders are skipped.
+
+        """
+        position = bisect_right(self.keys, _MARKET_KEY) if limit_only else 0
+        return self.slots[position] if position < len(self.slots) else None
+
+
+class OrderStore(object):
+    """An array-backed store of resting orders.
+
+    Attributes:
+        traders (Interner): The trader names.
+        tickers (Interner): The security codes.
+
+    """
+
+    def __init__(self, capacity=1024):
+        """The class constructor.
+
+        Keyword Args:
+            capacity (int, default=1024): The initial number of records, which
+                is doubled whenever the store is full.
+
+        """
+        self.traders = Interner()
+        self.tickers = Interner()
+        self._lock = threading.Lock()
+        self._capacity = max(capacity, 1)
+        self.clear()
+
+    def __len__(self):
+        """(int) The number of stored orders."""
+        return self._count
+
+    @property
+    def capacity(self):
+        """(int) The number of allocated records."""
+        return len(self._orders)
+
+    @property
+    def nbytes(self):
+        """(int) The size (in bytes) of the allocated records and of the book
+        indexes."""
+        return self._orders.nbytes + sum(
+            (side.keys.buffer_info()[1] + side.slots.buffer_info()[1]) *
+            side.keys.itemsize for side in self._books.values())
+
+    def clear(self):
+        """Removes all the orders."""
+        with self._lock:
+            self._orders = np.zeros(self._capacity, dtype=ORDER_DTYPE)
+            self._orders['flags'] = FREE
+            self._length = 0
+            self._free = []
+            self._count = 0
+            self._seq = 0
+            self._books = {}
+
+    def add(self, trader, ticker, side, size, price=None, market_order=False,
+            time_ns=None, ref=b''):
+        """Stores a new order.
+
+        Args:
+            trader (str): The name of the trader who sent the order.
+            ticker (str): The security code.
+            side (str): 'buy' for a Bid order or 'sell' for an Ask order.
+            size (int): The size of the order.
+
+        Keyword Args:
+            price (int, default=None): The price of the order (in ticks). May
+                be left as None just in the case of a `at market price` order.
+            market_order (bool, default=False): Whether the order is a `at
+                market price` order.
+            time_ns (int, default=None): The time of the order (in nanoseconds
+                since the epoch). If None the current time is used.
+            ref (bytes, default=b''): The reference (up to 12 bytes, padded
+                with null bytes) of the order outside of the store, such as
+                its database id.
+
+        Returns:
+            int: The slot of the order.
+
+        Raises:
+            ValueError: If the side, the size or the price is invalid.
+
+        """
+        if side not in SIDES or size < 1 or \
+                (not market_order and (price is None or price < 1)):
+            raise ValueError('Invalid order.')
+
+        side = SIDES[side]
+        key = _MARKET_KEY if market_order else \
+            int(_keys([price], [False], side)[0])
+
+        with self._lock:
+            slot = self._allocate(1)[0]
+            ticker_id = self.tickers.intern(ticker)
+
+            self._seq += 1
+            self._orders[slot] = (
+                self._seq, time.time_ns() if time_ns is None else time_ns,
+                price or 0, size, size, self.traders.intern(trader),
+                ticker_id, side, MARKET if market_order else 0, ref)
+            self._book(ticker_id, side).insert(key, slot)
+
+        return int(slot)
+
+    def add_many(self, traders, ticker, sides, sizes, prices, time_ns=None,
+                 refs=None):
+        """Stores multiple limit orders of a security at once.
+
+        Args:
+            traders (array_like): The names of the traders who sent the
+                orders.
+            ticker (str): The security code.
+            sides (array_like): The sides (BID or ASK) of the orders.
+            sizes (array_like): The sizes of the orders.
+            prices (array_like): The prices (in ticks) of the orders.
+
+        Keyword Args:
+            time_ns (int, default=None): The time of the orders (in
+                nanoseconds since the epoch). If None the current time is used.
+            refs (array_like, default=None): The references of the orders
+                (see add()).
+
+        Returns:
+            numpy.ndarray: The slots of the orders.
+
+        Raises:
+            ValueError: If the arrays don't have the same length or any side,
+                size or price is invalid (then no order is stored).
+
+        """
+        sides = np.asarray(sides)
+        sizes = np.asarray(sizes)
+        prices = np.asarray(prices)
+        count = len(sizes)
+        if not len(traders) == len(sides) == len(prices) == count or \
+                (refs is not None and len(refs) != count):
+            raise ValueError('The arrays must have the same length.')
+
+        if not (np.isin(sides, (BID, ASK)).all() and (sizes >= 1).all() and
+                (prices >= 1).all()):
+            raise ValueError('Invalid order.')
+
+        names, inverse = np.unique(np.asarray(traders, dtype=object),
+                                   return_inverse=True)
+
+        with self._lock:
+            slots = self._allocate(count)
+            ticker_id = self.tickers.intern(ticker)
+            trader_ids = np.array([self.traders.intern(name) for name in
+                                   names], dtype=np.int64)
+
+            orders = np.zeros(count, dtype=ORDER_DTYPE)
+            orders['seq'] = np.arange(self._seq + 1, self._seq + count + 1)
+            orders['time_ns'] = time.time_ns() if time_ns is None else time_ns
+            orders['price'] = prices
+            orders['original_size'] = sizes
+            orders['current_size'] = sizes
+            orders['trader_id'] = trader_ids[inverse]
+            orders['ticker_id'] = ticker_id
+            orders['side'] = sides
+            if refs is not None:
+                orders['ref'] = refs
+            self._orders[slots] = orders
+            self._seq += count
+
+            for side in (BID, ASK):
+                selected = sides == side
+                if selected.any():
+                    self._book(ticker_id, side).extend(
+                        _keys(prices[selected], False, side), slots[selected])
+
+        return slots
+
+    def get(self, slot):
+        """Retrieves an order.
+
+        Args:
+            slot (int): The slot of the order.
+
+        Returns:
+            None if there is no such order, a dict with the order otherwise.
+
+        """
+        order = self._record(slot)
+        if order is None:
+            return None
+
+        flags = int(order['flags'])
+        return {
+            'slot': slot,
+            'trader': self.traders.name(int(order['trader_id'])),
+            'ticker': self.tickers.name(int(order['ticker_id'])),
+            'side': 'buy' if order['side'] == BID else 'sell',
+            'original_size': int(order['original_size']),
+            'current_size': int(order['current_size']),
+            'price': None if flags & MARKET else int(order['price']),
+            'market_order': bool(flags & MARKET),
+            'canceled': bool(flags & CANCELED),
+            'filled': bool(flags & FILLED),
+            'time_ns': int(order['time_ns']),
+            'ref': _ref(order['ref'])}
+
+    def ref(self, slot):
+        """(bytes) The reference of an order (None if there is no such order).
+        """
+        order = self._record(slot)
+        return None if order is None else _ref(order['ref'])
+
+    def fill(self, slot, size, ref=None):
+        """Reduces the size of an order after a fill.
+
+        Args:
+            slot (int): The slot of the order.
+            size (int): The size of the fill.
+
+        Keyword Args:
+            ref (bytes, default=None): If set, the reference the order must
+                have (so a slot reused by another order isn't changed).
+
+        Returns:
+            int: The remaining size of the order (the order is flagged as
+                filled, and leaves its book, when it reaches 0).
+
+        Raises:
+            KeyError: If there is no such order.
+            ValueError: If the fill is larger than the order.
+
+        """
+        with self._lock:
+            order = self._record(slot, ref)
+            if order is None:
+                raise KeyError(slot)
+
+            if size > order['current_size']:
+                raise ValueError('The fill is larger than the order.')
+
+            order['current_size'] -= size
+            if order['current_size'] == 0:
+                self._unlist(slot)
+                order['flags'] |= FILLED
+
+            return int(order['current_size'])
+
+    def cancel(self, slot, ref=None):
+        """(bool) Cancels an active order (which leaves its book), returning
+        whether it was active (see fill() for the `ref`)."""
+        with self._lock:
+            order = self._record(slot, ref)
+            if order is None or order['flags'] & (CANCELED | FILLED):
+                return False
+
+            self._unlist(slot)
+            order['flags'] |= CANCELED
+            return True
+
+    def remove(self, slot, ref=None):
+        """Removes an order from the store, releasing its record (see fill()
+        for the `ref`).
+
+        Raises:
+            KeyError: If there is no such order.
+
+        """
+        with self._lock:
+            order = self._record(slot, ref)
+            if order is None:
+                raise KeyError(slot)
+
+            if not order['flags'] & (CANCELED | FILLED):
+                self._unlist(slot)
+            order['flags'] = FREE
+            self._free += [slot]
+            self._count -= 1
+
+    def resting(self, ticker, side):
+        """Retrieves the active orders of one side of a book.
+
+        Args:
+            ticker (str): The security code.
+            side (str): 'buy' for the Bid side or 'sell' for the Ask side.
+
+        Returns:
+            numpy.ndarray: The slots of the orders by priority: the `at market
+                price` orders first, then the best prices, and the oldest
+                orders on the same price.
+
+        """
+        with self._lock:
+            book = self._books.get((self.tickers.get(ticker), SIDES[side]))
+            if book is None:
+                return np.empty(0, dtype=np.int64)
+
+            return np.array(book.slots, dtype=np.int64)
+
+    def top(self, ticker, side, limit_only=False):
+        """Retrieves the top order of one side of a book.
+
+        Args:
+            ticker (str): The security code.
+            side (str): 'buy' for the Bid side or 'sell' for the Ask side.
+
+        Keyword Args:
+            limit_only (bool, default=False): Whether the `at market price`
+                orders are skipped.
+
+        Returns:
+            int: The slot of the order (None if the side is empty).
+
+        """
+        with self._lock:
+            book = self._books.get((self.tickers.get(ticker), SIDES[side]))
+            return None if book is None else book.first(limit_only)
+
+    def _record(self, slot, ref=None):
+        """The record of a stored order (None if there is no such order or
+        if it doesn't have the given reference)."""
+        if not 0 <= slot < self._length or \
+                self._orders[slot]['flags'] & FREE or \
+                (ref is not None and
+                 _ref(self._orders[slot]['ref']) != _ref(ref)):
+            return None
+
+        return self._orders[slot]
+
+    def _book(self, ticker_id, side):
+        """(_BookSide) The index of one side of a book."""
+        book = self._books.get((ticker_id, side))
+        if book is None:
+            book = self._books[(ticker_id, side)] = _BookSide()
+
+        return book
+
+    def _unlist(self, slot):
+        """Removes an active order from the index of its book."""
+        order = self._orders[slot]
+        side = int(order['side'])
+        key = _MARKET_KEY if order['flags'] & MARKET else \
+            int(_keys([order['price']], [False], side)[0])
+        self._books[(int(order['ticker_id']), side)].remove(key, slot)
+
+    def _allocate(self, count):
+        """Allocates records, reusing the released ones first.
+
+        Returns:
+            numpy.ndarray: The slots of the records.
+
+        """
+        reused = self._free[max(0, len(self._free) - count):]
+        del self._free[len(self._free) - len(reused):]
+        count -= len(reused)
+
+        start = self._length
+        if start + count > len(self._orders):
+            self._grow(start + count)
+        self._length += count
+        self._count += len(reused) + count
+
+        return np.concatenate((np.array(reused[::-1], dtype=np.int64),
+                               np.arange(start, start + count)))
+
+    def _grow(self, minimum):
+        """Reallocates the records, at least doubling the capacity."""
+        orders = np.zeros(max(minimum, 2 * len(self._orders)),
+                          dtype=ORDER_DTYPE)
+        orders['flags'] = FREE
+        orders[:self._length] = self._orders[:self._length]
+        self._orders = orders
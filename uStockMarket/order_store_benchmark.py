@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""A micro Stock Market Simulator.
+
+This script benchmarks the memory footprint and the speed of the compact
+order store (see the order_store module).
+
+It fills an OrderStore with random resting limit orders, reporting the bytes
+used per order (measured with tracemalloc, so it includes the priority
+indexes, the interned names and the slack of the arrays) along with the
+insertion, the book side and the top of book query times. The same figure
+is measured for a sample of unsaved Order documents, for comparison.
+
+To see all the execution options, run:
+    $ python order_store_benchmark.py -h
+
+.. _uStockMarket Project:
+    https://github.com/luizsol/uStockMarket
+
+"""
+__author__ = 'Luiz Sol'
+__license__ = 'MIT'
+__version__ = '0.0.1'
+__date__ = '2017-10-05'
+__maintainer__ = 'Luiz Sol'
+__email__ = 'luizedusol@gmail.com'
+__status__ = 'Development'
+
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+
+from order_store import ASK, BID, OrderStore
+
+parser = argparse.ArgumentParser(description='Benchmarks the uStockMarket '
+                                             'order store.')
+parser.add_argument('-n', metavar='--orders', type=int, default=10000000,
+                    help='The number of resting orders (default=10000000).')
+
+parser.add_argument('-k', metavar='--tickers', type=int, default=100,
+                    help='The number of securities (default=100).')
+
+parser.add_argument('-r', metavar='--traders', type=int, default=10000,
+                    help='The number of traders (default=10000).')
+
+parser.add_argument('-d', metavar='--documents', type=int, default=10000,
+                    help='The number of Order documents measured for '
+                         'comparison, 0 to skip (default=10000).')
+
+
+def fill_store(store, orders, tickers, traders):
+    """Fills a store with random limit orders around the price of 10.00."""
+    names = np.array(['Trader-%d' % (index) for index in range(traders)],
+                     dtype=object)
+    per_ticker = -(-orders // tickers)
+    for index in range(tickers):
+        count = min(per_ticker, orders - index * per_ticker)
+        store.add_many(np.random.choice(names, count),
+                       'BNCH%03d' % (index),
+                       np.random.choice((BID, ASK), count),
+                       np.random.randint(1, 1000, count),
+                       np.random.randint(900, 1100, count))
+
+
+def document_bytes(count):
+    """(float) The bytes per Order document, measured on unsaved ones."""
+    from u_stock_market import Order, OrderBook, Trader
+
+    trader = Trader(name='Trader')
+    book = OrderBook(ticker='BNCH000')
+
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    documents = [Order(trader=trader, order_book=book, original_size=10,
+                       current_size=10, price=1000, order_type='Bid')
+                 for _ in range(count)]
+    used = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+
+    del documents
+    return used / count
+
+
+def main(args):
+    tracemalloc.start()
+    start_time = time.perf_counter()
+
+    store = OrderStore(capacity=args.n)
+    fill_store(store, args.n, args.k, args.r)
+
+    elapsed = time.perf_counter() - start_time
+    used = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    print('Resting orders: %d (%d securities, %d traders)' %
+          (len(store), args.k, args.r))
+    print('Memory: %.1f MB, %.1f bytes per order' %
+          (used / 1e6, used / len(store)))
+    print('Bulk insertion: %.2f s (%.0f orders/s)' %
+          (elapsed, len(store) / elapsed))
+
+    start_time = time.perf_counter()
+    count = 100000
+    single = OrderStore()
+    for index in range(count):
+        single.add('Trader-0', 'BNCH000', 'buy', 10, price=1000)
+    elapsed = time.perf_counter() - start_time
+    print('Single insertion: %.2f us per order' % (elapsed / count * 1e6))
+
+    start_time = time.perf_counter()
+    ids = store.resting('BNCH000', 'sell')
+    elapsed = time.perf_counter() - start_time
+    print('Book side query: %.1f ms (%d orders)' % (elapsed * 1e3, len(ids)))
+
+    start_time = time.perf_counter()
+    for index in range(count):
+        store.top('BNCH%03d' % (index % args.k), 'buy')
+    elapsed = time.perf_counter() - start_time
+    print('Top of book query: %.2f us' % (elapsed / count * 1e6))
+
+    if args.d:
+        print('Order documents: %.1f bytes per order' %
+              (document_bytes(args.d)))
+
+
+if __name__ == '__main__':
+    main(parser.parse_args())
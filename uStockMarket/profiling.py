@@ -0,0 +1,296 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""A micro Stock Market Simulator.
+
+This module implements the on-demand profiling and memory tracking of a live
+Stock Exchange.
+
+The SamplingProfiler periodically samples the stacks of all threads (the
+matcher thread and the request handlers alike), so it can be started and
+stopped at any time without restarting the exchange and its overhead doesn't
+depend on how many function calls the profiled code makes.
+
+The MemoryTracker reports the top allocators traced by `tracemalloc` along with
+the number of live instances of the given classes.
+
+.. _uStockMarket Project:
+    https://github.com/luizsol/uStockMarket
+
+"""
+__author__ = 'Luiz Sol'
+__license__ = 'MIT'
+__version__ = '0.0.1'
+__date__ = '2017-10-05'
+__maintainer__ = 'Luiz Sol'
+__email__ = 'luizedusol@gmail.com'
+__status__ = 'Development'
+
+from collections import Counter
+import gc
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+# The largest number of frames tracemalloc stores for each allocation
+MAX_FRAMES = 65535
+
+
+def _frame_name(frame):
+    """(str) The `function (file:line)` name of a stack frame."""
+    code = frame.f_code
+    return '%s (%s:%d)' % (code.co_name, os.path.basename(code.co_filename),
+                           code.co_firstlineno)
+
+
+class SamplingProfiler(object):
+    """A statistical profiler of all the threads of the process.
+
+    Attributes:
+        interval (float): The time (in seconds) between two samples.
+        running (bool): Whether the profiler is sampling.
+
+    """
+
+    def __init__(self):
+        """The class constructor."""
+        self.interval = 0.005
+        self.running = False
+        self._stacks = Counter()
+        self._samples = 0
+        self._started = None
+        self._elapsed = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self, interval=0.005):
+        """Drops the previous samples and starts sampling.
+
+        Keyword Args:
+            interval (float, default=0.005): The time (in seconds) between two
+                samples.
+
+        Returns:
+            bool: False if the profiler was already running, True otherwise.
+
+        Raises:
+            ValueError: If the interval isn't a positive number.
+
+        """
+        if not interval > 0:
+            raise ValueError('The sampling interval must be positive.')
+
+        with self._lock:
+            if self.running:
+                return False
+
+            self.interval = interval
+            self.running = True
+            self._stacks = Counter()
+            self._samples = 0
+            self._elapsed = 0.0
+            self._started = time.perf_counter()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._sample_loop,
+                                            name='SamplingProfiler',
+                                            daemon=True)
+            self._thread.start()
+
+        return True
+
+    def stop(self):
+        """Stops sampling, keeping the samples.
+
+        Returns:
+            bool: False if the profiler wasn't running, True otherwise.
+
+        """
+        with self._lock:
+            if not self.running:
+                return False
+
+            self._stop.set()
+            thread = self._thread
+            self._thread = None
+
+        thread.join()
+
+        with self._lock:
+            self.running = False
+            self._elapsed = time.perf_counter() - self._started
+
+        return True
+
+    def collapsed(self):
+        """(str) The samples in the collapsed stack format.
+
+        Each line is a `;` separated stack (thread name first, outermost frame
+        next) followed by its number of samples, which is the input format of
+        flame graph tools.
+
+        """
+        with self._lock:
+            stacks = list(self._stacks.items())
+
+        return ''.join('%s %d\n' % (stack, count) for stack, count in
+                       sorted(stacks))
+
+    def stats(self, top=30, thread=None):
+        """Summarizes the samples by function.
+
+        Keyword Args:
+            top (int, default=30): The number of functions to be reported.
+            thread (str, default=None): The name of the thread whose stacks
+                are summarized (such as 'Matcher-0' for a matcher worker). If
+                None the stacks of all threads are summarized.
+
+        Returns:
+            dict: The number of samples, the sampling interval and duration,
+                the sampled threads and the functions with most samples, where
+                `self` is the fraction of the summarized stacks on which the
+                function was running and `total` the fraction on which it was
+                on the stack.
+
+        """
+        with self._lock:
+            stacks = list(self._stacks.items())
+            samples = self._samples
+            elapsed = (time.perf_counter() - self._started if self.running
+                       else self._elapsed)
+
+        own = Counter()
+        total = Counter()
+        threads = Counter()
+        for stack, count in stacks:
+            frames = stack.split(';')
+            threads[frames[0]] += count
+            if thread is not None and frames[0] != thread:
+                continue
+
+            own[frames[-1]] += count
+            for frame in set(frames[1:]):
+                total[frame] += count
+
+        summarized = threads[thread] if thread is not None else \
+            sum(threads.values())
+
+        def fraction(count):
+            return round(count / summarized, 4) if summarized else 0.0
+
+        return {'running': self.running,
+                'samples': samples,
+                'interval': self.interval,
+                'seconds': round(elapsed, 3),
+                'threads': sorted(threads),
+                'functions': [{'function': function,
+                               'self': fraction(own[function]),
+                               'total': fraction(count)}
+                              for function, count in total.most_common(top)]}
+
+    def _sample_loop(self):
+        """Samples the stacks of all the other threads until stopped."""
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in
+                     threading.enumerate()}
+            sampled = []
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+
+                frames = []
+                while frame is not None:
+                    frames += [_frame_name(frame)]
+                    frame = frame.f_back
+
+                frames += [names.get(thread_id, str(thread_id))]
+                sampled += [';'.join(reversed(frames))]
+
+            with self._lock:
+                self._stacks.update(sampled)
+                self._samples += 1
+
+
+class MemoryTracker(object):
+    """Reports the memory allocations of the process.
+
+    Attributes:
+        tracing (bool): Whether `tracemalloc` is tracing the allocations.
+
+    """
+
+    @property
+    def tracing(self):
+        return tracemalloc.is_tracing()
+
+    def start(self, frames=1):
+        """Starts tracing the allocations.
+
+        Keyword Args:
+            frames (int, default=1): The number of frames stored for each
+                allocation.
+
+        Raises:
+            ValueError: If the number of frames is out of range.
+
+        """
+        if not 1 <= frames <= MAX_FRAMES:
+            raise ValueError('The number of frames must be between 1 and %d.'
+                             % (MAX_FRAMES))
+
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        tracemalloc.start(frames)
+
+    def stop(self):
+        """Stops tracing the allocations, dropping the traces."""
+        tracemalloc.stop()
+
+    def report(self, types=(), top=20, group_by='lineno'):
+        """Reports the top allocators and the number of live objects.
+
+        Keyword Args:
+            types (tuple(type), default=()): The classes whose live instances
+                will be counted.
+            top (int, default=20): The number of allocators to be reported.
+            group_by (str, default='lineno'): How the allocations are grouped
+                ('lineno', 'filename' or 'traceback').
+
+        Returns:
+            dict: The traced memory (current and peak, in KiB), the top
+                allocators (empty if the allocations aren't being traced)
+                and the number of live instances of each class.
+
+        """
+        report = {'tracing': tracemalloc.is_tracing(), 'allocators': []}
+
+        if tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            report['current_kib'] = round(current / 1024, 1)
+            report['peak_kib'] = round(peak / 1024, 1)
+
+            snapshot = tracemalloc.take_snapshot().filter_traces((
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, '<frozen importlib._bootstrap>')))
+
+            for stat in snapshot.statistics(group_by)[:top]:
+                report['allocators'] += [{
+                    'location': ' <- '.join('%s:%d' % (frame.filename,
+                                                       frame.lineno)
+                                            for frame in stat.traceback),
+                    'size_kib': round(stat.size / 1024, 1),
+                    'count': stat.count}]
+
+        counts = Counter()
+        if types:
+            for obj in gc.get_objects():
+                for cls in types:
+                    if isinstance(obj, cls):
+                        counts[cls.__name__] += 1
+
+        report['objects'] = {cls.__name__: counts[cls.__name__] for cls in
+                             types}
+
+        return report
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""A micro Stock Market Simulator.
+
+This module implements the versioned cache of serialized responses of the
+Stock Exchange.
+
+Every cacheable resource (an order book, a trader etc.) is identified by a key
+with a version number that is incremented by the write paths. A cached
+response is valid while the versions of all the keys it depends on are
+unchanged, so the readers never need to query the database to validate it.
+
+.. _uStockMarket Project:
+    https://github.com/luizsol/uStockMarket
+
+"""
+__author__ = 'Luiz Sol'
+__license__ = 'MIT'
+__version__ = '0.0.1'
+__date__ = '2017-10-05'
+__maintainer__ = 'Luiz Sol'
+__email__ = 'luizedusol@gmail.com'
+__status__ = 'Development'
+
+from collections import OrderedDict
+import hashlib
+import json
+import threading
+
+
+class ResponseCache(object):
+    """A versioned cache of JSON encoded success responses.
+
+    Attributes:
+        max_entries (int): The maximum number of cached responses. The oldest
+            responses are evicted first.
+
+    """
+
+    def __init__(self, max_entries=10000):
+        """The class constructor.
+
+        Keyword Args:
+            max_entries (int, default=10000): The maximum number of cached
+                responses.
+
+        """
+        self.max_entries = max_entries
+        self._versions = {}
+        self._entries = OrderedDict()
+        # A counter of the writes and, for each key, the counter of its last
+        # invalidation, so a build is only discarded if its own dependencies
+        # were written meanwhile (see get())
+        self._writes = 0
+        self._written = {}
+        self._cleared = 0
+        self._lock = threading.Lock()
+
+    def version(self, key):
+        """(int) The current version of a key."""
+        return self._versions.get(key, 0)
+
+    def invalidate(self, *keys):
+        """Increments the version of keys, invalidating their responses.
+
+        Args:
+            *keys (tuple): The keys of the changed resources, such as
+                ('book', <ticker>) or ('trader', <name>).
+
+        """
+        with self._lock:
+            self._writes += 1
+            for key in keys:
+                self._versions[key] = self._versions.get(key, 0) + 1
+                self._written[key] = self._writes
+
+    def clear(self):
+        """Invalidates all the cached responses."""
+        with self._lock:
+            self._versions.clear()
+            self._entries.clear()
+            self._writes += 1
+            self._written.clear()
+            self._cleared = self._writes
+
+    def get(self, key, build):
+        """Retrieves a cached response, building it if it isn't valid.
+
+        Args:
+            key (tuple): The cache key of the response.
+            build (callable): A function that returns the response data (or
+                None if the resource doesn't exist) and the keys it depends
+                on.
+
+        Returns:
+            None if the resource doesn't exist, a tuple with the response
+            ETag and its JSON encoded body otherwise.
+
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                dependencies, etag, body = entry
+                if all(self._versions.get(dependency, 0) == version
+                       for dependency, version in dependencies.items()):
+                    return etag, body
+
+            writes = self._writes
+
+        data, dependencies = build()
+        if data is None:
+            return None
+
+        body = json.dumps({'success': True, 'data': data}).encode('utf8')
+        etag = hashlib.sha1(body).hexdigest()
+
+        with self._lock:
+            # A write to one of the dependencies during the build may have made
+            # the data stale (the writes to other keys don't matter)
+            if self._cleared <= writes and \
+                    all(self._written.get(dependency, 0) <= writes
+                        for dependency in dependencies):
+                self._entries.pop(key, None)
+                self._entries[key] = (
+                    {dependency: self._versions.get(dependency, 0)
+                     for dependency in dependencies}, etag, body)
+
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+
+        return etag, body
@@ -24,11 +24,17 @@ __status__ = 'Development'
 
 import argparse
 from decimal import Decimal
+import time
 
-from flask import Flask, request
+from flask import Flask, g, request
 from flask_restful import reqparse, Api, Resource
 
-from u_stock_market import StockExchange, log
+from cluster import (AUTHKEY_VARIABLE, Gateway, get_authkey, new_authkey,
+                     parse_bool, spawn_shards)
+from metrics import CONTENT_TYPE, REGISTRY, Histogram
+from profiling import MemoryTracker, SamplingProfiler
+from u_stock_market import Fill, Order, Position, StockExchange, \
+    bad_request, good_request, log, order_tracer
 
 # Adding the terminal options
 
@@ -39,21 +45,193 @@ parser.add_argument('-c', metavar='--clean_start', nargs='?', default=True,
                                     '(default=true).')
 
 parser.add_argument('-f', metavar='--config_file', nargs='?', default=None,
-                    help='An yaml file containing the inititial market'
-                         ' configuration.')
-
-parser.add_argument('-d', metavar='--debug', nargs='?', default=True,
-                    type=bool, help='true if the server should run on debug '
-                                    'mode (default=true).')
+                    help='An yaml, csv or json lines (.jsonl) file '
+                         'containing the inititial market configuration.')
+
+parser.add_argument('-d', metavar='--debug', nargs='?', default=False,
+                    const=True, type=parse_bool,
+                    help='true (or no value) if the server should log on '
+                         'debug level (default=false).')
+
+parser.add_argument('-p', metavar='--profiling', nargs='?', default=False,
+                    const=True, type=parse_bool,
+                    help='true (or no value) if the /debug profiling '
+                         'endpoints should be exposed (default=false).')
+
+parser.add_argument('-l', metavar='--log_levels', nargs='?', default=None,
+                    help='The log level of each subsystem (exchange, orders '
+                         'and matching). Example: orders=INFO,matching=WARNING'
+                         ' (optional).')
+
+parser.add_argument('-t', metavar='--trace_file', nargs='?', default=None,
+                    help='A file into which a sample of the order latency '
+                         'traces will be dumped as JSON lines (optional).')
+
+parser.add_argument('-s', metavar='--trace_sample', nargs='?', default=0.01,
+                    type=float, help='The fraction of the settled orders '
+                                     'whose trace will be dumped '
+                                     '(default=0.01).')
+
+parser.add_argument('-w', metavar='--workers', nargs='?', default=4, type=int,
+                    help='The number of matcher workers among which the '
+                         'order books are partitioned (default=4).')
+
+parser.add_argument('-n', metavar='--shards', nargs='?', default=None,
+                    type=int, help='Runs the exchange as a cluster of this '
+                                   'many local shard processes, each one '
+                                   'matching a partition of the tickers '
+                                   '(optional).')
+
+parser.add_argument('-g', metavar='--gateway', nargs='?', default=None,
+                    help='Runs the server as a gateway to already running '
+                         'shards, given by their comma separated addresses '
+                         '(Unix socket paths or host:port) ordered by shard '
+                         'index (optional).')
+
+parser.add_argument('-m', metavar='--snapshot_dir', nargs='?', default=None,
+                    help='A directory into which the market data snapshots '
+                         'of the books are published, to be served by '
+                         'market_data_server.py (optional).')
+
+parser.add_argument('-r', metavar='--tick_ring', nargs='?', default=None,
+                    help='The path of a memory-mapped ring buffer into which '
+                         'every fill is published for local consumers '
+                         '(optional, preferably on /dev/shm).')
+
+parser.add_argument('-q', metavar='--trader_limit', nargs='?', default=None,
+                    help='The order rate limit of each trader, as orders per '
+                         'second optionally followed by the burst. Example: '
+                         '10,50 (optional).')
+
+parser.add_argument('-Q', metavar='--global_limit', nargs='?', default=None,
+                    help='The order rate limit of the whole exchange, as '
+                         'orders per second optionally followed by the '
+                         'burst (optional).')
+
+parser.add_argument('-o', metavar='--order_queue', nargs='?', default=None,
+                    type=int, help='Acknowledges the orders as soon as they '
+                                   'are validated and queued on an ingestion '
+                                   'queue of this size, from which they are '
+                                   'persisted asynchronously (optional).')
+
+parser.add_argument('-x', metavar='--clock_speed', nargs='?', default=None,
+                    type=float, help='Runs the simulation on a simulated '
+                                     'clock this many times faster than the '
+                                     'wall clock (optional).')
+
+parser.add_argument('-e', metavar='--clock_epoch', nargs='?', default=None,
+                    type=float, help='The wall time (in seconds since the '
+                                     'epoch) at which the simulated clock '
+                                     'started, which must be the same as the '
+                                     'one of the shards (default=now).')
 
 args = parser.parse_args()
 
-sx = StockExchange(config_file=args.f, clean_start=args.c, debug_mode=args.d)
+
+def parse_limit(limit):
+    """(tuple) Parses a `rate[,burst]` rate limit (None if not set)."""
+    if limit is None:
+        return None, None
+
+    rate, _, burst = limit.partition(',')
+    return float(rate), float(burst) if burst else None
+
+
+log_levels = None
+if args.l is not None:
+    log_levels = dict(item.split('=', 1) for item in args.l.split(','))
+
+# On cluster mode the database is prepared here, while the shards match the
+# orders and serve the calls
+cluster_mode = args.n is not None or args.g is not None
+
+# The gateway and all the shards share the epoch of the simulated clock
+clock_epoch = args.e
+if clock_epoch is None and args.x is not None:
+    clock_epoch = time.time()
+
+sx = StockExchange(config_file=args.f, clean_start=args.c, debug_mode=args.d,
+                   log_levels=log_levels, workers=args.w,
+                   snapshot_dir=None if cluster_mode else args.m,
+                   tick_ring=None if cluster_mode else args.r,
+                   order_queue=None if cluster_mode else args.o,
+                   clock_speed=args.x, clock_epoch=clock_epoch)
+
+trader_rate, trader_burst = parse_limit(args.q)
+global_rate, global_burst = parse_limit(args.Q)
+sx.set_rate_limits(trader_rate=trader_rate, trader_burst=trader_burst,
+                   global_rate=global_rate, global_burst=global_burst)
+
+if cluster_mode:
+    authkey = get_authkey()
+    if args.g is not None:
+        if authkey is None:
+            parser.error('the %s environment variable must hold the secret '
+                         'authentication key of the shards' %
+                         (AUTHKEY_VARIABLE))
+        addresses = args.g.split(',')
+    else:
+        # The spawned shards get a new random key unless one is given
+        if authkey is None:
+            authkey = new_authkey()
+        addresses = spawn_shards(args.n, authkey, workers=args.w,
+                                 debug_mode=args.d, log_levels=args.l,
+                                 trace_file=args.t, trace_sample=args.s,
+                                 snapshot_dir=args.m,
+                                 tick_ring=args.r, order_queue=args.o,
+                                 clock_speed=args.x,
+                                 clock_epoch=clock_epoch)
+    sx = Gateway(addresses, authkey, exchange=sx)
+elif args.t is not None:
+    order_tracer.configure_dump(args.t, args.s)
+
 sx.start()
 
 app = Flask(__name__)
 api = Api(app)
 
+http_request_seconds = Histogram('ustockmarket_http_request_seconds',
+                                 'Duration of the HTTP request handlers.',
+                                 ('endpoint',))
+
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    # The orders are traced from here (see tracing.STAGES), so their latency
+    # includes the request parsing and, on cluster mode, the gateway hop
+    g.received = order_tracer.now()
+
+
+@app.after_request
+def observe_request_duration(response):
+    if 'request_start' in g:
+        http_request_seconds.labels(request.endpoint or 'unknown').observe(
+            time.perf_counter() - g.request_start)
+    return response
+
+
+def cached_response(cached, message):
+    """Builds the response of a cached JSON body.
+
+    Args:
+        cached (tuple): The ETag and the JSON encoded body of the response, or
+            None if the requested resource doesn't exist.
+        message (str): The error message if the resource doesn't exist.
+
+    Returns:
+        The response, which will be a `304 Not Modified` if the request's
+        `If-None-Match` header matches the ETag.
+
+    """
+    if cached is None:
+        return bad_request(message)
+
+    etag, body = cached
+    response = app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    return response.make_conditional(request)
+
 
 # ====== System methods ======
 # -Erases all the database
@@ -65,6 +243,36 @@ class CleanHistory(Resource):
 
 api.add_resource(CleanHistory, '/clean_history')
 
+
+# -Exchange internal metrics (Prometheus text format)
+class Metrics(Resource):
+    def get(self):
+        return app.response_class(REGISTRY.render(), mimetype=None,
+                                  content_type=CONTENT_TYPE)
+
+
+api.add_resource(Metrics, '/metrics')
+
+
+# -Totals of money and shares (conserved by the matching)
+class Audit(Resource):
+    def get(self):
+        log.debug('/audit (get): ')
+        return sx.audit()
+
+
+api.add_resource(Audit, '/audit')
+
+# -Order rate limits (only set on the command line, see -q and -Q)
+
+class RateLimits(Resource):
+    def get(self, trader=None):
+        log.debug('/rate_limits (get): %s', trader)
+        return sx.get_rate_limits(trader)
+
+
+api.add_resource(RateLimits, '/rate_limits', '/rate_limits/<trader>')
+
 # ====== Trader methods ======
 # -Registers a new trader
 register_trader_parser = reqparse.RequestParser()
@@ -90,7 +298,7 @@ class RegisterTrader(Resource):
 
     def put(self):
         args = register_trader_parser.parse_args()
-        log.debug('/register_trader (put): ' + str(args))
+        log.debug('/register_trader (put): %s', args)
         return sx.register_trader(**args)
 
     def post(self):
@@ -99,6 +307,33 @@ class RegisterTrader(Resource):
 
 api.add_resource(RegisterTrader, '/register_trader')
 
+# -Registers multiple traders at once
+register_traders_parser = reqparse.RequestParser()
+register_traders_parser.add_argument('names', type=str, action='append',
+                                     help='The names of the new traders '
+                                          '(optional).')
+
+register_traders_parser.add_argument('count', type=int, help='The number of '
+                                     'random named traders to be created '
+                                     'when no names are given.')
+
+register_traders_parser.add_argument('wallet', type=str, help='The initial '
+                                     'ammount of money of each trader '
+                                     '(optional).')
+
+
+class RegisterTraders(Resource):
+    def put(self):
+        args = register_traders_parser.parse_args()
+        log.debug('/register_traders (put/post): %s', args)
+        return sx.register_traders(**args)
+
+    def post(self):
+        return self.put()
+
+
+api.add_resource(RegisterTraders, '/register_traders')
+
 # -List traders
 
 
@@ -112,10 +347,42 @@ api.add_resource(ListTraders, '/list_traders')
 
 
 # -Get trader status
+trader_status_parser = reqparse.RequestParser()
+trader_status_parser.add_argument('wallet_since', type=int, location='args',
+                                  help='The wallet history cursor (optional).')
+
+trader_status_parser.add_argument('orders_since', type=int, location='args',
+                                  help='The orders cursor (optional).')
+
+trader_status_parser.add_argument('limit', type=int, location='args',
+                                  help='The maximum number of wallet history '
+                                       'entries and orders (optional).')
+
+trader_status_parser.add_argument('fields', type=str, location='args',
+                                  help='The comma separated fields to be '
+                                       'retrieved (optional).')
+
+
 class TraderStatus(Resource):
     def get(self, name):
-        log.debug('/trader_status/%s (get): ' % (name))
-        return sx.get_trader_status(name)
+        args = trader_status_parser.parse_args()
+        log.debug('/trader_status/%s (get): %s', name, args)
+        if any(value is not None for value in args.values()):
+            return sx.get_trader_status(name, **args)
+
+        response = cached_response(sx.get_trader_status_json(name),
+                                   'The trader doesn\'t exist.')
+        if isinstance(response, tuple):
+            return response
+
+        # The remaining rate limits change on every order, so they are sent
+        # apart from the cached body
+        limits = sx.get_trader_limits(name)
+        if limits['trader_burst'] != str(None):
+            response.headers['X-RateLimit-Limit'] = limits['trader_burst']
+            response.headers['X-RateLimit-Remaining'] = \
+                limits['trader_tokens']
+        return response
 
 
 api.add_resource(TraderStatus, '/trader_status/<name>')
@@ -146,8 +413,8 @@ class SendOrder(Resource):
         if args['price'] is not None:
             args['price'] = Decimal(args['price'])
 
-        log.debug('/send_order (put/post): ' + str(args))
-        return sx.send_order(**args)
+        log.debug('/send_order (put/post): %s', args)
+        return sx.send_order(received=g.received, **args)
 
     def post(self):
         return self.put()
@@ -155,13 +422,24 @@ class SendOrder(Resource):
 
 api.add_resource(SendOrder, '/send_order')
 
+# -Get an order (e.g. after an asynchronous acknowledgement)
+
+
+class GetOrder(Resource):
+    def get(self, order_id):
+        log.debug('/order/%s (get): ', order_id)
+        return sx.get_order(order_id)
+
+
+api.add_resource(GetOrder, '/order/<order_id>')
+
 # -Assign equities to multiple traders
 
 
 class EditPositions(Resource):
     def put(self):
         args = request.get_json()
-        log.debug('/edit_positions (put/post): ' + str(args))
+        log.debug('/edit_positions (put/post): %s', args)
         return sx.edit_positions(args)
 
     def post(self):
@@ -170,6 +448,35 @@ class EditPositions(Resource):
 
 api.add_resource(EditPositions, '/edit_positions')
 
+
+# -Get an order latency trace
+class OrderTrace(Resource):
+    def get(self, order_id):
+        log.debug('/trace/%s (get): ', order_id)
+        return sx.get_order_trace(order_id)
+
+
+api.add_resource(OrderTrace, '/trace/<order_id>')
+
+# -Get the slowest order latency traces
+traces_parser = reqparse.RequestParser()
+traces_parser.add_argument('count', type=int, default=10, location='args',
+                           help='The number of traces (default=10).')
+
+traces_parser.add_argument('stage', type=str, location='args',
+                           help='The stage used to rank the traces '
+                                '(optional).')
+
+
+class SlowestTraces(Resource):
+    def get(self):
+        args = traces_parser.parse_args()
+        log.debug('/traces (get): %s', args)
+        return sx.get_slowest_traces(**args)
+
+
+api.add_resource(SlowestTraces, '/traces')
+
 # ====== OrderBook methods ======
 # -Registers a new security
 
@@ -181,7 +488,7 @@ register_security_parser.add_argument('ticker', type=str, help='The security '
 class RegisterSecurity(Resource):  # FIXME not working ('ticker' recieves None)
     def put(self):
         args = register_security_parser.parse_args()
-        log.debug('/register_security (put/post): ' + str(args))
+        log.debug('/register_security (put/post): %s', args)
         print(args)
         return sx.register_security(args['ticker'])
 
@@ -203,26 +510,252 @@ class ListTickers(Resource):
 api.add_resource(ListTickers, '/list_tickers')
 
 # -Get security price history
+history_parser = reqparse.RequestParser()
+history_parser.add_argument('since', type=int, location='args',
+                            help='The price history cursor (optional).')
+
+history_parser.add_argument('limit', type=int, location='args',
+                            help='The maximum number of price history '
+                                 'entries (optional).')
 
 
 class PriceHistory(Resource):
     def get(self, ticker):
-        log.debug('/price_history/%s (get): ' % (ticker))
-        return sx.get_price_history(ticker)
+        args = history_parser.parse_args()
+        log.debug('/price_history/%s (get): %s', ticker, args)
+        return sx.get_price_history(ticker, **args)
 
 
 api.add_resource(PriceHistory, '/price_history/<ticker>')
 
+# -Get security market statistics
+analytics_parser = reqparse.RequestParser()
+analytics_parser.add_argument('window', type=float, location='args',
+                              help='The length (in seconds) of the time '
+                                   'window, anchored on the last fill '
+                                   '(optional).')
+
+
+class Analytics(Resource):
+    def get(self, ticker):
+        args = analytics_parser.parse_args()
+        log.debug('/analytics/%s (get): %s', ticker, args)
+        return sx.get_analytics(ticker, window=args['window'])
+
+
+api.add_resource(Analytics, '/analytics/<ticker>')
+
+# -Get or set the simulation clock
+clock_parser = reqparse.RequestParser()
+clock_parser.add_argument('speed', type=float, required=True,
+                          help='The simulated seconds per real second.')
+
+
+class Clock(Resource):
+    def get(self):
+        return sx.get_clock()
+
+    def put(self):
+        args = clock_parser.parse_args()
+        log.debug('/clock (put/post): %s', args)
+        return sx.set_clock_speed(args['speed'])
+
+    def post(self):
+        return self.put()
+
+
+api.add_resource(Clock, '/clock')
+
+# -Get the traders' ranking
+leaderboard_parser = reqparse.RequestParser()
+leaderboard_parser.add_argument('limit', type=int, location='args',
+                                help='The number of traders (optional, '
+                                     'default=10).')
+leaderboard_parser.add_argument('by', type=str, location='args',
+                                help='The ranking metric: equity, pnl or '
+                                     'return (optional, default=equity).')
+
+
+class Leaderboard(Resource):
+    def get(self):
+        args = leaderboard_parser.parse_args()
+        log.debug('/leaderboard (get): %s', args)
+        return sx.get_leaderboard(**args)
+
+
+api.add_resource(Leaderboard, '/leaderboard')
+
+# -Set the matching mode of a security
+matching_mode_parser = reqparse.RequestParser()
+matching_mode_parser.add_argument('auction_interval', type=float,
+                                  help='The interval (in seconds) between the '
+                                       'call auctions of the security, or '
+                                       'null for continuous matching.')
+
+
+class MatchingMode(Resource):
+    def put(self, ticker):
+        args = matching_mode_parser.parse_args()
+        log.debug('/matching_mode/%s (put/post): %s', ticker, args)
+        return sx.set_matching_mode(ticker, **args)
+
+    def post(self, ticker):
+        return self.put(ticker)
+
+
+api.add_resource(MatchingMode, '/matching_mode/<ticker>')
+
 # -Get security order book
 
 
 class Book(Resource):
     def get(self, ticker):
-        log.debug('/book/%s (get): ' % (ticker))
-        return sx.get_book(ticker)
+        args = history_parser.parse_args()
+        log.debug('/book/%s (get): %s', ticker, args)
+        if any(value is not None for value in args.values()):
+            return sx.get_book(ticker, **args)
+
+        return cached_response(sx.get_book_json(ticker),
+                               'The ticker doesn\'t exists.')
 
 
 api.add_resource(Book, '/book/<ticker>')
 
+# ====== Debug methods (only with the -p flag) ======
+# On cluster mode they profile the gateway (the request handlers and the calls
+# to the shards), not the matchers, which run on the shard processes
+profiler = SamplingProfiler()
+memory_tracker = MemoryTracker()
+
+# -Start profiling the matcher and the request handlers
+profile_start_parser = reqparse.RequestParser()
+profile_start_parser.add_argument('interval', type=float, default=0.005,
+                                  help='The time (in seconds) between two '
+                                       'samples (default=0.005).')
+
+
+class ProfileStart(Resource):
+    def put(self):
+        args = profile_start_parser.parse_args()
+        log.debug('/debug/profile/start (put/post): %s', args)
+        try:
+            if not profiler.start(**args):
+                return bad_request('The profiler is already running.')
+        except ValueError as error:
+            return bad_request(str(error))
+
+        return good_request('The profiler was started.')
+
+    def post(self):
+        return self.put()
+
+
+# -Stop profiling
+class ProfileStop(Resource):
+    def put(self):
+        log.debug('/debug/profile/stop (put/post): ')
+        if not profiler.stop():
+            return bad_request('The profiler isn\'t running.')
+
+        return good_request(profiler.stats())
+
+    def post(self):
+        return self.put()
+
+
+# -Download the profiling stats
+profile_parser = reqparse.RequestParser()
+profile_parser.add_argument('top', type=int, default=30, location='args',
+                            help='The number of functions (default=30).')
+
+profile_parser.add_argument('format', type=str, default='json',
+                            location='args', help='"json" for the summary by '
+                            'function or "collapsed" for the collapsed stacks '
+                            '(default=json).')
+
+profile_parser.add_argument('thread', type=str, location='args',
+                            help='The name of the profiled thread, such as '
+                                 '"Matcher-0" for a matcher worker '
+                                 '(optional).')
+
+
+class Profile(Resource):
+    def get(self):
+        args = profile_parser.parse_args()
+        log.debug('/debug/profile (get): %s', args)
+        if args['format'] == 'collapsed':
+            response = app.response_class(profiler.collapsed(),
+                                          mimetype='text/plain')
+            response.headers['Content-Disposition'] = \
+                'attachment; filename=profile.collapsed'
+            return response
+
+        return good_request(profiler.stats(top=args['top'],
+                                           thread=args['thread']))
+
+
+# -Start tracing the memory allocations
+memory_start_parser = reqparse.RequestParser()
+memory_start_parser.add_argument('frames', type=int, default=1,
+                                 help='The number of frames stored for each '
+                                      'allocation (default=1).')
+
+
+class MemoryStart(Resource):
+    def put(self):
+        args = memory_start_parser.parse_args()
+        log.debug('/debug/memory/start (put/post): %s', args)
+        try:
+            memory_tracker.start(**args)
+        except ValueError as error:
+            return bad_request(str(error))
+
+        return good_request('The memory tracing was started.')
+
+    def post(self):
+        return self.put()
+
+
+# -Stop tracing the memory allocations
+class MemoryStop(Resource):
+    def put(self):
+        log.debug('/debug/memory/stop (put/post): ')
+        memory_tracker.stop()
+        return good_request('The memory tracing was stopped.')
+
+    def post(self):
+        return self.put()
+
+
+# -Report the top allocators and the live documents
+memory_parser = reqparse.RequestParser()
+memory_parser.add_argument('top', type=int, default=20, location='args',
+                           help='The number of allocators (default=20).')
+
+memory_parser.add_argument('group_by', type=str, default='lineno',
+                           location='args', choices=('lineno', 'filename',
+                                                     'traceback'),
+                           help='How the allocations are grouped '
+                                '(default=lineno).')
+
+
+class Memory(Resource):
+    def get(self):
+        args = memory_parser.parse_args()
+        log.debug('/debug/memory (get): %s', args)
+        return good_request(memory_tracker.report(
+            types=(Order, Fill, Position), **args))
+
+
+if args.p:
+    api.add_resource(ProfileStart, '/debug/profile/start')
+    api.add_resource(ProfileStop, '/debug/profile/stop')
+    api.add_resource(Profile, '/debug/profile')
+    api.add_resource(MemoryStart, '/debug/memory/start')
+    api.add_resource(MemoryStop, '/debug/memory/stop')
+    api.add_resource(Memory, '/debug/memory')
+
 if __name__ == '__main__':
-    app.run(debug=args.d)
+    # Never on Flask's debug mode: its interactive debugger runs arbitrary
+    # code sent by the clients
+    app.run(debug=False)
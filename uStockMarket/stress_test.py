@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""A micro Stock Market Simulator.
+
+This script stress tests the concurrency model of the Stock Exchange.
+
+Several threads send random orders on a few securities while the exchange
+matches them, and the totals of money and shares of all the traders (see
+StockExchange.audit()) are compared before and after the run. Fills only move
+money and shares between traders, so any difference means a lost update.
+
+Warning: the script erases the u_stock_market database.
+
+To see all the execution options, run:
+    $ python stress_test.py -h
+
+.. _uStockMarket Project:
+    https://github.com/luizsol/uStockMarket
+
+"""
+__author__ = 'Luiz Sol'
+__license__ = 'MIT'
+__version__ = '0.0.1'
+__date__ = '2017-10-05'
+__maintainer__ = 'Luiz Sol'
+__email__ = 'luizedusol@gmail.com'
+__status__ = 'Development'
+
+import argparse
+from decimal import Decimal
+import random
+import sys
+import threading
+import time
+
+from u_stock_market import StockExchange, fills, matcher_iterations
+
+parser = argparse.ArgumentParser(description='Stress tests the uStockMarket '
+                                             'concurrency model.')
+parser.add_argument('-t', metavar='--threads', type=int, default=8,
+                    help='The number of order sending threads (default=8).')
+
+parser.add_argument('-n', metavar='--orders', type=int, default=500,
+                    help='The number of orders sent by each thread '
+                         '(default=500).')
+
+parser.add_argument('-k', metavar='--tickers', type=int, default=4,
+                    help='The number of securities (default=4).')
+
+parser.add_argument('-r', metavar='--traders', type=int, default=20,
+                    help='The number of traders (default=20).')
+
+parser.add_argument('-w', metavar='--workers', type=int, default=4,
+                    help='The number of matcher workers (default=4).')
+
+
+def send_orders(sx, traders, tickers, count):
+    """Sends random limit orders around the price of 10.00."""
+    for _ in range(count):
+        sx.send_order(random.choice(traders), random.choice(tickers),
+                      random.choice(('buy', 'sell')), random.randint(1, 50),
+                      price=Decimal(random.randint(900, 1100)) / 100)
+
+
+def main(args):
+    tickers = ['STRS%02d' % (index) for index in range(args.k)]
+    sx = StockExchange(tickers=tickers, debug_mode=False, workers=args.w)
+    traders = sx.register_traders(count=args.r)[0]['data']['traders']
+
+    before = sx.audit()[0]['data']
+    sx.start()
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=send_orders,
+                                args=(sx, traders, tickers, args.n))
+               for _ in range(args.t)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Letting the matcher workers drain the books (including a sweep of all
+    # the books by every worker)
+    time.sleep(2 * sx.matchers.sweep_interval)
+    iterations = matcher_iterations.value
+    while matcher_iterations.value < iterations + 2 * len(sx.matchers.workers):
+        time.sleep(0.1)
+
+    after = sx.audit()[0]['data']
+    print('%d orders and %d fills in %.1f seconds' %
+          (args.t * args.n, fills.value, time.perf_counter() - start))
+    print('before: %s' % (before))
+    print('after:  %s' % (after))
+
+    if before != after:
+        print('FAILED: the money or the shares were not conserved')
+        return 1
+
+    print('OK: the money and the shares were conserved')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(parser.parse_args()))
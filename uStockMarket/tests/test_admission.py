@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""A micro Stock Market Simulator.
+
+This module implements the tests of the order admission control (see the
+admission module).
+
+.. _uStockMarket Project:
+    https://github.com/luizsol/uStockMarket
+
+"""
+__author__ = 'Luiz Sol'
+__license__ = 'MIT'
+__version__ = '0.0.1'
+__date__ = '2017-10-05'
+__maintainer__ = 'Luiz Sol'
+__email__ = 'luizedusol@gmail.com'
+__status__ = 'Development'
+
+import pytest
+
+import admission
+from admission import RateLimiter, TokenBucket
+
+
+@pytest.fixture
+def now(monkeypatch):
+    """A list holding the monotonic time seen by the admission module."""
+    now = [100.0]
+    monkeypatch.setattr(admission.time, 'monotonic', lambda: now[0])
+    return now
+
+
+def test_token_bucket():
+    bucket = TokenBucket(2, burst=3, now=0.0)
+
+    assert [bucket.take(0.0) for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.take(0.0) == 0.5
+    assert bucket.take(0.5) == 0.0
+    assert bucket.refill(100.0) == 3
+
+
+def test_unlimited_by_default(now):
+    limiter = RateLimiter()
+
+    assert all(limiter.admit('alice') is None for _ in range(1000))
+
+
+def test_traders_are_limited_separately(now):
+    limiter = RateLimiter(trader_rate=1, trader_burst=2)
+
+    assert [limiter.admit('alice') for _ in range(3)] == \
+        [None, None, ('trader', 1.0)]
+    assert limiter.admit('bob') is None
+
+    now[0] += 1
+    assert limiter.admit('alice') is None
+    assert limiter.rejected == {'trader': 1, 'global': 0}
+
+
+def test_a_global_rejection_returns_the_trader_token(now):
+    limiter = RateLimiter(trader_rate=1, trader_burst=1, global_rate=1)
+
+    assert limiter.admit('alice') is None
+    assert limiter.admit('bob') == ('global', 1.0)
+    assert float(limiter.status('bob')['trader_tokens']) == 1
+
+
+def test_idle_traders_are_discarded(now):
+    limiter = RateLimiter(trader_rate=1, trader_burst=1, max_traders=2)
+    limiter.admit('alice')
+    limiter.admit('bob')
+
+    now[0] += 10
+    limiter.admit('carol')
+
+    assert set(limiter._traders) == {'carol'}
+
+
+def test_invalid_limits():
+    with pytest.raises(ValueError):
+        RateLimiter(trader_rate=0)
+
+    with pytest.raises(ValueError):
+        RateLimiter(global_rate=1, global_burst=0.5)
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""A micro Stock Market Simulator.
+
+This module implements the tests of the market analytics (see the analytics
+module).
+
+.. _uStockMarket Project:
+    https://github.com/luizsol/uStockMarket
+
+"""
+__author__ = 'Luiz Sol'
+__license__ = 'MIT'
+__version__ = '0.0.1'
+__date__ = '2017-10-05'
+__maintainer__ = 'Luiz Sol'
+__email__ = 'luizedusol@gmail.com'
+__status__ = 'Development'
+
+import math
+
+import numpy as np
+
+from analytics import MarketAnalytics, TickSeries, compute_analytics
+
+
+def series_of(prices, sizes=None, start=0.0):
+    """(TickSeries) A series with one tick per second."""
+    series = TickSeries(capacity=1)
+    series.extend(time=np.arange(len(prices)) + start, price=prices,
+                  size=[1] * len(prices) if sizes is None else sizes,
+                  bid=[price - 1 for price in prices],
+                  ask=[price + 1 for price in prices])
+    return series
+
+
+def test_series_grow_past_their_capacity():
+    series = series_of([10.0, 11.0, 12.0])
+    series.append(3.0, 13.0, 2)
+
+    assert len(series) == 4
+    assert list(series.price) == [10.0, 11.0, 12.0, 13.0]
+    assert list(series.size) == [1, 1, 1, 2]
+    assert math.isnan(series.bid[-1])
+
+
+def test_window_is_anchored_on_the_last_tick():
+    series = series_of([10.0, 11.0, 12.0, 13.0])
+
+    assert series.window() == slice(0, 4)
+    assert series.window(1.5) == slice(2, 4)
+
+
+def test_compute_analytics():
+    result = compute_analytics(series_of([10.0, 20.0, 40.0], [1, 2, 1]))
+
+    assert result['trades'] == '3'
+    assert result['volume'] == '4'
+    assert result['vwap'] == '22.5'
+    assert (result['first'], result['last']) == ('10.0', '40.0')
+    assert (result['high'], result['low']) == ('40.0', '10.0')
+    assert result['return'] == '3.0'
+    assert float(result['mean_log_return']) == \
+        round(math.log(4) / 2, 6)
+    assert float(result['realized_volatility']) == \
+        round(math.sqrt(2) * math.log(2), 6)
+    assert result['spread'] == {'mean': '2.0', 'min': '2.0', 'max': '2.0',
+                                'last': '2.0'}
+
+
+def test_compute_analytics_of_an_empty_window():
+    assert compute_analytics(TickSeries()) == {'window': None,
+                                               'trades': '0',
+                                               'volume': '0'}
+
+
+def test_records_are_merged_by_sequence():
+    loaded = series_of([10.0, 11.0])
+    analytics = MarketAnalytics(lambda ticker: loaded)
+
+    assert analytics.get('AA01')['trades'] == '2'
+
+    # A tick already loaded is ignored
+    analytics.record('AA01', 1, 1.0, 11.0, 1)
+    assert analytics.get('AA01')['trades'] == '2'
+
+    analytics.record('AA01', 2, 2.0, 12.0, 1)
+    assert analytics.get('AA01')['last'] == '12.0'
+
+
+def test_a_gap_in_the_sequence_reloads_the_series():
+    loads = []
+
+    def loader(ticker):
+        loads.append(ticker)
+        return series_of([10.0, 11.0])
+
+    analytics = MarketAnalytics(loader)
+    analytics.get('AA01')
+    analytics.record('AA01', 5, 5.0, 15.0, 1)
+    analytics.get('AA01')
+
+    assert loads == ['AA01', 'AA01']
+
+
+def test_unknown_securities():
+    assert MarketAnalytics(lambda ticker: None).get('ZZ99') is None
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""A micro Stock Market Simulator.
+
+This module implements the tests of the call auction clearing (see the
+auction module).
+
+.. _uStockMarket Project:
+    https://github.com/luizsol/uStockMarket
+
+"""
+__author__ = 'Luiz Sol'
+__license__ = 'MIT'
+__version__ = '0.0.1'
+__date__ = '2017-10-05'
+__maintainer__ = 'Luiz Sol'
+__email__ = 'luizedusol@gmail.com'
+__status__ = 'Development'
+
+import numpy as np
+
+from auction import clear_auction, pair_fills
+
+
+def test_clear_auction_maximizes_the_executed_volume():
+    price, volume, bid_fills, ask_fills = clear_auction(
+        [105, 103, 100], [10, 10, 10], [99, 102, 104], [10, 10, 10])
+
+    assert (price, volume) == (102, 20)
+    assert list(bid_fills) == [10, 10, 0]
+    assert list(ask_fills) == [10, 10, 0]
+
+
+def test_clear_auction_allocates_by_price_time_priority():
+    price, volume, bid_fills, ask_fills = clear_auction(
+        [100, 101, 100], [5, 5, 5], [100], [8])
+
+    assert (price, volume) == (100, 8)
+    # The best price first, then the earliest order
+    assert list(bid_fills) == [3, 5, 0]
+    assert list(ask_fills) == [8]
+
+
+def test_clear_auction_without_crossing_orders():
+    price, volume, bid_fills, ask_fills = clear_auction([99], [10], [100],
+                                                        [10])
+
+    assert (price, volume) == (None, 0)
+    assert list(bid_fills) == [0]
+    assert list(ask_fills) == [0]
+
+
+def test_clear_auction_with_market_orders_uses_the_reference_price():
+    price, volume, bid_fills, ask_fills = clear_auction(
+        [0], [7], [0], [4], bid_market=[True], ask_market=[True],
+        reference_price=250)
+
+    assert (price, volume) == (250, 4)
+    assert list(bid_fills) == [4]
+    assert list(ask_fills) == [4]
+
+
+def test_clear_auction_breaks_ties_by_the_reference_price():
+    price, volume, _, _ = clear_auction([110], [10], [90], [10],
+                                        reference_price=108)
+
+    assert (price, volume) == (110, 10)
+
+
+def test_pair_fills():
+    bids, asks, sizes = pair_fills([5, 0, 7], [3, 9])
+
+    assert list(zip(bids, asks, sizes)) == [(0, 0, 3), (0, 1, 2), (2, 1, 7)]
+    assert sizes.sum() == 12
+
+
+def test_pair_fills_of_an_empty_auction():
+    bids, asks, sizes = pair_fills(np.zeros(2, dtype=np.int64),
+                                   np.zeros(1, dtype=np.int64))
+
+    assert len(bids) == len(asks) == len(sizes) == 0
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""A micro Stock Market Simulator.
+
+This module implements the tests of the simulation clock (see the clock
+module).
+
+.. _uStockMarket Project:
+    https://github.com/luizsol/uStockMarket
+
+"""
+__author__ = 'Luiz Sol'
+__license__ = 'MIT'
+__version__ = '0.0.1'
+__date__ = '2017-10-05'
+__maintainer__ = 'Luiz Sol'
+__email__ = 'luizedusol@gmail.com'
+__status__ = 'Development'
+
+from datetime import datetime, timedelta
+
+import pytest
+
+import clock
+from clock import SimulatedClock, WallClock
+
+
+class FakeTime(object):
+    """A wall and a monotonic clock that only move when told to."""
+
+    def __init__(self):
+        self.wall = 1000000.0
+        self.real = 50.0
+
+    def time(self):
+        return self.wall
+
+    def monotonic(self):
+        return self.real
+
+    def advance(self, seconds):
+        self.wall += seconds
+        self.real += seconds
+
+
+@pytest.fixture
+def fake_time(monkeypatch):
+    fake = FakeTime()
+    monkeypatch.setattr(clock, 'time', fake)
+    return fake
+
+
+def test_wall_clock():
+    assert WallClock().real_seconds(3) == 3
+    assert WallClock().to_dict()['mode'] == 'wall'
+
+
+def test_simulated_clock_runs_at_its_speed(fake_time):
+    start = datetime(2017, 10, 5)
+    simulated = SimulatedClock(60, start=start)
+    monotonic = simulated.monotonic()
+
+    fake_time.advance(2)
+
+    assert simulated.now() == start + timedelta(minutes=2)
+    assert simulated.monotonic() - monotonic == 120
+    assert simulated.real_seconds(120) == 2
+
+
+def test_monotonic_time_goes_on_from_the_wall_clock(fake_time):
+    assert SimulatedClock(10).monotonic() == fake_time.real
+
+
+def test_clocks_sharing_an_epoch_agree(fake_time):
+    start = datetime(2017, 10, 5)
+    first = SimulatedClock(10, start=start, epoch=fake_time.wall)
+
+    fake_time.advance(3)
+    second = SimulatedClock(10, start=start, epoch=fake_time.wall - 3)
+
+    assert first.now() == second.now() == start + timedelta(seconds=30)
+
+
+def test_set_speed(fake_time):
+    start = datetime(2017, 10, 5)
+    simulated = SimulatedClock(10, start=start)
+
+    fake_time.advance(2)
+    simulated.set_speed(1)
+    fake_time.advance(5)
+
+    assert simulated.now() == start + timedelta(seconds=25)
+
+
+def test_set_speed_from_a_past_wall_time(fake_time):
+    start = datetime(2017, 10, 5)
+    simulated = SimulatedClock(10, start=start)
+
+    fake_time.advance(4)
+    # The new speed applies since one second ago
+    simulated.set_speed(1, at=fake_time.wall - 1)
+
+    assert simulated.now() == start + timedelta(seconds=31)
+
+
+def test_invalid_speeds():
+    for speed in (0, -1, float('inf')):
+        with pytest.raises(ValueError):
+            SimulatedClock(speed)
+
+    with pytest.raises(ValueError):
+        SimulatedClock(1).set_speed(0)
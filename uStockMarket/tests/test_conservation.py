@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""A micro Stock Market Simulator.
+
+This module implements the conservation test of the Stock Exchange (the
+automated counterpart of stress_test.py).
+
+Random orders are matched on a few securities and the totals of money and
+shares of all the traders (see StockExchange.audit()) are compared before
+and after the matching: fills only move money and shares between traders,
+so any difference means a lost or a duplicated update.
+
+The database is replaced by mongomock (the test is skipped if it isn't
+installed), which isn't thread safe, so the books are matched by the test
+itself instead of the matcher workers.
+
+.. _uStockMarket Project:
+    https://github.com/luizsol/uStockMarket
+
+"""
+__author__ = 'Luiz Sol'
+__license__ = 'MIT'
+__version__ = '0.0.1'
+__date__ = '2017-10-05'
+__maintainer__ = 'Luiz Sol'
+__email__ = 'luizedusol@gmail.com'
+__status__ = 'Development'
+
+from decimal import Decimal
+import importlib
+import random
+
+import pytest
+
+mongomock = pytest.importorskip('mongomock')
+mongoengine = pytest.importorskip('mongoengine')
+
+TICKERS = ['CONS00', 'CONS01', 'CONS02']
+
+
+@pytest.fixture
+def usm(monkeypatch, tmp_path):
+    """The u_stock_market module, connected to a mongomock database."""
+    # The module log is written to the current directory
+    monkeypatch.chdir(tmp_path)
+
+    connect = mongoengine.connect
+
+    def mock_connect(db=None, alias='default', **kwargs):
+        kwargs.setdefault('mongo_client_class', mongomock.MongoClient)
+        return connect(db, alias=alias, **kwargs)
+
+    monkeypatch.setattr(mongoengine, 'connect', mock_connect)
+    return importlib.import_module('u_stock_market')
+
+
+def send_orders(usm, sx, traders, count, match):
+    """Sends random limit orders around the price of 10.00, matching the
+    books every few orders."""
+    for index in range(count):
+        sx.send_order(random.choice(traders), random.choice(TICKERS),
+                      random.choice(('buy', 'sell')), random.randint(1, 50),
+                      price=Decimal(random.randint(900, 1100)) / 100)
+        if index % 10 == 9:
+            for ticker in TICKERS:
+                match(usm.OrderBook.for_matching(ticker))
+
+
+@pytest.mark.parametrize('match', [
+    lambda book: book.match_orders(),
+    lambda book: book.run_auction()], ids=['continuous', 'auction'])
+def test_matching_conserves_money_and_shares(usm, match):
+    random.seed(2017)
+    sx = usm.StockExchange(tickers=TICKERS, workers=1)
+    traders = sx.register_traders(count=8)[0]['data']['traders']
+
+    before = sx.audit()[0]['data']
+    send_orders(usm, sx, traders, 300, match)
+    for ticker in TICKERS:
+        match(usm.OrderBook.for_matching(ticker))
+    after = sx.audit()[0]['data']
+
+    assert usm.Fill.objects.count() > 0
+    assert after == before
+    assert after['negative_wallets'] == after['negative_positions'] == '0'
+
+
+def test_the_price_history_records_every_fill(usm):
+    random.seed(1005)
+    sx = usm.StockExchange(tickers=TICKERS, workers=1)
+    traders = sx.register_traders(count=8)[0]['data']['traders']
+
+    send_orders(usm, sx, traders, 100, lambda book: book.match_orders())
+
+    for ticker in TICKERS:
+        history = usm.OrderBook.objects.get(ticker=ticker).price_history
+        fills = usm.Fill.objects(ticker=ticker).order_by('id')
+        assert [(datum.value, datum.amount) for datum in history] == \
+            [(fill.price, fill.size) for fill in fills]
+
+
+def test_the_resting_orders_mirror_the_database(usm):
+    random.seed(1017)
+    sx = usm.StockExchange(tickers=TICKERS, workers=1)
+    traders = sx.register_traders(count=8)[0]['data']['traders']
+
+    send_orders(usm, sx, traders, 100, lambda book: book.match_orders())
+
+    for ticker in TICKERS:
+        for side, order_type in (('buy', 'Bid'), ('sell', 'Ask')):
+            active = {order.id: order.current_size for order in
+                      usm.Order.objects(ticker=ticker, order_type=order_type,
+                                        canceled=False, filled=False)}
+            resting = {}
+            for slot in usm.resting_orders.resting(ticker, side):
+                order = usm.resting_orders.get(int(slot))
+                resting[usm.ObjectId(order['ref'])] = order['current_size']
+
+            assert resting == active
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""A micro Stock Market Simulator.
+
+This module implements the tests of the server side leaderboard (see the
+leaderboard module).
+
+.. _uStockMarket Project:
+    https://github.com/luizsol/uStockMarket
+
+"""
+__author__ = 'Luiz Sol'
+__license__ = 'MIT'
+__version__ = '0.0.1'
+__date__ = '2017-10-05'
+__maintainer__ = 'Luiz Sol'
+__email__ = 'luizedusol@gmail.com'
+__status__ = 'Development'
+
+import pytest
+
+from leaderboard import Leaderboard
+
+
+def accounts(**changes):
+    """(dict) The accounts of two traders, as loaded from the database."""
+    loaded = {'names': ['alice', 'bob'],
+              'wallets': [1000, 500],
+              'tickers': ['AA01'],
+              'prices': [10],
+              'positions': [('alice', 'AA01', 10), ('bob', 'AA01', 100)],
+              'trades': [],
+              'watermark': None}
+    loaded.update(changes)
+    return loaded
+
+
+def test_top_marks_the_traders_to_market():
+    board = Leaderboard(lambda: accounts())
+
+    assert board.top() == (2, [('bob', 1500, 0, 0.0),
+                               ('alice', 1100, 0, 0.0)])
+
+
+def test_fills_move_the_prices_and_the_positions():
+    board = Leaderboard(lambda: accounts())
+    board.top()
+
+    # A fill doesn't change the equity of its traders (they exchange money
+    # and shares worth the same), only the new price does
+    board.record('AA01', 'alice', 'bob', 10, 20)
+    assert board.top() == (2, [('bob', 2500, 0, 0.0),
+                               ('alice', 1200, 0, 0.0)])
+
+    # The shares traded by alice at 20 are now worth 30
+    board.record('AA01', 'alice', 'bob', 1, 30)
+    assert board.top(by='pnl') == (
+        2, [('alice', 1400, 100, pytest.approx(100 / 1300)),
+            ('bob', 3400, -100, pytest.approx(-100 / 3500))])
+
+
+def test_fills_are_ignored_until_the_first_load():
+    loads = []
+
+    def loader():
+        loads.append(True)
+        return accounts()
+
+    board = Leaderboard(loader)
+    board.record('AA01', 'alice', 'bob', 10, 20)
+
+    assert board.top()[1][0] == ('bob', 1500, 0, 0.0)
+    assert len(loads) == 1
+
+
+def test_unknown_traders_invalidate_the_accounts():
+    loads = []
+
+    def loader():
+        loads.append(True)
+        return accounts()
+
+    board = Leaderboard(loader)
+    board.top()
+    board.record('AA01', 'alice', 'carol', 1, 10)
+    board.top()
+
+    assert len(loads) == 2
+
+
+def test_accounts_older_than_max_age_are_reloaded():
+    loads = []
+
+    def loader():
+        loads.append(True)
+        return accounts()
+
+    board = Leaderboard(loader, max_age=0)
+    board.top()
+    board.top()
+
+    assert len(loads) == 2
+
+
+def test_top_limits_the_ranking():
+    board = Leaderboard(lambda: accounts())
+
+    assert board.top(count=1) == (2, [('bob', 1500, 0, 0.0)])
+    assert board.top(count=0) == (2, [])
+
+
+def test_top_rejects_unknown_metrics():
+    board = Leaderboard(lambda: accounts())
+
+    with pytest.raises(ValueError):
+        board.top(by='wallet')
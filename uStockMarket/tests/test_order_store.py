@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""A micro Stock Market Simulator.
+
+This module implements the tests of the compact store of resting orders (see
+the order_store module).
+
+.. _uStockMarket Project:
+    https://github.com/luizsol/uStockMarket
+
+"""
+__author__ = 'Luiz Sol'
+__license__ = 'MIT'
+__version__ = '0.0.1'
+__date__ = '2017-10-05'
+__maintainer__ = 'Luiz Sol'
+__email__ = 'luizedusol@gmail.com'
+__status__ = 'Development'
+
+import pytest
+
+from order_store import ASK, BID, OrderStore
+
+
+def test_sides_are_sorted_by_price_time_priority():
+    store = OrderStore(capacity=1)
+    first = store.add('alice', 'AA01', 'buy', 10, price=100)
+    better = store.add('bob', 'AA01', 'buy', 10, price=101)
+    second = store.add('carol', 'AA01', 'buy', 10, price=100)
+    market = store.add('dave', 'AA01', 'buy', 10, market_order=True)
+    ask = store.add('erin', 'AA01', 'sell', 10, price=99)
+
+    assert list(store.resting('AA01', 'buy')) == [market, better, first,
+                                                  second]
+    assert store.top('AA01', 'buy') == market
+    assert store.top('AA01', 'buy', limit_only=True) == better
+    assert list(store.resting('AA01', 'sell')) == [ask]
+    assert store.top('BB02', 'sell') is None
+
+
+def test_filled_and_canceled_orders_leave_their_book():
+    store = OrderStore()
+    first = store.add('alice', 'AA01', 'sell', 10, price=100)
+    second = store.add('bob', 'AA01', 'sell', 10, price=100)
+
+    assert store.fill(first, 4) == 6
+    assert store.top('AA01', 'sell') == first
+    assert store.fill(first, 6) == 0
+    assert store.get(first)['filled']
+    assert store.top('AA01', 'sell') == second
+
+    assert store.cancel(second)
+    assert not store.cancel(second)
+    assert store.top('AA01', 'sell') is None
+
+    with pytest.raises(ValueError):
+        store.fill(second, 11)
+
+
+def test_removed_slots_are_reused():
+    store = OrderStore()
+    slot = store.add('alice', 'AA01', 'buy', 10, price=100, ref=b'a' * 12)
+    store.remove(slot)
+
+    assert len(store) == 0
+    assert store.get(slot) is None
+    with pytest.raises(KeyError):
+        store.remove(slot)
+
+    assert store.add('bob', 'AA01', 'buy', 10, price=100) == slot
+    # The slot now holds another order
+    with pytest.raises(KeyError):
+        store.remove(slot, ref=b'a' * 12)
+
+
+def test_references_keep_their_null_bytes():
+    store = OrderStore()
+    ref = b'\x01' * 10 + b'\x00\x00'
+    slot = store.add('alice', 'AA01', 'buy', 10, price=100, ref=ref)
+
+    assert store.ref(slot) == ref
+    store.remove(slot, ref=ref)
+
+
+def test_add_many():
+    store = OrderStore(capacity=2)
+    slot = store.add('alice', 'AA01', 'buy', 10, price=100)
+    store.remove(slot)
+
+    slots = store.add_many(['bob', 'alice', 'bob'], 'AA01', [BID, ASK, BID],
+                           [1, 2, 3], [100, 105, 102])
+
+    # The released slot is used first
+    assert slot in slots
+    assert len(store) == 3
+    assert [store.get(int(slot))['trader'] for slot in slots] == \
+        ['bob', 'alice', 'bob']
+    assert list(store.resting('AA01', 'buy')) == [slots[2], slots[0]]
+    assert store.top('AA01', 'sell') == slots[1]
+
+
+def test_add_many_validates_all_the_orders():
+    store = OrderStore()
+
+    for sides, sizes, prices in (([BID, 7], [1, 1], [1, 1]),
+                                 ([BID, BID], [1, 0], [1, 1]),
+                                 ([BID, ASK], [1, 1], [1, 0])):
+        with pytest.raises(ValueError):
+            store.add_many(['alice', 'bob'], 'AA01', sides, sizes, prices)
+
+    with pytest.raises(ValueError):
+        store.add_many(['alice'], 'AA01', [BID, BID], [1, 1], [1, 1])
+
+    assert len(store) == 0
+
+
+def test_invalid_orders():
+    store = OrderStore()
+
+    for side, size, price in (('hold', 1, 100), ('buy', 0, 100),
+                              ('sell', 1, None)):
+        with pytest.raises(ValueError):
+            store.add('alice', 'AA01', side, size, price=price)
+
+
+def test_clear():
+    store = OrderStore()
+    store.add('alice', 'AA01', 'buy', 10, price=100)
+    store.clear()
+
+    assert len(store) == 0
+    assert store.top('AA01', 'buy') is None
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""A micro Stock Market Simulator.
+
+This module implements the tests of the response cache (see the
+response_cache module).
+
+.. _uStockMarket Project:
+    https://github.com/luizsol/uStockMarket
+
+"""
+__author__ = 'Luiz Sol'
+__license__ = 'MIT'
+__version__ = '0.0.1'
+__date__ = '2017-10-05'
+__maintainer__ = 'Luiz Sol'
+__email__ = 'luizedusol@gmail.com'
+__status__ = 'Development'
+
+import json
+
+from response_cache import ResponseCache
+
+
+def builder(data, dependencies):
+    """A build function that counts its calls."""
+    def build():
+        build.calls += 1
+        return data, dependencies
+    build.calls = 0
+    return build
+
+
+def test_responses_are_cached_until_invalidated():
+    cache = ResponseCache()
+    build = builder({'price': '1.00'}, [('book', 'AA01')])
+
+    etag, body = cache.get(('book', 'AA01'), build)
+    assert json.loads(body) == {'success': True, 'data': {'price': '1.00'}}
+    assert cache.get(('book', 'AA01'), build) == (etag, body)
+    assert build.calls == 1
+
+    cache.invalidate(('book', 'AA01'))
+    cache.get(('book', 'AA01'), build)
+    assert build.calls == 2
+    assert cache.version(('book', 'AA01')) == 1
+
+
+def test_other_keys_dont_invalidate_a_response():
+    cache = ResponseCache()
+    build = builder({}, [('trader', 'alice')])
+    cache.get(('trader', 'alice'), build)
+
+    cache.invalidate(('trader', 'bob'))
+    cache.get(('trader', 'alice'), build)
+
+    assert build.calls == 1
+
+
+def test_missing_resources_arent_cached():
+    cache = ResponseCache()
+    build = builder(None, ())
+
+    assert cache.get(('book', 'ZZ99'), build) is None
+    assert cache.get(('book', 'ZZ99'), build) is None
+    assert build.calls == 2
+
+
+def test_a_build_raced_by_a_write_isnt_cached():
+    cache = ResponseCache()
+
+    def build():
+        build.calls += 1
+        # A fill settled while the response was built
+        cache.invalidate(('book', 'AA01'))
+        return {}, [('book', 'AA01')]
+    build.calls = 0
+
+    cache.get(('book', 'AA01'), build)
+    cache.get(('book', 'AA01'), build)
+
+    assert build.calls == 2
+
+
+def test_clear_and_eviction():
+    cache = ResponseCache(max_entries=1)
+    first = builder({}, [('book', 'AA01')])
+    second = builder({}, [('book', 'BB02')])
+
+    cache.get(('book', 'AA01'), first)
+    cache.get(('book', 'BB02'), second)
+    cache.get(('book', 'AA01'), first)
+    assert first.calls == 2
+
+    cache.clear()
+    cache.get(('book', 'AA01'), first)
+    assert first.calls == 3
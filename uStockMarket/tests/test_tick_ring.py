@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""A micro Stock Market Simulator.
+
+This module implements the tests of the memory-mapped tick ring (see the
+tick_ring module).
+
+.. _uStockMarket Project:
+    https://github.com/luizsol/uStockMarket
+
+"""
+__author__ = 'Luiz Sol'
+__license__ = 'MIT'
+__version__ = '0.0.1'
+__date__ = '2017-10-05'
+__maintainer__ = 'Luiz Sol'
+__email__ = 'luizedusol@gmail.com'
+__status__ = 'Development'
+
+import pytest
+
+from tick_ring import TickRingReader, TickRingWriter
+
+
+@pytest.fixture
+def writer(tmp_path):
+    writer = TickRingWriter(str(tmp_path / 'ticks'), capacity=4,
+                            price_scale=1000)
+    yield writer
+    writer.close()
+
+
+def test_ticks_are_read_in_order(writer):
+    reader = TickRingReader(writer.path)
+    writer.write('AA01', 10500, 3, time_ns=1)
+    writer.write('BB02', 20000, 1, time_ns=2)
+
+    ticks = reader.poll()
+
+    assert list(ticks['seq']) == [1, 2]
+    assert list(ticks['price']) == [10500, 20000]
+    assert [reader.ticker(tick_id) for tick_id in ticks['ticker_id']] == \
+        ['AA01', 'BB02']
+    assert reader.price_scale == 1000
+    assert len(reader.poll()) == 0
+
+
+def test_readers_start_at_the_head_unless_told_otherwise(writer):
+    writer.write('AA01', 1, 1)
+
+    assert len(TickRingReader(writer.path).poll()) == 0
+    assert list(TickRingReader(writer.path, from_start=True).poll()['seq']) \
+        == [1]
+
+
+def test_batches_stop_at_the_end_of_the_ring(writer):
+    reader = TickRingReader(writer.path)
+    for price in range(6):
+        writer.write('AA01', price, 1)
+
+    # The ring keeps the last 4 ticks
+    assert list(reader.poll()['seq']) == [3, 4]
+    assert list(reader.poll()['seq']) == [5, 6]
+    assert reader.lost == 2
+
+
+def test_poll_max_count(writer):
+    reader = TickRingReader(writer.path)
+    for price in range(3):
+        writer.write('AA01', price, 1)
+
+    assert list(reader.poll(max_count=2)['seq']) == [1, 2]
+    assert list(reader.wait(timeout=0)['seq']) == [3]
+    assert len(reader.wait(timeout=0)) == 0
+
+
+def test_invalid_ring(tmp_path):
+    path = tmp_path / 'invalid'
+    path.write_bytes(b'\0' * 128)
+
+    with pytest.raises(ValueError):
+        TickRingReader(str(path))
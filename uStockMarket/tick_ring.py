@@ -0,0 +1,306 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""A micro Stock Market Simulator.
+
+This module implements a memory-mapped ring buffer of ticks (fills), through
+which the exchange delivers its ticks to consumers on the same host.
+
+The exchange is the single writer of the ring (see TickRingWriter) and any
+number of processes can map the same file and read it (see TickRingReader)
+without any server load: the reader library returns each batch of new ticks
+as a NumPy view of the mapped file, with no copy nor parsing.
+
+File layout: a 64 bytes header (see HEADER_DTYPE), followed by `capacity`
+records (see TICK_DTYPE). The n-th tick (counting from 1) is stored on the
+record `(n - 1) % capacity` and the header's `write_seq` is the sequence
+number of the last completely written tick. The ticker of each tick is
+identified by an integer id, resolved through a JSON sidecar file (the ring
+path followed by `.tickers`) that lists the tickers by id.
+
+Prices are fixed-point integers: a price is `price / price_scale`.
+
+Example:
+    >>> reader = TickRingReader('/dev/shm/ustockmarket.ticks')
+    >>> while True:
+    ...     ticks = reader.poll()
+    ...     for tick in ticks:
+    ...         print(reader.ticker(tick['ticker_id']),
+    ...               tick['price'] / reader.price_scale, tick['size'])
+
+Attributes:
+    HEADER_DTYPE (numpy.dtype): the layout of the header
+    TICK_DTYPE (numpy.dtype): the layout of each tick record
+
+.. _uStockMarket Project:
+    https://github.com/luizsol/uStockMarket
+
+"""
+__author__ = 'Luiz Sol'
+__license__ = 'MIT'
+__version__ = '0.0.1'
+__date__ = '2017-10-05'
+__maintainer__ = 'Luiz Sol'
+__email__ = 'luizedusol@gmail.com'
+__status__ = 'Development'
+
+import json
+import mmap
+import os
+import threading
+import time
+
+import numpy as np
+
+MAGIC = b'USMTICK1'
+
+HEADER_SIZE = 64
+
+HEADER_DTYPE = np.dtype([('magic', 'S8'),
+                         ('record_size', '<u8'),
+                         ('capacity', '<u8'),
+                         ('price_scale', '<u8'),
+                         ('write_seq', '<u8'),
+                         ('reserved', '<u8', 3)])
+
+TICK_DTYPE = np.dtype([('seq', '<u8'),
+                       ('time_ns', '<i8'),
+                       ('price', '<i8'),
+                       ('size', '<i8'),
+                       ('ticker_id', '<u4'),
+                       ('reserved', '<u4')])
+
+
+def _tickers_path(path):
+    """(str) The path of the ticker table of a ring."""
+    return path + '.tickers'
+
+
+class TickRingWriter(object):
+    """The writer of a tick ring.
+
+    Attributes:
+        path (str): The path of the ring file.
+        capacity (int): The number of ticks kept by the ring.
+        price_scale (int): The number of price units per currency unit.
+
+    """
+
+    def __init__(self, path, capacity=65536, price_scale=100):
+        """The class constructor.
+
+        The ring file is (re)created and the ticks of a previous ring are
+        discarded.
+
+        Args:
+            path (str): The path of the ring file (preferably on a memory
+                backed file system, such as /dev/shm).
+
+        Keyword Args:
+            capacity (int, default=65536): The number of ticks kept by the
+                ring.
+            price_scale (int, default=100): The number of price units per
+                currency unit.
+
+        """
+        self.path = path
+        self.capacity = capacity
+        self.price_scale = price_scale
+        self._ticker_ids = {}
+        self._lock = threading.Lock()
+
+        self._write_tickers([])
+
+        size = HEADER_SIZE + capacity * TICK_DTYPE.itemsize
+        with open(path, 'wb') as f:
+            f.truncate(size)
+
+        with open(path, 'r+b') as f:
+            self._mmap = mmap.mmap(f.fileno(), size)
+
+        self._header = np.ndarray((), dtype=HEADER_DTYPE, buffer=self._mmap)
+        self._ticks = np.ndarray((capacity,), dtype=TICK_DTYPE,
+                                 buffer=self._mmap, offset=HEADER_SIZE)
+
+        self._header['record_size'] = TICK_DTYPE.itemsize
+        self._header['capacity'] = capacity
+        self._header['price_scale'] = price_scale
+        self._header['write_seq'] = 0
+        # Written last, so readers never map a half initialized ring
+        self._header['magic'] = MAGIC
+
+    def write(self, ticker, price, size, time_ns=None):
+        """Appends a tick to the ring.
+
+        Args:
+            ticker (str): The security code.
+            price (int): The fixed-point price of the fill (in price units,
+                see price_scale).
+            size (int): The size of the fill.
+
+        Keyword Args:
+            time_ns (int, default=None): The time of the fill (in nanoseconds
+                since the epoch). If None the current time is used.
+
+        Returns:
+            int: The sequence number of the tick.
+
+        """
+        if time_ns is None:
+            time_ns = time.time_ns()
+
+        with self._lock:
+            ticker_id = self._ticker_ids.get(ticker)
+            if ticker_id is None:
+                ticker_id = len(self._ticker_ids)
+                self._ticker_ids[ticker] = ticker_id
+                self._write_tickers(sorted(self._ticker_ids,
+                                           key=self._ticker_ids.get))
+
+            seq = int(self._header['write_seq']) + 1
+            tick = self._ticks[(seq - 1) % self.capacity]
+
+            # The record is invalidated while it is rewritten
+            tick['seq'] = 0
+            tick['time_ns'] = time_ns
+            tick['price'] = price
+            tick['size'] = size
+            tick['ticker_id'] = ticker_id
+            tick['seq'] = seq
+
+            self._header['write_seq'] = seq
+
+        return seq
+
+    def close(self):
+        """Unmaps the ring file."""
+        del self._header, self._ticks
+        self._mmap.close()
+
+    def _write_tickers(self, tickers):
+        """Atomically rewrites the ticker table."""
+        path = _tickers_path(self.path)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(tickers, f)
+        os.replace(path + '.tmp', path)
+
+
+class TickRingReader(object):
+    """A reader of a tick ring.
+
+    Attributes:
+        path (str): The path of the ring file.
+        capacity (int): The number of ticks kept by the ring.
+        price_scale (int): The number of price units per currency unit.
+        next_seq (int): The sequence number of the next tick to be read.
+        lost (int): The number of ticks overwritten by the writer before
+            they were read.
+
+    """
+
+    def __init__(self, path, from_start=False):
+        """The class constructor.
+
+        Args:
+            path (str): The path of the ring file.
+
+        Keyword Args:
+            from_start (bool, default=False): Whether the oldest ticks kept by
+                the ring should be read. If False only the ticks written after
+                the reader is created will be read.
+
+        """
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self._header = np.ndarray((), dtype=HEADER_DTYPE, buffer=self._mmap)
+        if self._header['magic'] != MAGIC or \
+                self._header['record_size'] != TICK_DTYPE.itemsize:
+            raise ValueError('%s isn\'t a tick ring.' % (path))
+
+        self.capacity = int(self._header['capacity'])
+        self.price_scale = int(self._header['price_scale'])
+        self._ticks = np.ndarray((self.capacity,), dtype=TICK_DTYPE,
+                                 buffer=self._mmap, offset=HEADER_SIZE)
+        self._tickers = []
+
+        head = int(self._header['write_seq'])
+        self.next_seq = max(1, head - self.capacity + 1) if from_start else \
+            head + 1
+        self.lost = 0
+
+    def poll(self, max_count=None):
+        """Reads the new ticks.
+
+        The ticks are returned as a view of the mapped file, which is only
+        valid until the writer laps it (`capacity` ticks later): copy it to
+        keep it longer. A batch never wraps around the end of the ring, so
+        the remaining ticks are returned by the next call.
+
+        Keyword Args:
+            max_count (int, default=None): The maximum number of ticks to be
+                read.
+
+        Returns:
+            numpy.ndarray: The new ticks (see TICK_DTYPE), which may be empty.
+
+        """
+        while True:
+            head = int(self._header['write_seq'])
+            if head < self.next_seq:
+                return self._ticks[:0]
+
+            if head - self.next_seq >= self.capacity:
+                # The writer lapped the reader
+                oldest = head - self.capacity + 1
+                self.lost += oldest - self.next_seq
+                self.next_seq = oldest
+
+            start = (self.next_seq - 1) % self.capacity
+            count = min(head - self.next_seq + 1, self.capacity - start)
+            if max_count is not None:
+                count = min(count, max_count)
+
+            ticks = self._ticks[start:start + count]
+
+            # Retrying if the writer lapped the batch while it was sliced
+            if ticks['seq'][0] == self.next_seq and \
+                    ticks['seq'][-1] == self.next_seq + count - 1:
+                self.next_seq += count
+                return ticks
+
+    def wait(self, timeout=None, interval=0.0001, max_count=None):
+        """Waits for new ticks.
+
+        Keyword Args:
+            timeout (float, default=None): The maximum time to wait (in
+                seconds). If None waits forever.
+            interval (float, default=0.0001): The polling interval (in
+                seconds).
+            max_count (int, default=None): The maximum number of ticks to be
+                read.
+
+        Returns:
+            numpy.ndarray: The new ticks, which is empty on a timeout.
+
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            ticks = self.poll(max_count)
+            if len(ticks) or (deadline is not None and
+                              time.monotonic() >= deadline):
+                return ticks
+            time.sleep(interval)
+
+    def ticker(self, ticker_id):
+        """(str) The security code of a ticker id."""
+        if ticker_id >= len(self._tickers):
+            with open(_tickers_path(self.path)) as f:
+                self._tickers = json.load(f)
+
+        return self._tickers[ticker_id]
+
+    def close(self):
+        """Unmaps the ring file."""
+        del self._header, self._ticks
+        self._mmap.close()
@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""A micro Stock Market Simulator.
+
+This module implements the latency tracing of orders through their lifecycle
+on the Stock Exchange.
+
+Every order is stamped with a timestamp (in nanoseconds) when it reaches each
+one of the lifecycle stages (see STAGES), so a late fill can be attributed to
+the stage that delayed it. The timestamps are read from the wall clock, since
+an order is received by the server (or the cluster gateway) and stamped on
+the following stages by the exchange (or the shard) that owns its book.
+
+Attributes:
+    STAGES (tuple): the lifecycle stages of an order, in order:
+        * received: the server received the HTTP request of the order
+            (before parsing it and routing it to a shard)
+        * persisted: the order was saved on the database
+        * considered: the order was first considered by OrderBook.try_match()
+        * matched: the order first crossed another order (its fill was
+            decided, before the settlement)
+        * settled: the order's first fill was settled (positions and wallets
+            updated and the fill saved)
+
+.. _uStockMarket Project:
+    https://github.com/luizsol/uStockMarket
+
+"""
+__author__ = 'Luiz Sol'
+__license__ = 'MIT'
+__version__ = '0.0.1'
+__date__ = '2017-10-05'
+__maintainer__ = 'Luiz Sol'
+__email__ = 'luizedusol@gmail.com'
+__status__ = 'Development'
+
+from collections import OrderedDict
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import threading
+import time
+
+STAGES = ('received', 'persisted', 'considered', 'matched', 'settled')
+
+
+class OrderTracer(object):
+    """Keeps the lifecycle timestamps of the most recent orders.
+
+    Attributes:
+        max_traces (int): The maximum number of traces kept in memory. The
+            oldest traces are evicted first.
+        sample_rate (float): The fraction of the settled orders whose trace is
+            dumped to the trace file.
+
+    """
+
+    def __init__(self, max_traces=100000):
+        """The class constructor.
+
+        Keyword Args:
+            max_traces (int, default=100000): The maximum number of traces
+                kept in memory.
+
+        """
+        self.max_traces = max_traces
+        self.sample_rate = 0.0
+        self._traces = OrderedDict()
+        self._lock = threading.Lock()
+        self._dump = None
+
+    @staticmethod
+    def now():
+        """(int) The current time (in nanoseconds since the epoch)."""
+        return time.time_ns()
+
+    def configure_dump(self, path, sample_rate):
+        """Enables the sampled dump of settled traces to a file.
+
+        The traces are written as JSON lines by a background thread.
+
+        Args:
+            path (str): The path of the trace file.
+            sample_rate (float): The fraction (from 0 to 1) of the settled
+                orders whose trace will be dumped.
+
+        """
+        dump = logging.getLogger('u_stock_market.traces')
+        dump.propagate = False
+        dump.setLevel(logging.INFO)
+
+        records = queue.Queue()
+        listener = logging.handlers.QueueListener(
+            records, logging.FileHandler(path))
+        listener.start()
+        atexit.register(listener.stop)
+        dump.addHandler(logging.handlers.QueueHandler(records))
+
+        self.sample_rate = sample_rate
+        self._dump = dump
+
+    def start(self, order_id, received=None):
+        """Starts the trace of a persisted order.
+
+        Args:
+            order_id (object): The order id.
+
+        Keyword Args:
+            received (int, default=None): The time (see now()) when the order
+                was received. If None the order is considered received when it
+                was persisted.
+
+        """
+        persisted = self.now()
+        with self._lock:
+            self._traces[str(order_id)] = {
+                'received': persisted if received is None else received,
+                'persisted': persisted}
+
+            while len(self._traces) > self.max_traces:
+                self._traces.popitem(last=False)
+
+    def stamp(self, stage, *order_ids):
+        """Stamps orders that reached a stage for the first time.
+
+        Args:
+            stage (str): The lifecycle stage (see STAGES).
+            *order_ids (object): The ids of the orders.
+
+        """
+        stamp = self.now()
+        settled = []
+        with self._lock:
+            for order_id in order_ids:
+                trace = self._traces.get(str(order_id))
+                if trace is not None and stage not in trace:
+                    trace[stage] = stamp
+                    if stage == 'settled':
+                        settled += [(str(order_id), trace)]
+
+        if self._dump is not None:
+            for order_id, trace in settled:
+                if random.random() < self.sample_rate:
+                    self._dump.info(json.dumps(self._report(order_id, trace)))
+
+    def get(self, order_id):
+        """Retrieves the trace of an order.
+
+        Args:
+            order_id (object): The order id.
+
+        Returns:
+            None if the order isn't being traced, its trace report otherwise
+            (see OrderTracer._report()).
+
+        """
+        with self._lock:
+            trace = self._traces.get(str(order_id))
+            trace = None if trace is None else dict(trace)
+
+        return None if trace is None else self._report(str(order_id), trace)
+
+    def slowest(self, count=10, stage=None):
+        """Retrieves the slowest traces.
+
+        Keyword Args:
+            count (int, default=10): The number of traces to be retrieved.
+            stage (str, default=None): The stage whose latency is used to rank
+                the traces. If None the traces are ranked by their total
+                latency.
+
+        Returns:
+            list(dict): The trace reports, slowest first.
+
+        """
+        with self._lock:
+            traces = [(order_id, dict(trace)) for order_id, trace in
+                      self._traces.items()]
+
+        reports = [self._report(order_id, trace) for order_id, trace in
+                   traces]
+        if stage is not None:
+            reports = [report for report in reports if
+                       stage in report['latency_us']]
+
+            def key(report):
+                return report['latency_us'][stage]
+        else:
+            def key(report):
+                return report['total_us']
+
+        return sorted(reports, key=key, reverse=True)[:count]
+
+    def clear(self):
+        """Drops all the traces."""
+        with self._lock:
+            self._traces.clear()
+
+    def _report(self, order_id, trace):
+        """Builds the report of a trace.
+
+        Args:
+            order_id (str): The order id.
+            trace (dict): The timestamps keyed by stage.
+
+        Returns:
+            dict: The order id, the time of each reached stage since the order
+                was received and the latency of each stage (time since the
+                previous stage), all in microseconds, along with the total
+                latency and the slowest stage (bottleneck).
+
+        """
+        received = trace['received']
+        reached = [stage for stage in STAGES if stage in trace]
+
+        latency = {}
+        for previous, stage in zip(reached, reached[1:]):
+            latency[stage] = (trace[stage] - trace[previous]) // 1000
+
+        return {'order': order_id,
+                'stages_us': {stage: (trace[stage] - received) // 1000 for
+                              stage in reached},
+                'latency_us': latency,
+                'total_us': (trace[reached[-1]] - received) // 1000,
+                'bottleneck': max(latency, key=latency.get) if latency else
+                None}
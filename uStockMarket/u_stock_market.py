@@ -10,17 +10,63 @@ class and it's methods since most of the logic is inside it.
 Avoid writing data to the u_stock_market database without the use of the
 StockExchange methods at all costs as to avoid data inconsistencies.
 
+Prices and amounts of money are represented as integer ticks (cents, see
+PRICE_SCALE) on the whole matching core and on the database, and are only
+converted from and to decimal strings on the StockExchange methods (see
+to_ticks() and format_ticks()).
+
+Concurrency model: every order book is written by a single thread at a time,
+the order entry and the matching of a book being serialized by its lock (see
+book_locks). Fills settled on different books may touch the same trader, so
+wallets and positions are only changed by atomic conditional updates (a
+compare-and-swap of the wallet and guarded increments of the shares) that
+never let them become negative. Independent books can therefore be matched in
+parallel without any lock shared between them and without lost updates.
+
 Attributes:
     DB_NAME (str): the name of the mongodb database to be used by the
          application
     LOG_FILE (str): the default name of the log file
+    BULK_BATCH_SIZE (int): the maximum number of documents sent to the
+        database on each bulk write
+    HISTORY_PAGE_SIZE (int): the maximum number of items returned by each
+        incremental (cursor based) history request
+    TRADER_FIELDS (tuple): the fields of a trader status that can be
+        requested (see StockExchange.get_trader_status())
+    PRICE_SCALE (int): the number of ticks (the integer unit of prices and
+        money) per currency unit
+    SNAPSHOT_TRADES (int): the number of recent trades in each market data
+        snapshot
+    SNAPSHOT_DEPTH (int): the number of price levels of each side of the book
+        in each market data snapshot
+    CLUSTER_LEADERBOARD_AGE (float): the age (in seconds) after which the
+        leaderboard of a cluster shard is reloaded
+    ORDERS_CURSOR_LAG (float): the time (in seconds) by which the orders
+        cursor of the trader status lags behind the orders' sequence numbers
+    LOG_SUBSYSTEMS (tuple): the names of the subsystems with their own log
+        level (see set_log_levels())
+    clock (WallClock): the clock of the simulation (see set_clock())
     log (logging): the module's logging object
+    order_log (logging): the order entry subsystem logging object
+    match_log (logging): the order matching subsystem logging object
+    market_analytics (MarketAnalytics): the tick series and cached statistics
+        of all securities
+    leaderboard (Leaderboard): the accounts of all traders, marked to market
+    response_cache (ResponseCache): the serialized book and trader responses,
+        keyed by ('book', <ticker>) and ('trader', <name>)
+    orders_received, fills, match_rejects, matcher_iterations,
+    try_match_seconds, settlement_seconds, resting_orders (metrics._Metric):
+        the exchange's metrics (see the metrics module)
+    order_tracer (OrderTracer): the lifecycle timestamps of the most recent
+        orders
+    book_locks (StripedLocks): the locks of the order books, keyed by ticker
+    fill_listeners (list(callable)): functions called with the ticker and the
+        fill after every fill is settled
 
 Todo:
     * Implement the user defined log output on the StockExchange constructor
     * Change the `except Exception:` statements to catch only database related
         exceptions
-    * Test thread safety
     * Implement the trader's portfolio history
     * Use module constants to represent Bid and Ask orders
     * Improve logging consistency and depth
@@ -43,26 +89,72 @@ __maintainer__ = 'Luiz Sol'
 __email__ = 'luizedusol@gmail.com'
 __status__ = 'Development'
 
-from datetime import datetime
-from decimal import Decimal
+import csv
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+import atexit
+import json
 import logging
+import logging.handlers
+import queue
 import random
 import string
 import threading
+import time
 import yaml
 
+from bson import ObjectId
+from bson.errors import InvalidId
 import numpy as np
 from mongoengine import *
 from mongoengine.connection import get_connection
+from pymongo import UpdateOne
+
+from admission import RateLimiter
+from analytics import MarketAnalytics, TickSeries
+from auction import clear_auction, pair_fills
+from clock import SimulatedClock, WallClock
+from ingestion import OrderQueue
+from leaderboard import Leaderboard
+from locks import StripedLocks
+from market_data import SnapshotPublisher
+from matching import MatcherPool
+from metrics import Counter, Gauge, Histogram
+from order_store import OrderStore
+from response_cache import ResponseCache
+from tick_ring import TickRingWriter
+from tracing import STAGES, OrderTracer
 
 
 DB_NAME = 'u_stock_market'
 LOG_FILE = 'u_stock_market.log'
+LOG_SUBSYSTEMS = ('exchange', 'orders', 'matching')
+BULK_BATCH_SIZE = 1000
+HISTORY_PAGE_SIZE = 1000
+TRADER_FIELDS = ('wallet', 'wallet_history', 'portfolio', 'portfolio_value',
+                 'orders')
+
+PRICE_SCALE = 100
+
+SNAPSHOT_TRADES = 1000
+
+SNAPSHOT_DEPTH = 10
+
+CLUSTER_LEADERBOARD_AGE = 5.0
+
+ORDERS_CURSOR_LAG = 5.0
+
+clock = WallClock()
+
+_sequence_lock = threading.Lock()
+_last_sequence = 0
 
 
 def _new_log(log_file=None):
     """Generates and prepares a logging object.
 
+    The records are written to the log file by a background thread, so the
+    threads that log never block on file I/O.
+
     Keyword Args:
         log_file (str, default=None): The file path of the log file.
 
@@ -80,49 +172,445 @@ def _new_log(log_file=None):
     hdlr = logging.FileHandler(log_file)
     formatter = logging.Formatter('[%(asctime)s][%(levelname)s] %(message)s')
     hdlr.setFormatter(formatter)
-    log.addHandler(hdlr)
-    log.setLevel(logging.DEBUG)
+
+    records = queue.Queue()
+    listener = logging.handlers.QueueListener(records, hdlr)
+    listener.start()
+    atexit.register(listener.stop)
+
+    log.addHandler(logging.handlers.QueueHandler(records))
+    log.setLevel(logging.INFO)
     return log
 
 
-def bad_request(message):
-    """(dict, status) Returns a default error dict with a specified message."""
-    return {'success': False, 'message': message}, 400
+def set_log_levels(levels):
+    """Sets the log level of the module's subsystems.
+
+    Example:
+        {'exchange': 'INFO', 'orders': 'WARNING', 'matching': 'WARNING'}
+
+    Args:
+        levels (dict): The log levels (logging level names or numbers) keyed
+            by subsystem (see LOG_SUBSYSTEMS). The `exchange` level is
+            inherited by the subsystems whose level isn't set.
+
+    Raises:
+        ValueError: If a subsystem or level is unknown.
+
+    """
+    for subsystem, level in levels.items():
+        if subsystem not in LOG_SUBSYSTEMS:
+            raise ValueError('Unknown log subsystem %s' % (subsystem))
+
+        logger = log if subsystem == 'exchange' else log.getChild(subsystem)
+        logger.setLevel(level.upper() if isinstance(level, str) else level)
+
+
+def bad_request(message, data=None, status=400):
+    """(dict, status) Returns a default error dict with a specified message.
+
+    Args:
+        message (str): The error message.
+
+    Keyword Args:
+        data (object, default=None): Additional data describing the error.
+        status (int, default=400): The HTTP status code of the error.
+
+    """
+    result = {'success': False, 'message': message}
+    if data is not None:
+        result['data'] = data
+    return result, status
+
+
+def good_request(data, cursor=None, status=200):
+    """(dict, status) Returns a default success dict with a specified data.
+
+    Args:
+        data (object): The response data.
+
+    Keyword Args:
+        cursor (object, default=None): The cursor to be sent on the next
+            incremental request.
+        status (int, default=200): The HTTP status code of the response.
+
+    """
+    result = {'success': True, 'data': data}
+    if cursor is not None:
+        result['cursor'] = cursor
+    return result, status
+
+
+def to_ticks(value):
+    """Converts a price or an amount of money to integer ticks.
+
+    The value is rounded to the nearest tick (half up), as the former
+    two decimal places prices were.
+
+    Args:
+        value (Decimal, str or int): The value (in currency units).
+
+    Returns:
+        int: The value in ticks.
+
+    Raises:
+        InvalidOperation: If the value isn't a number.
+
+    """
+    return int((Decimal(value) * PRICE_SCALE).quantize(Decimal(1),
+                                                       rounding=ROUND_HALF_UP))
 
 
-def good_request(data):
-    """(dict, status) Returns a default success dict with a specified data."""
-    return {'success': True, 'data': data}, 200
+def from_ticks(ticks):
+    """(Decimal) Converts integer ticks to a value (in currency units), with
+    the decimal places of a tick."""
+    return (Decimal(ticks) / PRICE_SCALE).quantize(Decimal(1) / PRICE_SCALE)
 
 
-def dict_to_porfolio(trader, portfolio):
-    """Generates a trader portfolio based on a dict.
+def format_ticks(ticks):
+    """(str) Formats integer ticks as a decimal string ('None' if None)."""
+    return str(None if ticks is None else from_ticks(ticks))
 
-    The dict should be formatted as ticker: amount
 
-    Examples:
-        {"JBS02": 123, "LLC33": 223.23}
+def set_clock(new_clock):
+    """Replaces the clock of the simulation.
 
     Args:
-        trader (Trader): The trader of the portfolio being created.
-        porfolio (dict): The dict to be converted on a portfolio.
+        new_clock (WallClock): The new clock (see the clock module).
+
+    """
+    global clock
+    clock = new_clock
+
+
+def current_time():
+    """(datetime) The current time of the simulation clock."""
+    return clock.now()
+
+
+def next_sequence():
+    """Generates a new sequence number.
+
+    The sequence numbers are strictly increasing and, since they are based on
+    the wall clock (in microseconds), they keep increasing across restarts.
 
     Returns:
-        False if one of the dict ticker is not registered in any OrderBook, the
-        list of positions representing the trader's portfolio otherwise.
+        int: The sequence number.
 
     """
-    result = []
-    for ticker, shares in portfolio.items():
-        try:
-            book = OrderBook.objects.get(ticker=ticker)
-            result += [Position(trader=trader, order_book=book, shares=shares)]
-        except Exception:
-            return False
-    return result
+    global _last_sequence
+    with _sequence_lock:
+        _last_sequence = max(_last_sequence + 1, int(time.time() * 1e6))
+        return _last_sequence
+
+
+def _orders_cursor(orders, since, limit):
+    """Computes the cursor of the next page of a trader's orders.
+
+    The sequence numbers are taken before the orders are saved, and by any of
+    the matcher workers (or shards), so an order may be saved after another
+    one with a larger sequence number. The cursor therefore lags
+    ORDERS_CURSOR_LAG seconds behind the current sequence: the orders changed
+    since then are returned again on the next page, and the clients must
+    merge the orders by their ids. A full page moves the cursor to its last
+    order, so a long backlog is always paged through.
+
+    Args:
+        orders (list(Order)): The page of orders, ordered by sequence.
+        since (int): The cursor of the page.
+        limit (int): The size of the page.
+
+    Returns:
+        int: The cursor of the next page.
+
+    """
+    if not orders:
+        return since
+    if len(orders) >= limit:
+        return orders[-1].seq
+
+    settled = int((time.time() - ORDERS_CURSOR_LAG) * 1e6)
+    return max(since, min(orders[-1].seq, settled))
+
+
+def _page(since, limit):
+    """Validates the cursor parameters of an incremental request.
+
+    Args:
+        since (int): The cursor sent by the client.
+        limit (int): The maximum number of items requested by the client.
+
+    Returns:
+        None if the parameters are invalid, the cursor and the page size
+        (capped to HISTORY_PAGE_SIZE) otherwise.
+
+    """
+    since = 0 if since is None else since
+    limit = HISTORY_PAGE_SIZE if limit is None else \
+        min(limit, HISTORY_PAGE_SIZE)
+
+    if since < 0 or limit < 1:
+        return None
+
+    return since, limit
+
+
+def reference_id(document, field):
+    """The id of a document referenced by a field, without dereferencing it.
+    """
+    value = document._data.get(field)
+    return getattr(value, 'id', value)
+
+
+def reference_ids(document, field):
+    """(list) The ids of the documents referenced by a list field, without
+    dereferencing them."""
+    return [getattr(value, 'id', value) for value in
+            document._data.get(field) or []]
+
+
+def market_prices(tickers):
+    """Retrieves the market prices of multiple securities with one query.
+
+    Args:
+        tickers (iterable(str)): The security codes.
+
+    Returns:
+        dict: The market price (in ticks, see OrderBook.get_market_price()) of
+            each security, keyed by ticker.
+
+    """
+    prices = dict.fromkeys(tickers, 0)
+    for book in OrderBook.objects(ticker__in=list(prices)).fields(
+            ticker=1, slice__price_history=-1).as_pymongo():
+        if book.get('price_history'):
+            prices[book['ticker']] = book['price_history'][-1]['value']
+
+    return prices
+
+
+def orders_to_dicts(orders):
+    """Serializes multiple orders, loading all their fills with one query.
+
+    Args:
+        orders (list(Order)): The orders.
+
+    Returns:
+        list(dict): The serialized orders (see Order.to_dict()).
+
+    """
+    fill_ids = [fill_id for order in orders for fill_id in
+                reference_ids(order, 'fills')]
+    fills = {}
+    if fill_ids:
+        fills = {fill.id: fill for fill in Fill.objects(id__in=fill_ids)}
+
+    return [order.to_dict(fills=[fills[fill_id] for fill_id in
+                                 reference_ids(order, 'fills') if
+                                 fill_id in fills])
+            for order in orders]
+
+
+def positions_to_dicts(positions):
+    """Serializes multiple positions, loading their market prices with one
+    query.
+
+    Args:
+        positions (list(Position)): The positions.
+
+    Returns:
+        list(dict): The serialized positions (see Position.to_dict()).
+
+    """
+    prices = market_prices({position.ticker for position in positions})
+    return [position.to_dict(market_price=prices[position.ticker]) for
+            position in positions]
+
+
+def random_accounts(count, num_securities):
+    """Draws random initial wallets and portfolios.
+
+    All the values are drawn with a single vectorized Chi Squared sampling.
+
+    Args:
+        count (int): The number of accounts to be drawn.
+        num_securities (int): The number of securities of each portfolio.
+
+    Returns:
+        tuple: An array with the `count` wallets and a `count` x
+            `num_securities` array with the amount of shares of each security.
+
+    """
+    draws = np.random.chisquare(10, size=(count, num_securities + 1)) \
+        .astype(np.int64)
+    return draws[:, 0] * 1000, draws[:, 1:] * 10000
+
+
+def bulk_insert(document, records):
+    """Inserts raw records into a collection in batches.
+
+    Args:
+        document (Document): The class of the documents being inserted.
+        records (iterable(dict)): The raw (pymongo) records to be inserted.
+
+    Returns:
+        int: The number of inserted records.
+
+    """
+    collection = document._get_collection()
+    total = 0
+    batch = []
+    for record in records:
+        batch += [record]
+        if len(batch) == BULK_BATCH_SIZE:
+            collection.insert_many(batch, ordered=False)
+            total += len(batch)
+            batch = []
+
+    if batch:
+        collection.insert_many(batch, ordered=False)
+        total += len(batch)
+
+    return total
+
+
+def _load_ticks(ticker):
+    """Loads a security's price history into a columnar TickSeries.
+
+    Args:
+        ticker (str): The security code.
+
+    Returns:
+        None if the security doesn't exist, its TickSeries otherwise.
+
+    """
+    book = OrderBook.objects(ticker=ticker).only('price_history') \
+        .as_pymongo().first()
+    if book is None:
+        return None
+
+    history = book.get('price_history', [])
+    series = TickSeries(capacity=len(history))
+    series.extend(
+        time=[datum['time'].timestamp() for datum in history],
+        price=[datum['value'] / PRICE_SCALE for datum in history],
+        size=[datum.get('amount') or 0 for datum in history],
+        bid=[datum['bid'] / PRICE_SCALE if datum.get('bid') else np.nan
+             for datum in history],
+        ask=[datum['ask'] / PRICE_SCALE if datum.get('ask') else np.nan
+             for datum in history])
+    return series
+
+
+def _load_accounts():
+    """Loads the accounts of all the traders (see Leaderboard).
+
+    Returns:
+        dict: The traders and their wallets, the securities and their last
+            prices, the positions and the shares and money moved by the trades
+            of each trader on each security, up to the last fill read before
+            the positions (the watermark).
+
+    """
+    # The positions of a fill are settled before the fill is saved, so they
+    # are read below for all the fills up to the watermark
+    last_fill = Fill._get_collection().find_one(
+        {}, {'_id': 1}, sort=[('_id', -1)])
+    watermark = None if last_fill is None else last_fill['_id']
+
+    traders = list(Trader.objects.only('name', 'wallet').as_pymongo())
+    prices = market_prices(book['ticker'] for book in
+                           OrderBook.objects.only('ticker').as_pymongo())
+
+    positions = [(position['trader_name'], position['ticker'],
+                  position['shares']) for position in
+                 Position._get_collection().find(
+                     {}, {'_id': 0, 'trader_name': 1, 'ticker': 1,
+                          'shares': 1})]
+
+    trades = []
+    for side, sign in (('$buyer_name', 1), ('$seller_name', -1)):
+        for total in Fill._get_collection().aggregate([
+                {'$match': {'_id': {'$lte': watermark}}},
+                {'$group': {'_id': {'trader': side, 'ticker': '$ticker'},
+                            'shares': {'$sum': '$size'},
+                            'money': {'$sum': {'$multiply': ['$size',
+                                                             '$price']}}}}]):
+            trades += [(total['_id']['trader'], total['_id']['ticker'],
+                        sign * total['shares'], -sign * total['money'])]
+
+    return {'names': [trader['name'] for trader in traders],
+            'wallets': [trader.get('wallet', 0) for trader in traders],
+            'tickers': list(prices),
+            'prices': list(prices.values()),
+            'positions': positions,
+            'trades': trades,
+            'watermark': watermark}
+
+
+def _count_resting_orders():
+    """(dict) Counts the active orders of each order book, keyed by (ticker,).
+    """
+    counts = {result['_id']: result['count'] for result in
+              Order._get_collection().aggregate([
+                  {'$match': {'canceled': False, 'filled': False}},
+                  {'$group': {'_id': '$order_book', 'count': {'$sum': 1}}}])}
+
+    return {(book['ticker'],): counts.get(book['_id'], 0) for book in
+            OrderBook.objects.only('ticker').as_pymongo()}
 
 
 log = _new_log()
+order_log = log.getChild('orders')
+match_log = log.getChild('matching')
+
+orders_received = Counter('ustockmarket_orders_received_total',
+                          'Orders received by the exchange.')
+fills = Counter('ustockmarket_fills_total', 'Fills generated by the matcher.')
+match_rejects = Counter('ustockmarket_match_rejects_total',
+                        'Order matches rejected by Order.match(), by reason.',
+                        ('reason',))
+# The child of each reason, bound once since Order.match() is on the hot path
+_match_rejects = {reason: match_rejects.labels(reason) for reason in
+                  ('inactive', 'different_books', 'same_side',
+                   'price_mismatch', 'no_price', 'insufficient_funds',
+                   'insufficient_shares')}
+matcher_iterations = Counter('ustockmarket_matcher_iterations_total',
+                             'Passes of the matcher workers over their '
+                             'order books.')
+admission_rejects = Counter('ustockmarket_admission_rejects_total',
+                            'Orders rejected by the rate limits or by a full '
+                            'order queue, by scope.', ('scope',))
+order_queue_depth = Gauge('ustockmarket_order_queue_depth',
+                          'Orders waiting on the asynchronous ingestion '
+                          'queue.')
+auctions = Counter('ustockmarket_auctions_total',
+                   'Call auctions cleared by the matcher workers.')
+try_match_seconds = Histogram('ustockmarket_try_match_seconds',
+                              'Duration of OrderBook.try_match().')
+settlement_seconds = Histogram('ustockmarket_settlement_seconds',
+                               'Duration of the settlement of a fill.')
+resting_orders = Gauge('ustockmarket_resting_orders',
+                       'Active (neither canceled nor filled) orders per order '
+                       'book.', ('ticker',), collect=_count_resting_orders)
+
+market_analytics = MarketAnalytics(_load_ticks)
+
+leaderboard = Leaderboard(_load_accounts)
+
+response_cache = ResponseCache()
+
+order_tracer = OrderTracer()
+
+rate_limiter = RateLimiter()
+
+book_locks = StripedLocks()
+
+# The resting orders of the books matched by this process, by priority (see
+# OrderBook.get_top_bid())
+resting_orders = OrderStore()
+
+fill_listeners = []
 
 connect(DB_NAME)
 
@@ -146,12 +634,14 @@ class StockExchange(threading.Thread):
     users that want to have a more complete market view.
 
     It inherits from threading.Thread so it can perform the order matching
-    asynchronously.
+    asynchronously (through a pool of matcher workers).
 
     """
 
     def __init__(self, config_file=None, clean_start=True, log_file=None,
-                 debug_mode=True, tickers=None):
+                 debug_mode=False, tickers=None, log_levels=None, workers=4,
+                 owns=None, snapshot_dir=None, tick_ring=None,
+                 order_queue=None, clock_speed=None, clock_epoch=None):
         """The class constructor.
 
         Keyword Args:
@@ -159,45 +649,120 @@ class StockExchange(threading.Thread):
                 erased before running the system.
             log_file (str, default=None): The file name into which the log must
                 be saved. If `None` the log will be saved on the default file.
-            debug_mode (bool, default=True): If True the log level will be set
-                to logging.DEBUG. If false, the log level will me set to
+            debug_mode (bool, default=False): If True the log level will be
+                set to logging.DEBUG. If false, the log level will me set to
                 logging.INFO.
-            config_file (str): The path of the yaml configuration file.
+            config_file (str): The path of the configuration file (see
+                StockExchange.load_config()).
+            log_levels (dict, default=None): The log levels of the module's
+                subsystems (see set_log_levels()), which override the one set
+                by `debug_mode`.
+            workers (int, default=4): The number of matcher workers among
+                which the order books are partitioned (see MatcherPool).
+            owns (callable, default=None): A function that tells whether the
+                order book of a ticker is matched by this exchange (see the
+                cluster module). If None all the order books are matched,
+                otherwise the leaderboard is reloaded every
+                CLUSTER_LEADERBOARD_AGE seconds.
+            snapshot_dir (str, default=None): The directory into which the
+                market data snapshots of the books are published after each
+                matching pass (see the market_data module). If None no
+                snapshot is published.
+            tick_ring (str, default=None): The path of a memory-mapped ring
+                buffer into which every fill is published (see the tick_ring
+                module). If None the fills aren't published.
+            order_queue (int, default=None): The size of the queue of the
+                asynchronous order ingestion (see the ingestion module). If
+                None the orders are persisted before they are acknowledged.
+            clock_speed (float, default=None): The speed of the simulation
+                clock, in simulated seconds per real second (see the clock
+                module). If None the wall clock is used.
+            clock_epoch (float, default=None): The wall time (in seconds since
+                the epoch) at which the simulation clock started, shared by
+                the shards of a cluster. If None it starts now.
 
         """
+        log.setLevel(logging.DEBUG if debug_mode else logging.INFO)
+        if log_levels is not None:
+            set_log_levels(log_levels)
+
         log.info('Starting stock exchange')
 
-        threading.Thread.__init__(self)
+        if clock_speed is not None:
+            set_clock(SimulatedClock(clock_speed, epoch=clock_epoch))
+
+        threading.Thread.__init__(self, name='StockExchange')
         # Running on deamon mode (so the tread is stopped when the user presses
         # CTRL + C)
         self.daemon = True
 
+        self.owns = owns
+        if owns is not None:
+            # The other shards settle fills too
+            leaderboard.max_age = CLUSTER_LEADERBOARD_AGE
+        # The monotonic time of the next call auction of each auction book
+        self._auctions = {}
+        self.matchers = MatcherPool(self._match_book, self._tickers,
+                                    workers=workers,
+                                    on_pass=matcher_iterations.inc)
+
+        self.snapshots = None
+        if snapshot_dir is not None:
+            self.snapshots = SnapshotPublisher(snapshot_dir, self._market_data)
+
+        self.tick_ring = None
+        if tick_ring is not None:
+            self.tick_ring = TickRingWriter(tick_ring, price_scale=PRICE_SCALE)
+            fill_listeners.append(self._write_tick)
+
+        self.orders = None
+        if order_queue is not None:
+            self.orders = OrderQueue(self._persist_order, maxsize=order_queue,
+                                     on_change=order_queue_depth.set)
+        # The traders and the tickers known to exist (see _enqueue_order())
+        self._known = {Trader: set(), OrderBook: set()}
+
         if clean_start:
             log.info('Cleaning all market history')
 
             self.clean_history()
 
-            # The yaml file will be load only in clean starts
+            # The configuration file will be load only in clean starts
             if config_file is not None:
-                self.yaml_load(config_file)
+                self.load_config(config_file)
             else:
                 if tickers is None:
                     log.info('Generating random tickers')
-                    for i in range(0, random.randint(1, 100)):
-                        while self.register_security(self._random_ticker()) \
-                                is None:
-                            pass
+                    tickers = set()
+                    num_tickers = random.randint(1, 100)
+                    while len(tickers) < num_tickers:
+                        tickers.add(self._random_ticker())
 
                 else:
                     log.info('Generating tickers')
-                    for ticker in tickers:
-                        self.register_security(ticker)
+
+                self._bulk_load(('ticker', ticker) for ticker in tickers)
+
+        else:
+            self._backfill_names()
+            self._load_resting_orders()
 
     def clean_history(self):
         """Erases all the module's database"""
         log.warning('Erasing database')
         connection = get_connection()
         connection.drop_database(DB_NAME)
+        market_analytics.clear()
+        leaderboard.invalidate()
+        response_cache.clear()
+        order_tracer.clear()
+        resting_orders.clear()
+        for names in self._known.values():
+            names.clear()
+        if self.orders is not None:
+            self.orders.clear()
+        if self.snapshots is not None:
+            self.snapshots.clear()
         return good_request('The database was erased.')
 
     def register_security(self, ticker):  # TODO integrate with the RESTful API
@@ -243,42 +808,71 @@ class StockExchange(threading.Thread):
 
         """
         log.info('Registering new trader')
-        try:
-            Trader.objects.get(name=name)
+        if Trader.objects(name=name).count() > 0:
             log.info('Name %s already exists. Aborting trader registration',
                      name)
             return bad_request('The %s trader already exists.' % (name))
-        except Exception:
-            pass
-
-        if wallet is None:
-            wallet = int(np.random.chisquare(10)) * 1000
-
-        trader = Trader(name=name, wallet=wallet).save()
 
         if portfolio is not None:
-            portfolio = dict_to_porfolio(trader, portfolio)
-            if portfolio:
-                for position in portfolio:
-                    position.save()
-
-                trader.portfolio = portfolio
-            else:
-                trader.delete()
+            books = self._book_ids(portfolio.keys())
+            if len(books) != len(portfolio):
                 return bad_request('Invalid portfolio.')
         else:
-            trader.portfolio = []
-            for book in OrderBook.objects:
-                position = Position(
-                    trader=trader, order_book=book,
-                    shares=int(np.random.chisquare(10)) * 10000)
+            books = self._book_ids()
 
-                trader.portfolio += [position.save()]
+        try:
+            self._insert_traders([(name, wallet, portfolio)], books)
+        except (ValueError, ArithmeticError):
+            return bad_request('Invalid wallet or portfolio.')
 
-        trader.save()
-        log.info('%s trader created!', repr(trader))
+        trader = Trader.objects.get(name=name)
+        log.info('%r trader created!', trader)
         return good_request(trader.to_dict())
 
+    def register_traders(self, names=None, count=None, wallet=None):
+        """Registers multiple traders with random portfolios at once.
+
+        The wallets (unless given) and the portfolios of all the new traders
+        are drawn with a single vectorized sampling and the traders and their
+        positions are inserted with bulk writes.
+
+        Keyword Args:
+            names (list(str), default=None): The names of the new traders. If
+                set to None `count` random names will be generated.
+            count (int, default=None): The number of traders to be created
+                when no names are given.
+            wallet (Decimal, default=None): The initial amount of money of
+                every new trader. If set to None a random value (with a Chi
+                Squared distribution) will be assigned to each trader.
+
+        """
+        log.info('Registering traders in bulk')
+        if names is None:
+            if count is None or count < 1:
+                return bad_request('Either names or a positive count must be '
+                                   'informed.')
+            names = self._random_trader_names(count)
+        elif len(set(names)) != len(names) or \
+                not all(isinstance(name, str) for name in names):
+            return bad_request('The names must be unique strings.')
+
+        existing = [trader.name for trader in
+                    Trader.objects(name__in=names).only('name')]
+        if existing:
+            log.info('Aborting bulk registration: %d names already exist',
+                     len(existing))
+            return bad_request('The following traders already exist: %s.' %
+                               (', '.join(existing)))
+
+        try:
+            self._insert_traders([(name, wallet, None) for name in names],
+                                 self._book_ids())
+        except (ValueError, ArithmeticError):
+            return bad_request('Invalid wallet.')
+
+        log.info('%d traders created!', len(names))
+        return good_request({'traders': names})
+
     def list_traders(self):
         """Lists all the registered traders."""
         return good_request([trader.name for trader in Trader.objects])
@@ -288,20 +882,117 @@ class StockExchange(threading.Thread):
         return good_request({'tickers': [book.ticker for book in
                                          OrderBook.objects]})
 
-    def get_trader_status(self, name):
+    def get_trader_status(self, name, wallet_since=None, orders_since=None,
+                          limit=None, fields=None):
         """Retrieves a trader's status.
 
+        If any of the keyword arguments is set only the wallet history entries
+        and the orders that changed after the given cursors are returned, and
+        the response carries the cursors to be used on the next request. The
+        response also carries the trader's remaining order rate limits (see
+        get_trader_limits()).
+
         Args:
             name (str): The trader's name.
 
+        Keyword Args:
+            wallet_since (int, default=None): The number of wallet history
+                entries already known by the client.
+            orders_since (int, default=None): The sequence number of the last
+                order update known by the client.
+            limit (int, default=None): The maximum number of wallet history
+                entries and of orders to be returned (capped to
+                HISTORY_PAGE_SIZE).
+            fields (str or list(str), default=None): The fields to be
+                retrieved (see TRADER_FIELDS), as a list or a comma separated
+                string. Only these fields are loaded from the database, and
+                the wallet history and the orders are paginated. If None all
+                the fields are retrieved.
+
         """
-        try:
-            return good_request(Trader.objects.get(name=name).to_dict())
-        except Exception:
+        if fields is None and wallet_since is None and orders_since is None \
+                and limit is None:
+            try:
+                data = Trader.objects.get(name=name).to_dict()
+            except Exception:
+                return bad_request('The trader doesn\'t exist.')
+
+            data['rate_limits'] = self.get_trader_limits(name)
+            return good_request(data)
+
+        if fields is None:
+            fields = TRADER_FIELDS
+        elif isinstance(fields, str):
+            fields = [field.strip() for field in fields.split(',')]
+
+        if not all(field in TRADER_FIELDS for field in fields):
+            return bad_request('Invalid fields.', data={
+                'fields': list(TRADER_FIELDS)})
+
+        page = _page(wallet_since, limit)
+        if page is None or (orders_since is not None and orders_since < 0):
+            return bad_request('Invalid cursor.')
+
+        wallet_since, limit = page
+        orders_since = 0 if orders_since is None else orders_since
+
+        projection = ['name']
+        if 'wallet' in fields:
+            projection += ['wallet']
+        if 'portfolio' in fields or 'portfolio_value' in fields:
+            projection += ['portfolio']
+
+        traders = Trader.objects(name=name).only(*projection)
+        if 'wallet_history' in fields:
+            traders = traders.fields(
+                slice__wallet_history=[wallet_since, limit])
+
+        trader = traders.first()
+        if trader is None:
             return bad_request('The trader doesn\'t exist.')
 
+        cursor = {}
+        if 'wallet_history' in fields:
+            cursor['wallet_history'] = wallet_since + \
+                len(trader.wallet_history)
+
+        orders = None
+        if 'orders' in fields:
+            orders = list(Order.objects(trader=trader, seq__gt=orders_since)
+                          .order_by('seq').limit(limit))
+            cursor['orders'] = _orders_cursor(orders, orders_since, limit)
+
+        data = trader.to_dict(orders=orders, fields=fields)
+        data['rate_limits'] = self.get_trader_limits(name)
+        return good_request(data, cursor=cursor)
+
+    def get_trader_status_json(self, name):
+        """Retrieves a trader's status as a cached JSON response.
+
+        The response is rebuilt only after the trader or one of the securities
+        in its portfolio changes.
+
+        Args:
+            name (str): The trader's name.
+
+        Returns:
+            None if the trader doesn't exist, a tuple with the response ETag
+            and its JSON encoded body otherwise.
+
+        """
+        def build():
+            trader = Trader.objects(name=name).first()
+            if trader is None:
+                return None, ()
+
+            data = trader.to_dict()
+            return data, [('trader', name)] + [
+                ('book', position['ticker']) for position in data['portfolio']]
+
+        return response_cache.get(('trader', name), build)
+
     def send_order(self, trader, ticker, side, size, price=None,
-                   market_order=False):
+                   market_order=False, received=None):
         """Sends an order.
 
         Args:
@@ -312,148 +1003,1125 @@ class StockExchange(threading.Thread):
             size (int): The size of the order.
 
         Keyword Args:
-            price (Decimal, default=None): The price of the order. May be left
-                as None just in the case of a `at market price` order.
-            market_order (bool, default=False): Whether the order is a `at
-                market price` order.
+            price (Decimal, default=None): The price of the order. May be left
+                as None just in the case of a `at market price` order.
+            market_order (bool, default=False): Whether the order is a `at
+                market price` order.
+            received (int, default=None): The time (see OrderTracer.now())
+                when the server received the order's request. If None the
+                order is received now.
+
+        Returns:
+            The sent order or, on the asynchronous mode, its id once it is
+            queued (see StockExchange.get_order()).
+
+        """
+        if received is None:
+            received = order_tracer.now()
+        orders_received.inc()
+        rejection = self.admit_order(trader)
+        if rejection is not None:
+            return rejection
+
+        order_log.info('Trying to send order (trader: %s, ticker: %s, side: '
+                       '%s, size: %s, price: %s, market_order: %s)', trader,
+                       ticker, side, size, price, market_order)
+        if price is not None:
+            try:
+                price = to_ticks(price)
+            except InvalidOperation:
+                return bad_request('Invalid price.')
+
+        if self.orders is not None:
+            return self._enqueue_order(trader, ticker, side, size, price,
+                                       market_order, received)
+
+        try:
+            trader = Trader.objects.get(name=trader)
+        except Exception:
+            order_log.warning('Failed while sending order: The trader '
+                              'doesn\'t exists')
+            return bad_request('The trader doesn\'t exist.')
+
+        result = trader.send_order(ticker, side, size, price=price,
+                                   market_order=market_order,
+                                   received=received)
+
+        if result is not None:
+            self.matchers.notify(ticker)
+            order_log.info('Order successfully sent.')
+            return good_request(result.to_dict())
+
+        order_log.warning('Failed while sending order: The order was '
+                          'refused')
+        return bad_request('The order was refused.')
+
+    def get_order(self, order_id):
+        """Retrieves an order by its id.
+
+        Args:
+            order_id (str): The order id.
+
+        Returns:
+            The order (see Order.to_dict()) with its `status` ('active',
+            'filled' or 'canceled'), or only its id and its status if it is
+            still on the asynchronous ingestion queue ('queued') or was
+            rejected by it ('rejected', along with the `message`).
+
+        """
+        try:
+            order_id = ObjectId(order_id)
+        except (InvalidId, TypeError):
+            return bad_request('Invalid order id.')
+
+        status = None if self.orders is None else \
+            self.orders.status(order_id)
+        if status is None or status[0] != 'queued':
+            order = Order.objects(id=order_id).first()
+            if order is not None:
+                return good_request(dict(order.to_dict(),
+                                         status=order.status))
+
+        if status is None:
+            return bad_request('The order doesn\'t exist.')
+
+        result = {'id': str(order_id), 'status': status[0]}
+        if status[1] is not None:
+            result['message'] = status[1]
+        return good_request(result)
+
+    def edit_positions(self, positions):
+        """Edits the portfolio positions of multiple traders.
+
+        The whole request is validated with one query for the traders and one
+        for the securities, and all the positions are then written with a
+        single bulk upsert. If any entry is invalid (an unknown trader or
+        security, negative or non integer shares or a trader without
+        positions) no position is changed.
+
+        Example:
+            {'John Doe': {'TTLB03': 334, 'JJBE32': 700, 'KKTB38': 1020},
+             'Bruce Wayne': {'TTLB03': 339823, 'LLCR33': 9000000}}
+
+        Args:
+            position (dict): A dict containing all the trader positions to be
+                edited.
+
+        Returns:
+            The result of each entry ('created', 'updated' or the reason of its
+            rejection), keyed by trader and ticker.
+
+        """
+        log.info('Editing positions of %d traders',
+                 0 if not isinstance(positions, dict) else len(positions))
+        if not positions or not isinstance(positions, dict) or \
+                not all(isinstance(new_positions, dict) for new_positions in
+                        positions.values()):
+            log.warning('Failed while editing positions: wrong argument')
+            return bad_request('Invalid request.')
+
+        traders = {trader['name']: trader['_id'] for trader in
+                   Trader.objects(name__in=list(positions)).only('name')
+                   .as_pymongo()}
+        books = self._book_ids({ticker for new_positions in
+                                positions.values() for ticker in
+                                new_positions})
+
+        results = {}
+        entries = []
+        operations = []
+        valid = True
+        for name, new_positions in positions.items():
+            if not new_positions:
+                results[name] = 'no positions'
+                valid = False
+                continue
+
+            results[name] = {}
+            for ticker, shares in new_positions.items():
+                if name not in traders:
+                    results[name][ticker] = 'unknown trader'
+                elif ticker not in books:
+                    results[name][ticker] = 'unknown ticker'
+                else:
+                    try:
+                        shares = int(shares)
+                    except (TypeError, ValueError):
+                        shares = -1
+
+                    if shares < 0:
+                        results[name][ticker] = 'invalid shares'
+                        continue
+
+                    entries += [(name, ticker)]
+                    operations += [UpdateOne(
+                        {'trader': traders[name], 'order_book': books[ticker]},
+                        {'$set': {'shares': shares},
+                         '$setOnInsert': {'trader_name': name,
+                                          'ticker': ticker}},
+                        upsert=True)]
+
+        if not valid or len(entries) != sum(
+                len(new_positions) for new_positions in positions.values()):
+            log.warning('Failed while editing positions: invalid entries')
+            return bad_request('One of the entries is invalid.', data=results)
+
+        for name, ticker in entries:
+            results[name][ticker] = 'updated'
+
+        if operations:
+            result = Position._get_collection().bulk_write(operations,
+                                                           ordered=False)
+            new_positions = {}
+            for index, position_id in result.upserted_ids.items():
+                name, ticker = entries[index]
+                results[name][ticker] = 'created'
+                new_positions.setdefault(traders[name], []).append(position_id)
+
+            if new_positions:
+                Trader._get_collection().bulk_write(
+                    [UpdateOne({'_id': trader_id},
+                               {'$addToSet': {'portfolio': {'$each': ids}}})
+                     for trader_id, ids in new_positions.items()],
+                    ordered=False)
+
+        response_cache.invalidate(*[('trader', name) for name in positions])
+        leaderboard.invalidate()
+        log.info('Successfully edited %d positions.', len(entries))
+        return good_request(results)
+
+    def audit(self):
+        """Totals the money and the shares held by all the traders.
+
+        Since fills only move money and shares between traders, the totals
+        must be conserved by the matching once the fills being settled (whose
+        money or shares may be in transit) are completed.
+
+        Returns:
+            The total money, the total shares of each security and the number
+            of negative wallets and positions (which must always be zero).
+
+        """
+        tickers = {book['_id']: book['ticker'] for book in
+                   OrderBook.objects.only('ticker').as_pymongo()}
+
+        wallets = [trader.get('wallet', 0) for trader in
+                   Trader.objects.only('wallet').as_pymongo()]
+        positions = list(Position._get_collection().aggregate([
+            {'$group': {'_id': '$order_book',
+                        'shares': {'$sum': '$shares'},
+                        'negative': {'$sum': {'$cond': [
+                            {'$lt': ['$shares', 0]}, 1, 0]}}}}]))
+
+        return good_request({
+            'money': format_ticks(sum(wallets)),
+            'shares': {tickers.get(position['_id'], str(position['_id'])):
+                       str(position['shares']) for position in positions},
+            'negative_wallets': str(sum(1 for wallet in wallets if
+                                        wallet < 0)),
+            'negative_positions': str(sum(position['negative'] for position in
+                                          positions))})
+
+    def get_order_trace(self, order_id):
+        """Retrieves the lifecycle latency trace of an order.
+
+        Only the most recent orders sent since the exchange started are traced
+        (see OrderTracer).
+
+        Args:
+            order_id (str): The order id.
+
+        """
+        trace = order_tracer.get(order_id)
+        if trace is None:
+            return bad_request('The order isn\'t being traced.')
+
+        return good_request(trace)
+
+    def get_slowest_traces(self, count=10, stage=None):
+        """Retrieves the traces of the slowest orders.
+
+        Keyword Args:
+            count (int, default=10): The number of traces to be retrieved.
+            stage (str, default=None): The lifecycle stage (see
+                tracing.STAGES) whose latency is used to rank the orders. If
+                None the orders are ranked by their total latency.
+
+        """
+        if stage is not None and stage not in STAGES[1:]:
+            return bad_request('Invalid stage.')
+
+        return good_request(order_tracer.slowest(count=count, stage=stage))
+
+    def get_price_history(self, ticker, since=None, limit=None):
+        """Retrieves a security price history.
+
+        If any of the keyword arguments is set only a page of the history is
+        returned, and the response carries the cursor to be used on the next
+        request.
+
+        Args:
+            ticker (str): The security code.
+
+        Keyword Args:
+            since (int, default=None): The number of price history entries
+                already known by the client.
+            limit (int, default=None): The maximum number of entries to be
+                returned (capped to HISTORY_PAGE_SIZE).
+
+        """
+        if since is None and limit is None:
+            try:
+                book = OrderBook.objects.get(ticker=ticker)
+            except Exception:
+                return bad_request('The security code doesn\'t exist')
+
+            return good_request([datum.to_dict() for datum in
+                                 book.price_history])
+
+        page = _page(since, limit)
+        if page is None:
+            return bad_request('Invalid cursor.')
+
+        since, limit = page
+        book = OrderBook.objects(ticker=ticker).fields(
+            ticker=1, slice__price_history=[since, limit]).first()
+        if book is None:
+            return bad_request('The security code doesn\'t exist')
+
+        return good_request([datum.to_dict() for datum in book.price_history],
+                            cursor=since + len(book.price_history))
+
+    def admit_order(self, trader):
+        """Applies the rate limits to an order, before any database work.
+
+        Args:
+            trader (str): The trader's name.
+
+        Returns:
+            None if the order was admitted, the rejection (with the HTTP
+            status 429 and the scope of the exceeded limit) otherwise.
+
+        """
+        rejection = rate_limiter.admit(trader)
+        if rejection is None:
+            return None
+
+        scope, retry_after = rejection
+        admission_rejects.labels(scope).inc()
+        return bad_request('Rate limit exceeded.',
+                           data={'code': 'rate_limited', 'scope': scope,
+                                 'retry_after': str(round(retry_after, 3))},
+                           status=429)
+
+    def get_trader_limits(self, name):
+        """Retrieves a trader's remaining order rate limits.
+
+        Args:
+            name (str): The trader's name.
+
+        Returns:
+            dict: The trader's limits and available tokens and the exchange's
+                available tokens (see RateLimiter.status()).
+
+        """
+        status = rate_limiter.status(name)
+        return {key: status[key] for key in
+                ('trader_rate', 'trader_burst', 'trader_tokens',
+                 'global_tokens')}
+
+    def get_rate_limits(self, trader=None):
+        """Retrieves the order rate limits (see RateLimiter.status()).
+
+        Keyword Args:
+            trader (str, default=None): If set, the trader's available tokens
+                are also retrieved.
+
+        """
+        return good_request(rate_limiter.status(trader))
+
+    def set_rate_limits(self, trader_rate=None, trader_burst=None,
+                        global_rate=None, global_burst=None):
+        """Replaces the order rate limits.
+
+        Keyword Args:
+            trader_rate (float, default=None): The orders per second of each
+                trader. If None the traders aren't limited.
+            trader_burst (float, default=None): The burst of orders of each
+                trader. If None the trader rate (at least 1) is used.
+            global_rate (float, default=None): The orders per second of all
+                the traders. If None the exchange isn't limited.
+            global_burst (float, default=None): The burst of orders of all the
+                traders. If None the global rate (at least 1) is used.
+
+        """
+        try:
+            rate_limiter.configure(trader_rate, trader_burst, global_rate,
+                                   global_burst)
+        except ValueError as e:
+            return bad_request(str(e))
+
+        return good_request(rate_limiter.status())
+
+    def set_matching_mode(self, ticker, auction_interval=None):
+        """Sets whether the orders of a book are matched on call auctions.
+
+        On auction mode the orders collect on the book during the interval
+        and are then executed all at once at the price that maximizes the
+        executed volume (see OrderBook.run_auction()).
+
+        Args:
+            ticker (str): The security code.
+
+        Keyword Args:
+            auction_interval (float, default=None): The interval (in seconds)
+                between the auctions. If None the orders are matched
+                continuously.
+
+        """
+        if auction_interval is not None and auction_interval <= 0:
+            return bad_request('The auction interval must be positive.')
+
+        if auction_interval is None:
+            update = {'unset__auction_interval': True}
+        else:
+            update = {'set__auction_interval': auction_interval}
+
+        if not OrderBook.objects(ticker=ticker).update_one(**update):
+            return bad_request('The security code doesn\'t exist')
+
+        response_cache.invalidate(('book', ticker))
+        self.matchers.notify(ticker)
+        return good_request({'ticker': ticker,
+                             'auction_interval': str(auction_interval)})
+
+    def get_analytics(self, ticker, window=None):
+        """Retrieves a security's market statistics.
+
+        The statistics (VWAP, returns, realized volatility, traded volume and
+        spread) are computed over the security's ticks and cached until a new
+        fill is generated on its order book.
+
+        Args:
+            ticker (str): The security code.
+
+        Keyword Args:
+            window (float, default=None): The length (in seconds) of the time
+                window, anchored on the most recent fill. If None the whole
+                price history is used.
+
+        """
+        if window is not None and window <= 0:
+            return bad_request('The window must be positive.')
+
+        result = market_analytics.get(ticker, window)
+        if result is None:
+            return bad_request('The security code doesn\'t exist')
+
+        return good_request(dict(result, ticker=ticker))
+
+    def get_clock(self):
+        """Retrieves the simulation clock's mode ('wall' or 'simulated'), speed
+        (simulated seconds per real second) and current time."""
+        return good_request(clock.to_dict())
+
+    def set_clock_speed(self, speed, at=None):
+        """Changes the speed of the simulation clock.
+
+        The wall clock is replaced by a simulated one that goes on from the
+        current time, and a simulated clock is rebased on its current time,
+        so the simulation time never goes backwards.
+
+        Args:
+            speed (float): The simulated seconds per real second.
+
+        Keyword Args:
+            at (float, default=None): The wall time (in seconds since the
+                epoch) from which the new speed applies, shared by the shards
+                of a cluster (see SimulatedClock.set_speed()). If None the new
+                speed applies from now on.
+
+        """
+        try:
+            if isinstance(clock, SimulatedClock):
+                clock.set_speed(float(speed), at=at)
+            else:
+                set_clock(SimulatedClock(float(speed), epoch=at))
+        except (TypeError, ValueError):
+            return bad_request('The clock speed must be a positive number.')
+
+        # The pending call auctions are rescheduled at the new speed
+        for ticker, due in list(self._auctions.items()):
+            self._schedule_auction(ticker, due)
+
+        log.info('Clock speed set to %s', clock.speed)
+        return good_request(clock.to_dict())
+
+    def get_leaderboard(self, limit=10, by='equity', refresh=False):
+        """Ranks the traders by marking all of them to market.
+
+        Keyword Args:
+            limit (int, default=10): The number of traders retrieved.
+            by (str, default='equity'): The ranking metric: 'equity' (the
+                wallet plus the market value of the portfolio), 'pnl' (the
+                profit or loss of the trader's fills, marked to market) or
+                'return' (the PnL over the equity without the fills).
+            refresh (bool, default=False): Whether the accounts are reloaded
+                from the database instead of kept up to date by the fills.
+
+        """
+        if limit is None:
+            limit = 10
+        if limit < 1:
+            return bad_request('The limit must be positive.')
+
+        try:
+            traders, leaders = leaderboard.top(limit, by or 'equity',
+                                               refresh=refresh)
+        except ValueError:
+            return bad_request('The metric must be equity, pnl or return.')
+
+        return good_request({
+            'by': by or 'equity',
+            'traders': str(traders),
+            'leaders': [{'rank': str(rank),
+                         'trader': name,
+                         'equity': format_ticks(equity),
+                         'pnl': format_ticks(pnl),
+                         'return': str(None if ret is None else
+                                       round(ret, 6))}
+                        for rank, (name, equity, pnl, ret) in
+                        enumerate(leaders, 1)]})
+
+    def load_config(self, path):
+        """Loads the database with the configurations defined on a file.
+
+        The file format is chosen by its extension: `.csv` (see
+        StockExchange.csv_load()), `.jsonl` (see StockExchange.jsonl_load())
+        or yaml for any other extension (see StockExchange.yaml_load()).
+
+        Args:
+            path (str): The path of the configuration file.
+
+        """
+        if path.endswith('.csv'):
+            return self.csv_load(path)
+        elif path.endswith('.jsonl'):
+            return self.jsonl_load(path)
+
+        return self.yaml_load(path)
+
+    def yaml_load(self, path):
+        """Loads the database with the configurations defined on a yaml file.
+
+        Below is and examplo of yaml file with a valid configuration.
+
+        Example:
+            traders:
+                - name: 'John Doe'
+                  wallet: 30000
+                  portfolio:
+                    BBVA03: 4300
+                    LLCA13: 33421000
+                    RRTV99: 3939300
+
+                - name: 'Jane Gin'
+                  wallet: 40000
+
+            tickers:
+                - BBVA03
+                - LLCA13
+                - RRTV99
+                - KKLE64
+                - ASDF12
+
+        Large configurations may be split into multiple yaml documents
+        (separated by `---`), which are parsed and loaded one at a time. The
+        tickers of each document are registered before its traders.
+
+        Args:
+            path (str): The path of the yaml file.
+
+        """
+        log.info('Loading configurations from the file %s', path)
+
+        def records(f):
+            loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+            for configs in yaml.load_all(f, Loader=loader):
+                if not configs:
+                    continue
+
+                for ticker in configs.get('tickers', []):
+                    yield 'ticker', ticker
+
+                for trader in configs.get('traders', []):
+                    yield 'trader', trader
+
+        with open(path) as f:
+            return self._bulk_load(records(f))
+
+    def jsonl_load(self, path):
+        """Loads the database with the configurations defined on a JSON lines
+        file.
+
+        Each line must contain either a security or a trader and the
+        securities must come before the traders that hold them.
+
+        Example:
+            {"ticker": "BBVA03"}
+            {"ticker": "LLCA13"}
+            {"name": "John Doe", "wallet": 30000, "portfolio": {"BBVA03": 430}}
+            {"name": "Jane Gin", "wallet": 40000}
+
+        Args:
+            path (str): The path of the JSON lines file.
+
+        """
+        log.info('Loading configurations from the file %s', path)
+
+        def records(f):
+            for line in f:
+                if not line.strip():
+                    continue
+
+                item = json.loads(line)
+                if 'ticker' in item:
+                    yield 'ticker', item['ticker']
+                else:
+                    yield 'trader', item
+
+        with open(path) as f:
+            return self._bulk_load(records(f))
+
+    def csv_load(self, path):
+        """Loads the database with the configurations defined on a csv file.
+
+        The header must contain the `name` and `wallet` columns followed by
+        one column per security. Each row represents a trader and its amount
+        of shares of each security. Empty wallets are replaced by random ones
+        and rows without any position receive a random portfolio.
+
+        Example:
+            name,wallet,BBVA03,LLCA13,RRTV99
+            John Doe,30000,4300,33421000,3939300
+            Jane Gin,40000,,,
+
+        Args:
+            path (str): The path of the csv file.
+
+        """
+        log.info('Loading configurations from the file %s', path)
+
+        def records(f):
+            reader = csv.reader(f)
+            header = next(reader)
+            tickers = header[2:]
+            for ticker in tickers:
+                yield 'ticker', ticker
+
+            for row in reader:
+                if not row:
+                    continue
+
+                portfolio = {ticker: shares for ticker, shares in
+                             zip(tickers, row[2:]) if shares != ''}
+                yield 'trader', {'name': row[0],
+                                 'wallet': row[1] or None,
+                                 'portfolio': portfolio or None}
+
+        with open(path, newline='') as f:
+            return self._bulk_load(records(f))
+
+    def get_book(self, ticker, since=None, limit=None):
+        """Retrieves a security OrderBook information.
+
+        If any of the keyword arguments is set only a page of the price
+        history is returned (see StockExchange.get_price_history()).
+
+        Args:
+            ticker (str): The security code.
+
+        Keyword Args:
+            since (int, default=None): The number of price history entries
+                already known by the client.
+            limit (int, default=None): The maximum number of entries to be
+                returned (capped to HISTORY_PAGE_SIZE).
+
+        """
+        if since is None and limit is None:
+            try:
+                book = OrderBook.objects.get(ticker=ticker)
+                return good_request(book.to_dict())
+            except Exception:
+                return bad_request('The ticker doesn\'t exists.')
+
+        page = _page(since, limit)
+        if page is None:
+            return bad_request('Invalid cursor.')
+
+        since, limit = page
+        book = OrderBook.objects(ticker=ticker).fields(
+            ticker=1, auction_interval=1, slice__price_history=-1).first()
+        if book is None:
+            return bad_request('The ticker doesn\'t exists.')
+
+        history = OrderBook.objects(ticker=ticker).fields(
+            ticker=1, slice__price_history=[since, limit]).first() \
+            .price_history
+
+        return good_request(book.to_dict(price_history=history),
+                            cursor=since + len(history))
+
+    def get_book_json(self, ticker):
+        """Retrieves a security OrderBook information as a cached JSON
+        response.
+
+        The response is rebuilt only after an order or a fill changes the book.
+
+        Args:
+            ticker (str): The security code.
+
+        Returns:
+            None if the security doesn't exist, a tuple with the response ETag
+            and its JSON encoded body otherwise.
+
+        """
+        def build():
+            book = OrderBook.objects(ticker=ticker).first()
+            if book is None:
+                return None, ()
+
+            return book.to_dict(), [('book', ticker)]
+
+        return response_cache.get(('book', ticker), build)
+
+    def run(self):
+        """The thread responsible for continuously matching the top orders.
+
+        The matching itself is made by the matcher workers (see MatcherPool),
+        each one owning a partition of the order books.
+
+        """
+        if self.snapshots is not None:
+            self.snapshots.start()
+
+        if self.orders is not None:
+            self.orders.start()
+
+        self.matchers.start()
+        self.matchers.join()
+
+    def _match_book(self, ticker):
+        """Matches the orders of a book until its top orders don't cross.
+
+        The orders of a book on auction mode are only matched on its call
+        auctions, each one scheduled (by notifying the book's matcher worker)
+        when the previous one is cleared.
+        """
+        book = OrderBook.for_matching(ticker)
+        if book is None:
+            return
+
+        if book.auction_interval:
+            now = clock.monotonic()
+            due = self._auctions.get(ticker)
+            if due is not None and due > now:
+                return
+
+            if due is not None:
+                book.run_auction()
+
+            self._auctions[ticker] = now + book.auction_interval
+            self._schedule_auction(ticker, self._auctions[ticker])
+        else:
+            self._auctions.pop(ticker, None)
+            book.match_orders()
+
+        if self.snapshots is not None:
+            self.snapshots.mark(ticker, response_cache.version(('book',
+                                                                 ticker)))
+
+    def _schedule_auction(self, ticker, due):
+        """Notifies the matcher worker of a book when its call auction is due
+        (on the simulation clock, whose speed may change meanwhile)."""
+        wait = due - clock.monotonic()
+        if wait > 0:
+            timer = threading.Timer(clock.real_seconds(wait),
+                                    self._schedule_auction, (ticker, due))
+            timer.daemon = True
+            timer.start()
+        else:
+            self.matchers.notify(ticker)
+
+    def _enqueue_order(self, trader, ticker, side, size, price, market_order,
+                       received):
+        """Validates an order and submits it to the ingestion queue.
+
+        The existence of the trader and of the security is only checked on
+        the database the first time they are seen.
+        """
+        if side not in ('buy', 'sell') or not isinstance(size, int) or \
+                size < 1 or (price is None and not market_order) or \
+                (price is not None and price < 1):
+            return bad_request('Invalid order.')
+
+        for document, field, name in ((Trader, 'name', trader),
+                                      (OrderBook, 'ticker', ticker)):
+            if name not in self._known[document]:
+                if not document.objects(**{field: name}).only('id').first():
+                    return bad_request('The %s doesn\'t exist.' %
+                                       ('trader' if document is Trader else
+                                        'security'))
+                self._known[document].add(name)
+
+        order_id = ObjectId()
+        if not self.orders.submit(order_id, {
+                'trader': trader, 'ticker': ticker, 'side': side,
+                'size': size, 'price': price, 'market_order': market_order,
+                'received': received}):
+            admission_rejects.labels('queue').inc()
+            order_log.warning('Order refused: the order queue is full')
+            return bad_request('The order queue is full.',
+                               data={'code': 'queue_full'}, status=503)
+
+        return good_request({'id': str(order_id), 'status': 'queued'},
+                            status=202)
+
+    def _persist_order(self, order_id, order):
+        """Persists a queued order (see OrderQueue).
+
+        Returns:
+            None if the order was persisted, the reason of its rejection
+            otherwise.
+
+        """
+        trader = Trader.objects(name=order['trader']).first()
+        if trader is None:
+            return 'The trader doesn\'t exist.'
+
+        result = trader.send_order(order['ticker'], order['side'],
+                                   order['size'], price=order['price'],
+                                   market_order=order['market_order'],
+                                   received=order['received'],
+                                   order_id=order_id)
+        if result is None:
+            return 'The security doesn\'t exist.'
+
+        self.matchers.notify(order['ticker'])
+        return None
+
+    def _write_tick(self, ticker, fill):
+        """Publishes a fill on the tick ring, stamped with its (simulation)
+        time."""
+        self.tick_ring.write(ticker, fill.price, fill.size,
+                             time_ns=round(fill.time.timestamp() * 1e6) * 1000)
+
+    def _market_data(self, ticker):
+        """Builds the market data snapshot of a book.
+
+        Returns:
+            None if the security doesn't exist, the book (see
+            OrderBook.to_dict()) with only its SNAPSHOT_TRADES most recent
+            trades, its quote and its depth (see OrderBook.get_depth())
+            otherwise.
+
+        """
+        book = OrderBook.objects(ticker=ticker).fields(
+            ticker=1, auction_interval=1,
+            slice__price_history=-SNAPSHOT_TRADES).first()
+        if book is None:
+            return None
+
+        bid, ask = book.get_quote()
+        snapshot = book.to_dict()
+        snapshot['quote'] = {'bid': format_ticks(bid),
+                             'ask': format_ticks(ask)}
+        snapshot['depth'] = book.get_depth(SNAPSHOT_DEPTH)
+        snapshot['published'] = str(clock.now())
+        return snapshot
+
+    def _tickers(self):
+        """(list(str)) The tickers of the order books matched here."""
+        return [book['ticker'] for book in
+                OrderBook.objects.only('ticker').as_pymongo()
+                if self.owns is None or self.owns(book['ticker'])]
+
+    def _book_ids(self, tickers=None):
+        """Maps security codes to their OrderBook ids with a single query.
+
+        Keyword Args:
+            tickers (iterable(str), default=None): The security codes to be
+                mapped. If None all the registered securities will be mapped.
+
+        Returns:
+            dict: The OrderBook ids of the registered securities, keyed by
+                ticker (unregistered tickers are left out).
 
         """
-        log.info('Trying to send order (trader: %s, ticker: %s, side: %s, '
-                 'size: %s, price: %s, market_order: %s)', trader, ticker,
-                 side, size, price, market_order)
-        try:
-            trader = Trader.objects.get(name=trader)
-        except Exception:
-            log.warning('Failed while sending order: The trader doesn\'t '
-                        'exists')
-            return bad_request('The trader doesn\'t exist.')
+        books = OrderBook.objects.only('ticker').as_pymongo()
+        if tickers is not None:
+            books = books.filter(ticker__in=list(tickers))
 
-        result = trader.send_order(ticker, side, size, price=price,
-                                   market_order=market_order)
+        return {book['ticker']: book['_id'] for book in books}
 
-        if result is not None:
-            log.info('Order successfully sent.')
-            return good_request(result.to_dict())
+    def _backfill_names(self):
+        """Fills the trader names and tickers that documents written by older
+        versions lack.
 
-        log.warning('Failed while sending order: The order was refused')
-        return bad_request('The order was refused.')
+        The orders, the fills and the positions store the names and the
+        tickers they refer to (see Order, Fill and Position). The missing
+        ones are copied from the referenced traders and order books with one
+        update per referenced document, and the tickers of the fills from
+        their orders, so running it on an up to date database costs only the
+        queries that find nothing to update.
 
-    def edit_positions(self, positions):
-        """Edits the portfolio positions of multiple traders.
+        Returns:
+            int: The number of updated documents.
 
-        Example:
-            {'John Doe': {'TTLB03': 334, 'JJBE32': 700, 'KKTB38': 1020},
-             'Bruce Wayne': {'TTLB03': 339823, 'LLCR33': 9000000}}
+        """
+        names = {trader['_id']: trader['name'] for trader in
+                 Trader.objects.only('name').as_pymongo()}
+        tickers = {book: ticker for ticker, book in self._book_ids().items()}
+
+        updated = 0
+        for document, reference, field, values in (
+                (Order, 'trader', 'trader_name', names),
+                (Order, 'order_book', 'ticker', tickers),
+                (Position, 'trader', 'trader_name', names),
+                (Position, 'order_book', 'ticker', tickers),
+                (Fill, 'seller', 'seller_name', names),
+                (Fill, 'buyer', 'buyer_name', names)):
+            collection = document._get_collection()
+            missing = {field: {'$exists': False}}
+            for target in collection.distinct(reference, missing):
+                if target in values:
+                    updated += collection.update_many(
+                        dict(missing, **{reference: target}),
+                        {'$set': {field: values[target]}}).modified_count
+
+        # The ticker of a fill is the one of its order (backfilled above)
+        fills = Fill._get_collection()
+        missing = {'ticker': {'$exists': False}}
+        orders = fills.distinct('order', missing)
+        for start in range(0, len(orders), BULK_BATCH_SIZE):
+            by_ticker = {}
+            for order in Order.objects(
+                    id__in=orders[start:start + BULK_BATCH_SIZE]).only(
+                        'ticker').as_pymongo():
+                by_ticker.setdefault(order['ticker'], []).append(order['_id'])
+
+            for ticker, ids in by_ticker.items():
+                updated += fills.update_many(
+                    dict(missing, order={'$in': ids}),
+                    {'$set': {'ticker': ticker}}).modified_count
+
+        if updated:
+            log.info('Backfilled the names and tickers of %d documents',
+                     updated)
+        return updated
+
+    def _load_resting_orders(self):
+        """Loads the active orders of the books matched by this exchange on
+        the resting order store, by arrival (see OrderBook.get_top_bid()).
 
-        Args:
-            position (dict): A dict containing all the trader positions to be
-                edited.
+        Returns:
+            int: The number of loaded orders.
 
         """
-        log.info('Editing positions:\n%s', str(positions))
-        if positions is None or not isinstance(positions, dict):
-            log.warning('Failed while editing positions: wrong argument')
-            return bad_request('Invalid request.')
-
-        # Checking whether all keys on the dict are registered traders
-        try:
-            for trader in positions.keys():
-                Trader.objects.get(name=trader)
-                for ticker in positions[trader].keys():
-                    OrderBook.objects.get(ticker=ticker)
-        except Exception:
-            log.warning('Failed while editing positions: One of the traders or'
-                        ' ticker is not registered.')
-            return bad_request('One of the traders or ticker is not '
-                               'registered.')
+        loaded = 0
+        for order in Order.objects(canceled=False, filled=False).only(
+                'trader_name', 'ticker', 'order_type', 'current_size',
+                'price', 'market_order', 'time').order_by(
+                    'time', 'id').as_pymongo():
+            if self.owns is not None and not self.owns(order['ticker']):
+                continue
 
-        for trader in positions.keys():
-                Trader.objects.get(name=trader).update_portfolio(
-                    positions[trader])
+            try:
+                # Stored with its remaining size as the original one
+                resting_orders.add(
+                    order['trader_name'], order['ticker'],
+                    'buy' if order['order_type'] == 'Bid' else 'sell',
+                    order['current_size'], price=order.get('price'),
+                    market_order=order.get('market_order', False),
+                    time_ns=round(order['time'].timestamp() * 1e6) * 1000,
+                    ref=order['_id'].binary)
+                loaded += 1
+            except ValueError:
+                order_log.warning('Skipping the invalid resting order %s',
+                                  order['_id'])
+
+        log.info('Loaded %d resting orders', loaded)
+        return loaded
+
+    def _bulk_load(self, records):
+        """Registers securities and traders in bulk.
+
+        The records are consumed as a stream: the uniqueness of tickers and
+        names is checked in memory and the new documents are inserted in
+        batches of BULK_BATCH_SIZE. Invalid records are logged and skipped.
 
-        log.info('Successfully edited all positions.')
-        return good_request('Positions updated successfully.')
+        Args:
+            records (iterable(tuple)): The ('ticker', <ticker>) and ('trader',
+                <trader>) records to be loaded, where each trader is a dict
+                with a name and, optionally, a wallet and a portfolio (see
+                StockExchange.register_trader()).
 
-    def get_price_history(self, ticker):
-        """Retrieves a security price history.
+        Returns:
+            dict: The number of loaded securities and traders and the number of
+                skipped records.
 
-        Args:
-            ticker (str): The security code.
+        """
+        books = self._book_ids()
+        names = {trader['name'] for trader in
+                 Trader.objects.only('name').as_pymongo()}
+
+        new_books = []
+        new_traders = []
+        totals = {'tickers': 0, 'traders': 0, 'skipped': 0}
+
+        def flush_books():
+            totals['tickers'] += bulk_insert(OrderBook, new_books)
+            new_books.clear()
+
+        def flush_traders():
+            flush_books()
+            self._insert_traders(new_traders, books)
+            totals['traders'] += len(new_traders)
+            new_traders.clear()
+
+        for kind, item in records:
+            if kind == 'ticker':
+                if not isinstance(item, str) or not 0 < len(item) <= 50 or \
+                        item in books:
+                    log.warning('Skipping invalid or repeated ticker %r', item)
+                    totals['skipped'] += 1
+                    continue
+
+                books[item] = ObjectId()
+                new_books += [{'_id': books[item], 'ticker': item,
+                               'price_history': []}]
+                if len(new_books) == BULK_BATCH_SIZE:
+                    flush_books()
 
+            else:
+                name = item.get('name')
+                wallet = item.get('wallet')
+                portfolio = item.get('portfolio')
+                if not isinstance(name, str) or name in names or \
+                        not self._valid_account(wallet, portfolio, books):
+                    log.warning('Skipping invalid or repeated trader %r', name)
+                    totals['skipped'] += 1
+                    continue
+
+                names.add(name)
+                new_traders += [(name, wallet, portfolio)]
+                if len(new_traders) == BULK_BATCH_SIZE:
+                    flush_traders()
+
+        flush_traders()
+        log.info('Loaded %(tickers)d securities and %(traders)d traders '
+                 '(%(skipped)d records skipped)', totals)
+        return totals
+
+    def _valid_account(self, wallet, portfolio, books):
+        """(bool) Checks whether a new trader's wallet and portfolio are valid.
         """
         try:
-            book = OrderBook.objects.get(ticker=ticker)
-        except Exception:
-            return bad_request('The security code doesn\'t exist')
-
-        return good_request([datum.to_dict() for datum in
-                             book.price_history])
+            if wallet is not None and to_ticks(wallet) < 0:
+                return False
 
-    def yaml_load(self, path):
-        """Loads the database with the configurations defined on a yaml file.
+            if portfolio is not None:
+                return all(ticker in books and int(shares) >= 0
+                           for ticker, shares in portfolio.items())
 
-        Below is and examplo of yaml file with a valid configuration.
+        except (TypeError, ValueError, AttributeError, InvalidOperation):
+            return False
 
-        Example:
-            traders:
-                - name: 'John Doe'
-                  wallet: 30000
-                  portfolio:
-                    BBVA03: 4300
-                    LLCA13: 33421000
-                    RRTV99: 3939300
+        return True
 
-                - name: 'Jane Gin'
-                  wallet: 40000
+    def _insert_traders(self, traders, books):
+        """Bulk inserts new traders and their positions.
 
-            tickers:
-                - BBVA03
-                - LLCA13
-                - RRTV99
-                - KKLE64
-                - ASDF12
+        Callers are responsible for ensuring that the names are unique and
+        that every ticker of the given portfolios is registered.
 
         Args:
-            path (str): The path of the yaml file.
+            traders (list(tuple)): The (name, wallet, portfolio) of each new
+                trader. A None wallet or portfolio is replaced by a random one
+                (see StockExchange.register_trader()).
+            books (dict): The OrderBook ids keyed by ticker. Random portfolios
+                contain one position for each one of these books.
 
-        """
-        log.info('Loading configurations from the file %s', path)
-        with open(path) as f:
-            configs = yaml.safe_load(f)
+        Raises:
+            ValueError: If a wallet is negative or any value can't be
+                converted.
 
-        if 'tickers' in configs:
-            for ticker in configs['tickers']:
-                self.register_security(ticker)
+        """
+        tickers = list(books)
+        wallets, shares = random_accounts(len(traders), len(tickers))
+
+        trader_records = []
+        position_records = []
+        for i, (name, wallet, portfolio) in enumerate(traders):
+            if wallet is None:
+                wallet = int(wallets[i]) * PRICE_SCALE
+            else:
+                wallet = to_ticks(wallet)
+                if wallet < 0:
+                    raise ValueError('Negative wallet')
 
-        if 'traders' in configs:
-            for trader in configs['traders']:
-                wallet = None
-                if 'wallet' in trader:
-                    wallet = Decimal(trader['wallet'])
+            if portfolio is None:
+                portfolio = zip(tickers, shares[i].tolist())
+            else:
+                portfolio = portfolio.items()
+
+            trader_id = ObjectId()
+            position_ids = []
+            for ticker, amount in portfolio:
+                position_ids += [ObjectId()]
+                position_records += [{'_id': position_ids[-1],
+                                      'trader': trader_id,
+                                      'trader_name': name,
+                                      'order_book': books[ticker],
+                                      'ticker': ticker,
+                                      'shares': int(amount)}]
+
+            trader_records += [{'_id': trader_id,
+                                'name': name,
+                                'wallet': wallet,
+                                'wallet_history': [],
+                                'portfolio': position_ids,
+                                'orders': []}]
+
+        bulk_insert(Trader, trader_records)
+        bulk_insert(Position, position_records)
+        leaderboard.invalidate()
+
+    def _random_trader_names(self, count, size=6):
+        """Generates unregistered random trader names.
+
+        The generated names will have the form Trader-<characters>.
 
-                self.register_trader(
-                    **{'name': trader['name'],
-                       'wallet': wallet,
-                       'portfolio': trader.get('portfolio', None)})
+        Args:
+            count (int): The number of names to be generated.
 
-    def get_book(self, ticker):
-        """Retrieves a security OrderBook information.
+        Keyword Args:
+            size (int, default=6): the number of characters used on each name.
 
-        Args:
-            ticker (str): The security code.
+        Returns:
+            list(str): the random names.
 
         """
-        try:
-            book = OrderBook.objects.get(ticker=ticker)
-            return good_request(book.to_dict())
-        except Exception:
-            return bad_request('The ticker doesn\'t exists.')
+        names = set()
+        while len(names) < count:
+            candidates = {'Trader-' + ''.join(
+                random.choices(string.ascii_uppercase + string.digits,
+                               k=size)) for _ in range(count - len(names))}
+            candidates -= {trader.name for trader in Trader.objects(
+                name__in=list(candidates)).only('name')}
+            names |= candidates
 
-    def run(self):
-        """The thread responsible for continuously matching the top orders."""
-        while True:
-            for book in OrderBook.objects:
-                book.try_match()
+        return list(names)
 
     def _random_ticker(self, num_letters=4, num_digits=2):
         """Generates a random security code (ticker).
@@ -502,8 +2170,12 @@ class Fill(Document):
             this fill.
         buyer (Trader): The trader that bought the securities and generated
             this fill.
+        seller_name (str): The name of the seller (stored along with the
+            reference, so the fill is serialized without dereferencing it).
+        buyer_name (str): The name of the buyer.
+        ticker (str): The security code of the order book.
         size (int): The size of the fill.
-        price (Decimal): The price of the fill.
+        price (int): The price of the fill (in ticks).
         time (datetime): The time in which the fill was created.
 
     .. _Fill definition on Investopedia:
@@ -513,25 +2185,29 @@ class Fill(Document):
     order = ReferenceField('Order', required=True)
     seller = ReferenceField('Trader', required=True)
     buyer = ReferenceField('Trader', required=True)
+    seller_name = StringField(required=True)
+    buyer_name = StringField(required=True)
+    ticker = StringField(required=True)
     size = IntField(min_value=1, required=True)
-    price = DecimalField(min_value=0, precision=2, required=True)
-    time = DateTimeField(default=datetime.now(), required=True)
+    price = IntField(min_value=0, required=True)
+    time = DateTimeField(default=current_time, required=True)
 
     def to_dict(self):
         """Converts the object to a dict."""
         # Warning: don't overwrite the __iter__ method otherwise it will
         # interfere with the mongoengine.
         return {
-            'order': str(self.order.id),
-            'seller': str(self.seller.name),
-            'buyer': str(self.buyer.name),
+            'order': str(reference_id(self, 'order')),
+            'seller': str(self.seller_name),
+            'buyer': str(self.buyer_name),
             'size': str(self.size),
-            'price': str(self.price),
+            'price': format_ticks(self.price),
             'time': str(self.time)}
 
     def __repr__(self):
         return 'Fill(seller=%s, buyer=%s, size=%s, price=%s)' % \
-            (self.seller.name, self.buyer.name, self.size, self.price)
+            (self.seller_name, self.buyer_name, self.size,
+             format_ticks(self.price))
 
 
 class Position(Document):
@@ -544,6 +2220,10 @@ class Position(Document):
         trader (Trader): The trader who owns the position.
         order_book (OrderBook): The order book of the security which this
             position represents.
+        trader_name (str): The name of the trader (stored along with the
+            reference, so the position is serialized without dereferencing
+            it).
+        ticker (str): The security code of the order book.
         shares (int): The size of the position.
 
     .. _Position definition on Investopedia:
@@ -552,55 +2232,71 @@ class Position(Document):
     """
     trader = ReferenceField('Trader', required=True)
     order_book = ReferenceField('OrderBook', required=True)
+    trader_name = StringField(required=True)
+    ticker = StringField(required=True)
     shares = IntField(default=0, required=True)
 
+    meta = {'indexes': [{'fields': ('trader', 'order_book'), 'unique': True}]}
+
     @property
     def value(self):
-        """(Decimal) The position value virtual attribute getter."""
-        mkt_p = self.order_book.get_market_price()
-        if mkt_p is not None:
-            return Decimal(self.shares * mkt_p)
+        """(int) The position value (in ticks) virtual attribute getter."""
+        return self.shares * self.order_book.get_market_price()
 
-        return Decimal('0.00')
+    def to_dict(self, market_price=None):
+        """Converts the object to a dict.
 
-    def to_dict(self):
-        """Converts the object to a dict."""
+        Keyword Args:
+            market_price (int, default=None): The market price (in ticks) of
+                the security (see positions_to_dicts()). If None it is loaded
+                from the order book.
+
+        """
         # Warning: don't overwrite the __iter__ method otherwise it will
         # interfere with the mongoengine.
+        value = self.value if market_price is None else \
+            self.shares * market_price
         return {
-            'trader': str(self.trader.name),
-            'ticker': str(self.order_book.ticker),
+            'trader': str(self.trader_name),
+            'ticker': str(self.ticker),
             'shares': str(self.shares),
-            'value': str(self.value)}
+            'value': format_ticks(value)}
 
     def __repr__(self):
         return 'Position(trader=%s, ticker=%s, shares=%s)' % \
-            (self.trader.name, self.order_book.ticker, self.shares)
+            (self.trader_name, self.ticker, self.shares)
 
 
 class ValueDatum(EmbeddedDocument):
-    """Represents a generic time series Decimal datum via the Mongoengine ORM.
+    """Represents a generic time series money datum via the Mongoengine ORM.
 
     Attributes:
-        value (Decimal): The datum value.
+        value (int): The datum value (in ticks).
+        amount (int): The traded amount (price history only).
         time (datetime): The datum time.
+        bid (int): The best Bid limit price (in ticks) right after the datum
+            was generated (price history only).
+        ask (int): The best Ask limit price (in ticks) right after the datum
+            was generated (price history only).
 
     """
-    value = DecimalField(min_value=0, precision=2, required=True)
+    value = IntField(min_value=0, required=True)
     amount = IntField(min_value=0)
     time = DateTimeField(required=True)
+    bid = IntField(min_value=0)
+    ask = IntField(min_value=0)
 
     def to_dict(self):
         """Converts the object to a dict."""
         # Warning: don't overwrite the __iter__ method otherwise it will
         # interfere with the mongoengine.
         return {
-            'value': str(self.value),
+            'value': format_ticks(self.value),
             'time': str(self.time),
             'amount': str(self.amount)}
 
     def __repr__(self):
-        return '[' + str(self.time) + '] ' + str(self.value)
+        return '[' + str(self.time) + '] ' + format_ticks(self.value)
 
 
 class Trader(Document):
@@ -612,7 +2308,7 @@ class Trader(Document):
 
     Attributes:
         name (str): The name of the trader.
-        wallet (Decimal): The amount of money that the trader has.
+        wallet (int): The amount of money (in ticks) that the trader has.
         wallet_history (list(ValueDatum)): The history of the trader's wallet.
         portfolio (Portfolio): The trader's portfolio.
         orders (list(Order)): A list with all the orders sent by the trader.
@@ -623,8 +2319,7 @@ class Trader(Document):
     """
     name = StringField(max_length=50, unique=True, required=True)
 
-    wallet = DecimalField(default=0,
-                          min_value=0.00, precision=2, required=True)
+    wallet = IntField(default=0, min_value=0, required=True)
 
     wallet_history = ListField(EmbeddedDocumentField('ValueDatum'))
 
@@ -634,12 +2329,13 @@ class Trader(Document):
 
     def update_wallet_history(self):
         """Updates the wallet_history time series."""
-        self.wallet_history += [ValueDatum(time=datetime.now(),
+        self.wallet_history += [ValueDatum(time=clock.now(),
                                            value=self.wallet)]
         self.save()
+        response_cache.invalidate(('trader', self.name))
 
     def send_order(self, ticker, side, size, price=None,
-                   market_order=False):
+                   market_order=False, received=None, order_id=None):
         """Sends an order on behalf of the trader.
 
         Args:
@@ -649,22 +2345,34 @@ class Trader(Document):
             size (int): The size of the order.
 
         Keyword Args:
-            price (Decimal, default=None): The price of the order. May be left
-                as None just in the case of a `at market price` order.
+            price (int, default=None): The price of the order (in ticks). May
+                be left as None just in the case of a `at market price` order.
             market_order (bool, default=False): Whether the order is a `at
                 market price` order.
+            received (int, default=None): The time (see OrderTracer.now())
+                when the server received the order.
+            order_id (ObjectId, default=None): The id assigned to the order.
+                If None a new one is generated.
 
         Returns:
-            None if the security doesn't exist, the sent order otherwise.
+            None if the order is invalid or the security doesn't exist, the
+            sent order otherwise.
 
         """
-        log.info('Sending order:\nTrader: %s, Ticker: %s, Side: %s, '
-                 'Size: %s, Price: %s, Market_order: %s', self.name, ticker,
-                 side, size, price, market_order)
+        order_log.info('Sending order:\nTrader: %s, Ticker: %s, Side: %s, '
+                       'Size: %s, Price: %s, Market_order: %s', self.name,
+                       ticker, side, size, price, market_order)
+        if not isinstance(size, int) or size < 1 or \
+                (price is None and not market_order) or \
+                (price is not None and price < 1):
+            order_log.warning('Order rejected! Invalid size or price.')
+            return None
+
         try:
             book = OrderBook.objects.get(ticker=ticker)
         except Exception:
-            log.warning('Order %s rejected!', repr(order))
+            order_log.warning('Order rejected! The security %s doesn\'t '
+                              'exist.', ticker)
             return None
 
         if side == 'buy':
@@ -672,57 +2380,108 @@ class Trader(Document):
         else:
             order_type = 'Ask'
 
-        order = Order(trader=self,
-                      order_book=book,
-                      original_size=size,
-                      current_size=size,
-                      price=price,
-                      market_order=market_order,
-                      order_type=order_type)
-
-        order.save()
-
-        self.orders += [order]
-        self.save()
-
-        log.info('Order sent! (%s)', repr(order))
+        with book_locks.hold(ticker):
+            order = Order(id=order_id,
+                          trader=self,
+                          trader_name=self.name,
+                          order_book=book,
+                          ticker=ticker,
+                          original_size=size,
+                          current_size=size,
+                          price=price,
+                          market_order=market_order,
+                          order_type=order_type)
+
+            order.save()
+            order._slot = resting_orders.add(
+                self.name, ticker, 'buy' if order_type == 'Bid' else 'sell',
+                size, price=price, market_order=market_order,
+                ref=order.id.binary)
+
+            # Pushing (instead of saving the whole list) so concurrent orders
+            # of the same trader on other books aren't lost
+            Trader.objects(id=self.id).update_one(push__orders=order)
+
+        order_tracer.start(order.id, received=received)
+        response_cache.invalidate(('trader', self.name), ('book', ticker))
+
+        order_log.info('Order sent! (%r)', order)
 
         return order
 
     def update_wallet(self, delta):
-        """Adds a value to the trader's wallet.
+        """Atomically adds a value to the trader's wallet.
+
+        The wallet is updated (and its new value appended to the wallet
+        history) with a compare-and-swap, which is retried with the reloaded
+        wallet until no concurrent update happens in between, so updates made
+        by fills settled on other books are never lost. The trader object
+        itself isn't changed.
 
         Args:
-            delta (Decimal): The amount of money to be added to the trader's
-                wallet.
+            delta (int): The amount of money (in ticks) to be added to the
+                trader's wallet.
+
+        Returns:
+            None if the wallet would become negative, the new wallet (int)
+            otherwise.
 
         """
-        self.wallet += delta
-        self.save()
-        self.update_wallet_history()
+        wallet = self.wallet
+        while True:
+            new_wallet = wallet + delta
+            if new_wallet < 0:
+                return None
+
+            if Trader.objects(id=self.id, wallet=wallet).update_one(
+                    set__wallet=new_wallet,
+                    push__wallet_history=ValueDatum(time=clock.now(),
+                                                    value=new_wallet)):
+                break
+
+            wallet = Trader.objects(id=self.id).only('wallet').first().wallet
+
+        response_cache.invalidate(('trader', self.name))
+        return new_wallet
 
     def get_portfolio_value(self):
-        """(Decimal) Gets the current value of the trader's portfolio."""
-        t_value = Decimal('0.00')
+        """(int) Gets the current value (in ticks) of the trader's portfolio.
+        """
+        positions = self.portfolio
+        prices = market_prices({position.ticker for position in positions})
 
-        for position in self.portfolio:
-            t_value += Decimal(position.shares) * \
-                position.order_book.get_market_price()
+        return sum(position.shares * prices[position.ticker] for position in
+                   positions)
 
-        return t_value
+    def to_dict(self, orders=None, fields=TRADER_FIELDS):
+        """Converts the object to a dict.
 
-    def to_dict(self):
-        """Converts the object to a dict."""
+        Keyword Args:
+            orders (list(Order), default=None): The orders to be included. If
+                None all the trader's orders will be included.
+            fields (list(str), default=TRADER_FIELDS): The fields to be
+                included (besides the name).
+
+        """
         # Warning: don't overwrite the __iter__ method otherwise it will
         # interfere with the mongoengine.
-        return {
-            'name': self.name,
-            'wallet': str(self.wallet),
-            'wallet_history': [datum.to_dict() for datum in
-                               self.wallet_history],
-            'portfolio': [position.to_dict() for position in self.portfolio],
-            'portfolio_value': str(self.get_portfolio_value()),
-            'orders': [order.to_dict() for order in self.orders]}
+        result = {'name': self.name}
+        if 'wallet' in fields:
+            result['wallet'] = format_ticks(self.wallet)
+        if 'wallet_history' in fields:
+            result['wallet_history'] = [datum.to_dict() for datum in
+                                        self.wallet_history]
+        if 'portfolio' in fields:
+            result['portfolio'] = positions_to_dicts(self.portfolio)
+        if 'portfolio_value' in fields:
+            result['portfolio_value'] = format_ticks(
+                self.get_portfolio_value())
+        if 'orders' in fields:
+            if orders is None:
+                orders = self.orders
+            result['orders'] = orders_to_dicts(orders)
+
+        return result
 
     def update_portfolio(self, new_positions):
         """Updates the trader's positions.
@@ -734,27 +2493,24 @@ class Trader(Document):
         """
         for key, value in new_positions.items():
             book = OrderBook.objects.get(ticker=key)
-            try:
-                position = Position.objects.get(order_book=book, trader=self)
-                position.shares = int(value)
-            except Exception:
-                position = Position(order_book=book, trader=self,
-                                    shares=int(value))
+            position = Position.objects(order_book=book, trader=self).modify(
+                upsert=True, new=True, set__shares=int(value),
+                set_on_insert__trader_name=self.name,
+                set_on_insert__ticker=key)
 
-            position.save()
+            Trader.objects(id=self.id).update_one(
+                add_to_set__portfolio=position)
 
-            if position not in self.portfolio:
-                self.portfolio += [position]
-
-            self.save()
+        response_cache.invalidate(('trader', self.name))
+        leaderboard.invalidate()
 
     def __repr__(self):
         return 'Trader(name=%s, wallet=%s)' % (str(self.name),
-                                               str(self.wallet))
+                                               format_ticks(self.wallet))
 
     def __str__(self):
         return 'Trader:\n\tName: %s\n\tWallet: %s\n\tPortfolio: \n\t\t%s' % \
-               (self.name, self.wallet,
+               (self.name, format_ticks(self.wallet),
                 '\n\t\t'.join([repr(position) for position in self.portfolio]))
 
 
@@ -767,18 +2523,23 @@ class Order(Document):
         trader (Trader): The trader who sent the order.
         order_book (OrderBook): The order book into which this order was
             placed.
+        trader_name (str): The name of the trader (stored along with the
+            reference, so the order is serialized without dereferencing it).
+        ticker (str): The security code of the order book.
         original_size (int): The size of the order at it's creation.
         current_size (int): The current size of the order, which is defined by
             the order's original size minus the total size of all this order's
             partial fills.
         time (datetime): The time in which the order was sent.
-        price (Decimal): The order's price.
+        price (int): The order's price (in ticks).
         market_order (bool): Whether the order should be executed at the
             current market price or at a fixed price.
         canceled (bool): Whether an order was cancelled.
         filled (bool): Whether an order was already fully filled.
         fills (list(Fill)): The list of fills associated with this order.
         order_type (str): Whether this order is a Bid (buy) or an Ask (sell).
+        seq (int): The sequence number of the order's last update (see
+            next_sequence()).
 
 
     .. _Order definition on Investopedia:
@@ -787,17 +2548,70 @@ class Order(Document):
     """
     trader = ReferenceField('Trader', required=True)
     order_book = ReferenceField('OrderBook', required=True)
+    trader_name = StringField(required=True)
+    ticker = StringField(required=True)
     original_size = IntField(min_value=1, required=True)
     current_size = IntField(required=True)
-    time = DateTimeField(default=datetime.now(), required=True)
-    price = DecimalField(min_value=0.01, precision=2)
+    time = DateTimeField(default=current_time, required=True)
+    price = IntField(min_value=1)
     market_order = BooleanField(default=False, required=True)
     canceled = BooleanField(default=False, required=True)
     filled = BooleanField(default=False, required=True)
     fills = ListField(ReferenceField('Fill'))
     order_type = StringField(choices=('Bid', 'Ask'), required=True)
+    seq = LongField()
+
+    meta = {'indexes': [('trader', 'seq')]}
+
+    # The slot of the order on the resting order store, when it was loaded
+    # from it (see OrderBook.get_top_bid())
+    _slot = None
+
+    @property
+    def status(self):
+        """(str) The order status ('active', 'filled' or 'canceled')."""
+        if self.canceled:
+            return 'canceled'
+
+        return 'filled' if self.filled else 'active'
+
+    def save(self, *args, **kwargs):
+        """Saves the order, stamping it with a new sequence number."""
+        self.seq = next_sequence()
+        return super(Order, self).save(*args, **kwargs)
+
+    def cancel(self):
+        """Cancels the order.
 
-    def match(self, order, market_price=None):
+        The cached responses of the order's book and trader are invalidated,
+        which also makes the exchange republish the book's market data
+        snapshot after the matching pass.
+        """
+        self.canceled = True
+        self.save()
+        self._update_resting()
+        response_cache.invalidate(('book', self.ticker),
+                                  ('trader', self.trader_name))
+
+    def _update_resting(self, size=None):
+        """Updates the order on the resting order store, if it was loaded
+        from it: a canceled or filled order is removed, otherwise its size is
+        reduced by a fill of `size`."""
+        if self._slot is None:
+            return
+
+        try:
+            if self.canceled or self.filled:
+                resting_orders.remove(self._slot, ref=self.id.binary)
+                self._slot = None
+            else:
+                resting_orders.fill(self._slot, size, ref=self.id.binary)
+        except KeyError:
+            # The store was cleared meanwhile (see clean_history())
+            self._slot = None
+
+    def match(self, order, market_price=None, fill_price=None,
+              fill_size=None):
         """Tries to match two orders with each other.
 
         Every time the order book recieve a new order it will try to match the
@@ -819,40 +2633,48 @@ class Order(Document):
             order (Order): the order with wich this order will attempt a match.
 
         Keyword Args:
-            market_price (Decimal, default=None): If both orders are `at market
-                price` orders this method will use this parameter as the fill
-                price.
+            market_price (int, default=None): If both orders are `at market
+                price` orders this method will use this parameter (in ticks)
+                as the fill price.
+            fill_price (int, default=None): If set, the price (in ticks) of
+                the fill, such as the clearing price of an auction.
+            fill_size (int, default=None): If set, the maximum size of the
+                fill, such as the allocation of an auction.
 
         Returns:
             False if it isn't possible to match both orders, the generated fill
             object otherwise.
 
         """
-        log.info('Matching orders %s and %s.', repr(self), repr(order))
+        match_log.info('Matching orders %r and %r.', self, order)
         # Were any of the orders cancelled or filled?
         if self.canceled or self.filled or order.canceled or order.filled:
-            log.info('Orders %s and %s not matched (one of them is'
-                     ' canceled).', repr(self), repr(order))
+            match_log.info('Orders %r and %r not matched (one of them is'
+                           ' canceled).', self, order)
+            _match_rejects['inactive'].inc()
             return False
 
         # Are both orders on the same book?
-        if self.order_book != order.order_book:
-            log.info('Orders %s and %s not matched (they are in separate'
-                     ' books).', repr(self), repr(order))
+        book_id = reference_id(self, 'order_book')
+        if book_id != reference_id(order, 'order_book'):
+            match_log.info('Orders %r and %r not matched (they are in separate'
+                           ' books).', self, order)
+            _match_rejects['different_books'].inc()
             return False
 
         # Are both orders on oposite sides?
         if self.order_type == order.order_type:
-            log.info('Orders %s and %s not matched (they have the same '
-                     ' order type).', repr(self), repr(order))
+            match_log.info('Orders %r and %r not matched (they have the same '
+                           ' order type).', self, order)
+            _match_rejects['same_side'].inc()
             return False
 
         if self.order_type == 'Bid':
             bid_order = self
             ask_order = order
         else:
-            bid_order = self
-            ask_order = order
+            bid_order = order
+            ask_order = self
 
         ask_price = ask_order.price
         bid_price = bid_order.price
@@ -860,20 +2682,18 @@ class Order(Document):
         # Are both order prices compatible?
         if (not self.market_order) and (not order.market_order) \
            and bid_price < ask_price:
-            log.info('Orders %s and %s not matched (they have different '
-                     ' prices).', repr(self), repr(order))
+            match_log.info('Orders %r and %r not matched (they have different '
+                           ' prices).', self, order)
+            _match_rejects['price_mismatch'].inc()
             return False
 
         fill_amount = min(self.current_size, order.current_size)
+        if fill_size is not None:
+            fill_amount = min(fill_amount, fill_size)
 
-        if self.order_type == 'Ask':
-            buyer = order.trader
-            seller = self.trader
-        else:
-            seller = order.trader
-            buyer = self.trader
-
-        if not ask_order.market_order:
+        if fill_price is not None:
+            price = fill_price
+        elif not ask_order.market_order:
             price = ask_price
         elif not bid_order.market_order:
             price = bid_price
@@ -881,50 +2701,69 @@ class Order(Document):
             price = market_price
         else:
             # Can't determine the price of the fill
-            log.info('Orders %s and %s not matched (can\'t determine the '
-                     ' price of the fill).', repr(self), repr(order))
+            match_log.info('Orders %r and %r not matched (can\'t determine '
+                           'the price of the fill).', self, order)
+            _match_rejects['no_price'].inc()
             return False
 
-        # Can the buyer pay for the fill?
-        if buyer.wallet < fill_amount * price:
-            # Canceling the order
-            if self.trader == buyer:
-                self.canceled = True
-            else:
-                order.canceled = True
-
-            log.info('Orders %s and %s not matched (the buyer does\'t have '
-                     ' enough money).', repr(self), repr(order))
+        # The orders cross: the rest is their settlement
+        order_tracer.stamp('matched', self.id, order.id)
+        settlement_start = time.perf_counter()
+
+        # The settlement is made of atomic conditional updates (no wallet or
+        # position may become negative), so fills settled concurrently on
+        # other books are never lost. The buyer is debited first and refunded
+        # if the seller doesn't have the securities. Only the ids, the names
+        # and the wallets of the traders are read.
+        buyer_id = reference_id(bid_order, 'trader')
+        seller_id = reference_id(ask_order, 'trader')
+        buyer = Trader.objects(id=buyer_id).only('name', 'wallet').first()
+
+        total = fill_amount * price
+        if buyer.update_wallet(-total) is None:
+            bid_order.cancel()
+
+            match_log.info('Orders %r and %r not matched (the buyer does\'t '
+                           'have enough money).', self, order)
+            _match_rejects['insufficient_funds'].inc()
             return False
 
         # Does the seller has the stocks?
-        try:
-            seller_position = Position.objects.get(trader=seller,
-                                                   order_book=self.order_book)
-            if seller_position.shares < fill_amount:
-                # Canceling the order
-                if self.trader == seller:
-                    self.canceled = True
-                else:
-                    order.canceled = True
+        if not Position.objects(trader=seller_id, order_book=book_id,
+                                shares__gte=fill_amount) \
+                .update_one(dec__shares=fill_amount):
+            buyer.update_wallet(total)
 
-                log.info('Orders %s and %s not matched (the seller doesn\'t'
-                         ' have the securities).', repr(self), repr(order))
+            ask_order.cancel()
 
-                return False
-        except Exception:
-            log.info('Orders %s and %s not matched (the seller doesn\'t'
-                     ' have the securities).', repr(self), repr(order))
+            match_log.info('Orders %r and %r not matched (the seller '
+                           'doesn\'t have the securities).', self, order)
+            _match_rejects['insufficient_shares'].inc()
             return False
 
+        buyer_position = Position.objects(
+            trader=buyer_id, order_book=book_id).modify(
+            upsert=True, new=True, inc__shares=fill_amount,
+            set_on_insert__trader_name=bid_order.trader_name,
+            set_on_insert__ticker=self.ticker)
+        Trader.objects(id=buyer_id).update_one(
+            add_to_set__portfolio=buyer_position)
+
+        Trader.objects(id=seller_id).only('name', 'wallet').first() \
+            .update_wallet(total)
+
         self.current_size -= fill_amount
         order.current_size -= fill_amount
 
         # Creating the fill
-        fill = Fill(order=self, seller=seller, buyer=buyer, size=fill_amount,
-                    price=price, time=datetime.now())
+        fill = Fill(order=self, seller=seller_id, buyer=buyer_id,
+                    seller_name=ask_order.trader_name,
+                    buyer_name=bid_order.trader_name, ticker=self.ticker,
+                    size=fill_amount,
+                    price=price, time=clock.now())
 
         fill.save()
+        order_tracer.stamp('settled', self.id, order.id)
 
         # Updating the orders
         self.fills += [fill]
@@ -939,57 +2778,46 @@ class Order(Document):
         self.save()
         order.save()
 
-        # Updating the traders positions
-        seller_position.shares -= fill_amount
-        try:
-            buyer_position = Position.objects.get(trader=buyer,
-                                                  order_book=self.order_book)
-        except Exception:
-            buyer_position = Position(trader=buyer, order_book=self.order_book)
-
-        buyer_position.shares += fill_amount
-
-        seller_position.save()
-        buyer_position.save()
-
-        ask_order.trader.wallet += fill_amount * price
-        bid_order.trader.wallet -= fill_amount * price
+        self._update_resting(fill_amount)
+        order._update_resting(fill_amount)
 
-        ask_order.trader.save()
-        bid_order.trader.save()
+        settlement_seconds.observe(time.perf_counter() - settlement_start)
+        match_log.info('Orders %r and %r matched (fill: %r).', self, order,
+                       fill)
 
-        ask_order.trader.update_wallet_history()
-        bid_order.trader.update_wallet_history()
-
-        log.info('Orders %s and %s matched (fill: %s).', repr(self),
-                 repr(order), repr(fill))
+        return fill
 
-        log.info('PRICE UPDATE: %s %s.', self.order_book.ticker, fill.price)
+    def to_dict(self, fills=None):
+        """Converts the object to a dict.
 
-        return fill
+        Keyword Args:
+            fills (list(Fill), default=None): The fills of the order, already
+                loaded (see orders_to_dicts()). If None they are dereferenced.
 
-    def to_dict(self):
-        """Converts the object to a dict."""
+        """
         # Warning: don't overwrite the __iter__ method otherwise it will
         # interfere with the mongoengine.
+        if fills is None:
+            fills = self.fills
         return {
-            'trader': str(self.trader.name),
-            'ticker': str(self.order_book.ticker),
+            'id': str(self.id),
+            'trader': str(self.trader_name),
+            'ticker': str(self.ticker),
             'original_size': str(self.original_size),
             'current_size': str(self.current_size),
             'time': str(self.time),
-            'price': str(self.price),
+            'price': format_ticks(self.price),
             'market_order': str(self.market_order),
             'canceled': str(self.canceled),
             'filled': str(self.filled),
-            'fills': [fill.to_dict() for fill in self.fills],
+            'fills': [fill.to_dict() for fill in fills],
             'order_type': str(self.order_type)}
 
     def __repr__(self):
         return 'Order(trader=%s, ticker=%s, current_size=%s, price=%s, ' \
                'market_order=%s, order_type=%s)' % \
-               (self.trader.name, self.order_book.ticker, self.current_size,
-                self.price, self.market_order, self.order_type)
+               (self.trader_name, self.ticker, self.current_size,
+                format_ticks(self.price), self.market_order, self.order_type)
 
 
 class OrderBook(Document):
@@ -1006,6 +2834,9 @@ class OrderBook(Document):
         ticker (str): The security symbol.
         price_history (list(ValueDatum)): The price time series of the security
             being traded on this order book.
+        auction_interval (float): The interval (in seconds) between the call
+            auctions of the book, or None if its orders are matched
+            continuously.
 
 
     .. _Order book definition on Investopedia:
@@ -1014,6 +2845,39 @@ class OrderBook(Document):
     """
     ticker = StringField(max_length=50, unique=True)
     price_history = ListField(EmbeddedDocumentField(ValueDatum))
+    auction_interval = FloatField(min_value=0)
+
+    # The length of the stored price history of a book loaded with only its
+    # last entry (see OrderBook.for_matching())
+    _history_size = None
+
+    @classmethod
+    def for_matching(cls, ticker):
+        """Loads an order book to be matched.
+
+        Only the last entry of the price history (the market price) is loaded,
+        along with the length of the stored history, so the fills are
+        appended to it without reading or rewriting the whole history (see
+        OrderBook._record_fill()).
+
+        Args:
+            ticker (str): The security code.
+
+        Returns:
+            None if the security doesn't exist, its OrderBook otherwise.
+
+        """
+        for document in cls.objects(ticker=ticker).aggregate([
+                {'$project': {
+                    'ticker': 1, 'auction_interval': 1,
+                    'price_history': {'$slice': ['$price_history', -1]},
+                    'history_size': {'$size': '$price_history'}}}]):
+            history_size = document.pop('history_size')
+            book = cls._from_son(document)
+            book._history_size = history_size
+            return book
+
+        return None
 
     def try_match(self):
         """Tries to match the two top Ask and Bid orders.
@@ -1024,23 +2888,186 @@ class OrderBook(Document):
         Note:
             In the future, this method will be a callback of the save() method.
 
+        Returns:
+            None if no fill was generated, the generated fill otherwise.
+
+        """
+        start = time.perf_counter()
+        with book_locks.hold(self.ticker):
+            fill, _ = self._try_match()
+
+        try_match_seconds.observe(time.perf_counter() - start)
+        return fill
+
+    def match_orders(self):
+        """Matches the top orders until the book isn't crossed anymore.
+
+        A match rejected because one of the top orders was canceled (see
+        Order.match()) doesn't end the matching, since the orders behind it
+        may still cross.
+
+        Returns:
+            int: The number of generated fills.
+
+        """
+        generated = 0
+        while True:
+            start = time.perf_counter()
+            with book_locks.hold(self.ticker):
+                fill, canceled = self._try_match()
+
+            try_match_seconds.observe(time.perf_counter() - start)
+            if fill:
+                generated += 1
+            elif not canceled:
+                return generated
+
+    def _try_match(self):
+        """Tries to match the two top orders while holding the book lock.
+
+        Returns:
+            tuple: The generated fill (or None) and whether a rejected match
+                canceled one of the top orders.
+
         """
-        log.info('Trying to mach orders on the book %s.', repr(self))
+        match_log.info('Trying to mach orders on the book %r.', self)
         top_bid = self.get_top_bid()
         top_ask = self.get_top_ask()
 
         if top_bid is not None and top_ask is not None:
+            order_tracer.stamp('considered', top_bid.id, top_ask.id)
             fill = top_bid.match(top_ask, market_price=self.get_market_price())
 
             if fill:
-                datum = ValueDatum(time=fill.time, value=fill.price,
-                                   amount=fill.size)
+                self._record_fill(fill)
+                return fill, False
+
+            return None, top_bid.canceled or top_ask.canceled
+        else:
+            match_log.info('Not enough orders to try a match on the book %r.',
+                           self)
+
+        return None, False
+
+    def run_auction(self):
+        """Clears a call auction with the active orders of the book.
+
+        The clearing price and the size executed by each order are computed
+        at once (see auction.clear_auction()), using the market price as the
+        reference price, and the orders are then settled in pairs at the
+        clearing price. A pair whose settlement fails (see Order.match()) is
+        skipped, so the executed volume may be smaller than the cleared one.
+
+        Returns:
+            list(Fill): The generated fills.
+
+        """
+        start = time.perf_counter()
+        with book_locks.hold(self.ticker):
+            generated = self._run_auction()
+
+        try_match_seconds.observe(time.perf_counter() - start)
+        auctions.inc()
+        return generated
+
+    def _run_auction(self):
+        """Clears a call auction while holding the book lock.
+
+        The active orders of each side are read from the resting order store
+        (by priority) and loaded from the database with one query.
+
+        """
+        sides = {}
+        for order_type, side in (('Bid', 'buy'), ('Ask', 'sell')):
+            slots = resting_orders.resting(self.ticker, side)
+            refs = [resting_orders.ref(int(slot)) for slot in slots]
+            orders = {order.id: order for order in Order.objects(
+                id__in=[ObjectId(ref) for ref in refs if ref is not None],
+                canceled=False, filled=False)}
+
+            sides[order_type] = []
+            for slot, ref in zip(slots, refs):
+                order = None if ref is None else orders.get(ObjectId(ref))
+                if order is not None:
+                    order._slot = int(slot)
+                    sides[order_type] += [order]
+                elif ref is not None:
+                    # No longer active on the database (see _top_order())
+                    try:
+                        resting_orders.remove(int(slot), ref=ref)
+                    except KeyError:
+                        pass
+
+        bids, asks = sides['Bid'], sides['Ask']
+        if not bids or not asks:
+            match_log.info('Not enough orders to run an auction on the book '
+                           '%r.', self)
+            return []
+
+        market_price = self.get_market_price()
+        price, volume, bid_fills, ask_fills = clear_auction(
+            [order.price or 0 for order in bids],
+            [order.current_size for order in bids],
+            [order.price or 0 for order in asks],
+            [order.current_size for order in asks],
+            bid_market=[order.market_order for order in bids],
+            ask_market=[order.market_order for order in asks],
+            reference_price=market_price or None)
+
+        match_log.info('AUCTION: %s cleared %s shares at %s.', self.ticker,
+                       volume, format_ticks(price))
+
+        generated = []
+        for bid_index, ask_index, size in zip(*pair_fills(bid_fills,
+                                                          ask_fills)):
+            bid_order, ask_order = bids[bid_index], asks[ask_index]
+            order_tracer.stamp('considered', bid_order.id, ask_order.id)
+            fill = bid_order.match(ask_order, fill_price=price,
+                                   fill_size=int(size))
+            if fill:
+                self._record_fill(fill)
+                generated += [fill]
+
+        return generated
+
+    def _record_fill(self, fill):
+        """Records a fill on the price history and publishes it.
 
-                self.price_history += [datum]
-                self.save()
+        The fill is pushed to the stored price history, which isn't read nor
+        rewritten.
+
+        """
+        bid, ask = self.get_quote()
+        datum = ValueDatum(time=fill.time, value=fill.price,
+                           amount=fill.size, bid=bid, ask=ask)
+
+        OrderBook.objects(id=self.id).update_one(push__price_history=datum)
+        if self._history_size is None:
+            sequence = len(self.price_history)
         else:
-            log.info('Not enough orders to try a match on the book %s.',
-                     repr(self))
+            sequence = self._history_size
+            self._history_size += 1
+        self.price_history.append(datum)
+
+        response_cache.invalidate(('book', self.ticker),
+                                  ('trader', fill.buyer_name),
+                                  ('trader', fill.seller_name))
+
+        market_analytics.record(
+            self.ticker, sequence, fill.time.timestamp(),
+            fill.price / PRICE_SCALE, fill.size,
+            bid=None if bid is None else bid / PRICE_SCALE,
+            ask=None if ask is None else ask / PRICE_SCALE)
+
+        leaderboard.record(self.ticker, fill.buyer_name, fill.seller_name,
+                           fill.size, fill.price, fill_id=fill.id)
+
+        for listener in fill_listeners:
+            listener(self.ticker, fill)
+
+        fills.inc()
+        match_log.info('PRICE UPDATE: %s %s.', self.ticker,
+                       format_ticks(fill.price))
 
     def get_top_bid(self, force_price=False):
         """Retrieves the top Bid order.
@@ -1050,7 +3077,11 @@ class OrderBook(Document):
             * Active (neither cancelled nor filled) order
             * `At market value` order
             * Highest price order
-            * First order
+            * First order (by arrival)
+
+        The order is looked up on the resting order store (see
+        resting_orders), which keeps the active orders of the books matched
+        by this process by priority, and then loaded from the database.
 
         Keyword Args:
             force_price (bool, defautl=False): If True, the order sorting
@@ -1060,33 +3091,8 @@ class OrderBook(Document):
             None if no valid Bid order was found, the top Bid order otherwise.
 
         """
-        log.debug('Searchig for top bid on the book %s.', repr(self))
-
-        log.debug('Searchig for top market price bid on the book %s.',
-                  repr(self))
-        try:
-            if force_price:
-                raise Exception
-
-            return Order.objects(
-                order_book=self, order_type='Bid', canceled=False,
-                filled=False, market_order=True).order_by('time',
-                                                          '-current_size')[0]
-
-        except Exception:
-            pass
-
-        log.debug('Searchig for top bid with price on the book %s.',
-                  repr(self))
-
-        try:
-            return Order.objects(
-                order_book=self, order_type='Bid', canceled=False,
-                filled=False).order_by('-price', 'time', '-current_size')[0]
-
-        except Exception:
-            log.debug('Couldn\'t fid top bid on the book %s.', repr(self))
-            return None
+        match_log.debug('Searchig for top bid on the book %r.', self)
+        return self._top_order('buy', force_price)
 
     def get_top_ask(self, force_price=False):
         """Retrieves the top Ask order.
@@ -1096,7 +3102,9 @@ class OrderBook(Document):
             * Active (neither cancelled nor filled) order
             * `At market value` order
             * Lowest price order
-            * First order
+            * First order (by arrival)
+
+        The order is looked up like the top Bid order (see get_top_bid()).
 
         Keyword Args:
             force_price (bool, defautl=False): If True, the order sorting
@@ -1106,25 +3114,91 @@ class OrderBook(Document):
             None if no valid Bid order was found, the top Ask order otherwise.
 
         """
-        try:
-            if force_price:
-                raise Exception
+        return self._top_order('sell', force_price)
 
-            return Order.objects(
-                order_book=self, order_type='Ask', canceled=False,
-                filled=False, market_order=True).order_by('time',
-                                                          '-current_size')[0]
+    def _top_order(self, side, force_price=False):
+        """Retrieves the top order of one side of the book from the resting
+        order store (see get_top_bid()).
 
-        except Exception:
-            try:
-                return Order.objects(
-                    order_book=self, order_type='Ask', canceled=False,
-                    filled=False).order_by('price', 'time',
-                                           '-current_size')[0]
+        An order that is no longer active on the database is dropped from the
+        store and the next one is tried.
 
-            except Exception:
+        """
+        while True:
+            slot = resting_orders.top(self.ticker, side,
+                                      limit_only=force_price)
+            if slot is None:
                 return None
 
+            ref = resting_orders.ref(slot)
+            order = Order.objects(id=ObjectId(ref)).first()
+            if order is not None and order.status == 'active':
+                order._slot = slot
+                return order
+
+            # Canceled through a document loaded from the database
+            match_log.debug('Dropping the inactive resting order %s.',
+                            ObjectId(ref))
+            try:
+                resting_orders.remove(slot, ref=ref)
+            except KeyError:
+                pass
+
+    def get_quote(self):
+        """Retrieves the best Bid and Ask limit prices.
+
+        `At market price` orders are ignored since they don't quote a price.
+
+        Returns:
+            tuple: The best Bid price and the best Ask price (each one is None
+                if there is no active limit order on its side).
+
+        """
+        quote = []
+        for order_type, ordering in (('Bid', '-price'), ('Ask', 'price')):
+            order = Order.objects(
+                order_book=self, order_type=order_type, canceled=False,
+                filled=False, market_order=False).only('price') \
+                .order_by(ordering).first()
+            quote += [None if order is None else order.price]
+
+        return tuple(quote)
+
+    def get_depth(self, levels=10):
+        """Retrieves the market depth of the book.
+
+        The active limit orders of each side are aggregated by price on the
+        database.
+
+        Keyword Args:
+            levels (int, default=10): The number of price levels of each side.
+
+        Returns:
+            dict: The best price levels of the Bid ('bids') and Ask ('asks')
+                sides, each one with its price, total size and number of
+                orders.
+
+        """
+        depth = {}
+        for side, order_type, direction in (('bids', 'Bid', -1),
+                                            ('asks', 'Ask', 1)):
+            depth[side] = [
+                {'price': format_ticks(level['_id']),
+                 'size': str(level['size']),
+                 'orders': str(level['orders'])}
+                for level in Order._get_collection().aggregate([
+                    {'$match': {'order_book': self.id,
+                                'order_type': order_type,
+                                'canceled': False, 'filled': False,
+                                'market_order': False}},
+                    {'$group': {'_id': '$price',
+                                'size': {'$sum': '$current_size'},
+                                'orders': {'$sum': 1}}},
+                    {'$sort': {'_id': direction}},
+                    {'$limit': levels}])]
+
+        return depth
+
     def get_market_price(self):
         """Determines the current market price.
 
@@ -1132,25 +3206,35 @@ class OrderBook(Document):
         generated on this order book.
 
         Returns:
-            None if no fill was yet generated, the current maket price
-            (Decimal) otherwise.
+            int: The current market price (in ticks), which is 0 if no fill
+                was yet generated.
 
         """
         if len(self.price_history) > 0:
             return self.price_history[-1].value
         else:
-            return Decimal('0.00')
+            return 0
 
-    def to_dict(self):
-        """Converts the object to a dict."""
+    def to_dict(self, price_history=None):
+        """Converts the object to a dict.
+
+        Keyword Args:
+            price_history (list(ValueDatum), default=None): The price history
+                entries to be included. If None the whole price history will be
+                included.
+
+        """
         # Warning: don't overwrite the __iter__ method otherwise it will
         # interfere with the mongoengine.
+        if price_history is None:
+            price_history = self.price_history
 
         # TODO add market depth info
         result = {
             'ticker': self.ticker,
-            'market_price': str(self.get_market_price()),
-            'price_history': [datum.to_dict() for datum in self.price_history]}
+            'market_price': format_ticks(self.get_market_price()),
+            'auction_interval': str(self.auction_interval),
+            'price_history': [datum.to_dict() for datum in price_history]}
 
         top_ask = self.get_top_ask()
         if top_ask is not None:
@@ -28,6 +28,7 @@ import random
 import string
 import threading
 import time
+import urllib.parse
 import urllib.request
 
 import pandas as pd
@@ -88,6 +89,15 @@ class RobotTrader(threading.Thread):
 
         self.name = self._random_name() if name is None else name
 
+        # Incremental status (see update_status())
+        self.wallet_history = []
+        self.orders = {}
+        self._cursor = {'wallet_history': 0, 'orders': 0}
+
+        # The simulated seconds per real second of the exchange's clock (see
+        # update_clock())
+        self.clock_speed = 1.0
+
         self.register(wallet=wallet, portfolio=portfolio)
 
     def register(self, wallet=None, portfolio=None):
@@ -113,16 +123,49 @@ class RobotTrader(threading.Thread):
 
     def get_current_status(self):
         """Retrieves all information about the trading robot."""
-        result = self._get('trader_status/' + self.name)
+        result = self._get('trader_status/' + urllib.parse.quote(self.name))
         return self._parse_response(result, 'Error while retrieving %s trader'
                                             ' data.' % (self.name))
 
     def update_status(self):
-        """Retrieves and updates all information about the trading robot."""
-        result = self.get_current_status()
+        """Retrieves and updates all information about the trading robot.
+
+        Only the wallet history entries and the orders that changed since the
+        last update are downloaded, and the portfolio value (which the robot
+        doesn't use) isn't requested.
+
+        """
+        response = self._get('trader_status/%s?wallet_since=%d&orders_since=%d'
+                             '&fields=wallet,portfolio,wallet_history,orders'
+                             % (urllib.parse.quote(self.name),
+                                self._cursor['wallet_history'],
+                                self._cursor['orders']))
+        result = self._parse_response(response, 'Error while retrieving %s '
+                                                'trader data.' % (self.name))
+        self._cursor = response['cursor']
         self.wallet = Decimal(result['wallet'])
         self.portfolio = result['portfolio']
-        self.wallet_history = result['wallet_history']
+        self.wallet_history += result['wallet_history']
+        self.orders.update({order['id']: order for order in result['orders']})
+
+    def update_clock(self):
+        """Retrieves the speed of the Stock Exchange's simulation clock, by
+        which the robot's pauses are scaled (see sleep())."""
+        result = self._get('clock')
+        result = self._parse_response(result, 'Error while retrieving the '
+                                              'clock (trader=%s)' %
+                                              (self.name))
+        self.clock_speed = float(result['speed'])
+        return result
+
+    def sleep(self, seconds):
+        """Pauses the robot for an interval of the exchange's clock.
+
+        Args:
+            seconds (float): The interval, in simulated seconds.
+
+        """
+        time.sleep(seconds / self.clock_speed)
 
     def send_order(self, ticker, side, size, price=None, market_order=False):
         """Sends an order.
@@ -198,6 +241,7 @@ class RobotTrader(threading.Thread):
     def _random_strategy(self):
         """A purely random strategy with a random order price."""
         while True:
+            self.update_clock()
             self.update_status()
             self.send_order(ticker=random.choice(self.get_all_tickers()),
                             side=random.choice(['buy', 'sell']),
@@ -205,18 +249,19 @@ class RobotTrader(threading.Thread):
                             price=random.uniform(0.01, int(self.wallet) / 100),
                             # market_order=random.choice([True, False]))
                             market_order=False)
-            time.sleep(random.uniform(1, 10))
+            self.sleep(random.uniform(1, 10))
 
     def _random_strategy_market(self):
         """A purely `at market price` random strategy."""
         while True:
+            self.update_clock()
             self.update_status()
             self.send_order(ticker=random.choice(self.get_all_tickers()),
                             side=random.choice(['buy', 'sell']),
                             size=100,
                             # market_order=random.choice([True, False]))
                             market_order=True)
-            time.sleep(random.uniform(1, 20))
+            self.sleep(random.uniform(1, 20))
 
     def _get(self, uri):
         """Executes a GET request to the Stock Exchange address.